@@ -20,4 +20,9 @@ MAIN_FILE_LOGGING = False  # Enable if wanting all modules to write to a single
 MAIN_FILE_NAME = "complete.log"    # Had to enable 'sync_all_file_types' to get .log files to copy over in pymakr
 MAIN_FILE_OW = "w"    # Open with 'w' to start a new log file. Can change to 'a' to keep older logs.
 MAIN_FILE_MODE = "a"  # Should be either a or ab append mode (ab for binary)
+LOG_BUFSIZE = 512     # Bytes of log records to collect in RAM before writing to flash in one go. 0 = write every record (slow)
+LOG_BINARY = False    # Write compact binary records instead of text. Decode on the PC with host/logdecode.py
+LOG_MAXBYTES = 0      # Rotate a log file once it reaches this many bytes (file -> file.1 -> file.2 ...). 0 = no rotation
+LOG_BACKUPS = 2       # Number of rotated files to keep per log file
+LOG_TOTALBYTES = 0    # Flash budget shared by all log files and their backups. Oldest backups deleted first. 0 = no budget
 logfiles = []         # Keep track of log files to monitor size and close them if too big
\ No newline at end of file
@@ -0,0 +1,129 @@
+''' espADC.getdata cost: the old list based sampling vs the array block with integer oversampling.
+
+    python3 adcbench.py [calls]           # PC, simulated ADC (noisy 12 bit reads)
+    import adcbench; adcbench.main()       # Board: copy this file to /lib, real ADC on pins 32-35
+
+4 channels. Samples/s counts ADC reads per second of getdata time. On the PC the reads cost almost nothing,
+so it shows the Python overhead around them. On the board the ADC read itself is part of it.
+Allocations per getdata: on the board gc.mem_alloc, the bytes one call allocates. On the PC tracemalloc,
+the peak of the Python heap above its level before the call (CPython object sizes, only comparable
+between the rows).
+'''
+
+try:
+    import upycompat            # On the PC
+    import random, sys, tracemalloc, types
+
+    class _ADC:
+        ATTN_11DB = 3
+
+        def __init__(self, pin):
+            self.level = 400 * (pin - 30)          # Pins 32-35: 800-2000 raw
+
+        def atten(self, a):
+            pass
+
+        def read(self):
+            return self.level + random.getrandbits(5)
+
+    machine = types.ModuleType('machine')
+    machine.Pin, machine.ADC = lambda pin: pin, _ADC
+    sys.modules.setdefault('machine', machine)
+    SIMULATED = True
+except ImportError:
+    SIMULATED = False           # On the board
+import gc, utime
+from machine import Pin, ADC
+from adc import espADC
+
+PINS = [32, 33, 34, 35]
+
+class LegacyADC:
+    # lib/adc.py espADC before the array block (3 samples in nested lists, float mean and _valmap per channel)
+    def __init__(self, pinlist, vref=3.3, noiseThreshold=35, maxInterval=1000):
+        self.vref = vref
+        self.numOfChannels = len(pinlist)
+        self.chan = []
+        for i, pin in enumerate(pinlist):
+            self.chan.append(ADC(Pin(pin)))
+            self.chan[i].atten(ADC.ATTN_11DB)
+        self.noiseThreshold = noiseThreshold
+        self.numOfSamples = 3
+        self.sensorAve = [x for x in range(self.numOfChannels)]
+        self.sensorLastRead = [x for x in range(self.numOfChannels)]
+        for x in range(self.numOfChannels):
+            self.sensorLastRead[x] = self.chan[x].read()
+        self.voltage = {}
+        self.sensor = [[x for x in range(0, self.numOfSamples)] for x in range(0, self.numOfChannels)]
+        self.maxInterval = maxInterval
+        self.time0 = utime.ticks_ms()
+
+    def _valmap(self, value, istart, istop, ostart, ostop):
+        return ostart + (ostop - ostart) * ((value - istart) / (istop - istart))
+
+    def getdata(self):
+        sensorChanged = False
+        timelimit = False
+        if utime.ticks_diff(utime.ticks_ms(), self.time0) > self.maxInterval:
+            timelimit = True
+        for x in range(self.numOfChannels):
+            for i in range(self.numOfSamples):
+                self.sensor[x][i] = self.chan[x].read()
+            self.sensorAve[x] = sum(self.sensor[x])/len(self.sensor[x])
+            if abs(self.sensorAve[x] - self.sensorLastRead[x]) > self.noiseThreshold:
+                sensorChanged = True
+            self.sensorLastRead[x] = self.sensorAve[x]
+            self.voltage['a' + str(x) + 'f'] = self._valmap(self.sensorAve[x], 0, 4095, 0, self.vref)
+        if sensorChanged or timelimit:
+            self.time0 = utime.ticks_ms()
+            return self.voltage
+
+def bench(adc, n):
+    adc.getdata()
+    t0 = utime.ticks_us()
+    for i in range(n):
+        adc.getdata()
+    us = utime.ticks_diff(utime.ticks_us(), t0) / n
+    alloc = None
+    if hasattr(gc, 'mem_alloc'):
+        gc.collect()
+        gc.disable()
+        a0 = gc.mem_alloc()
+        for i in range(10):
+            adc.getdata()
+        alloc = (gc.mem_alloc() - a0) / 10
+        gc.enable()
+    elif SIMULATED:
+        tracemalloc.start()
+        alloc = 0
+        for i in range(10):
+            tracemalloc.reset_peak()
+            a0 = tracemalloc.get_traced_memory()[0]
+            adc.getdata()
+            alloc = max(alloc, tracemalloc.get_traced_memory()[1] - a0)
+        tracemalloc.stop()
+    return us, alloc
+
+def check():
+    # Same voltages from both (the simulated ADC holds a level, the mean of its noise is 15.5 raw)
+    old, new = LegacyADC(PINS), espADC(PINS, oversample=64)
+    old.getdata()
+    new.getdata()
+    for key in old.voltage:
+        assert abs(old.voltage[key] - new.voltage[key]) < 20 * 3.3 / 4095, (key, old.voltage, new.voltage)
+
+def main(n=2000):
+    if SIMULATED:
+        check()
+    print('4 channels, {0} getdata calls'.format(n))
+    for label, adc in (('old, 3 samples', LegacyADC(PINS)),
+                       ('array, 3 samples', espADC(PINS, oversample=3)),
+                       ('array, 16 samples', espADC(PINS, oversample=16)),
+                       ('array, 64 samples', espADC(PINS, oversample=64))):
+        us, alloc = bench(adc, n)
+        print('{0:<18} {1:8.1f} us/getdata {2:9.0f} samples/s {3:>4} B alloc/getdata'.format(
+            label, us, len(PINS) * adc.numOfSamples * 1000000 / us, 'n/a' if alloc is None else '{0:.0f}'.format(alloc)))
+
+if __name__ == "__main__":
+    import sys
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,156 @@
+''' espADC payload bytes per hour: all channels on any change (delta=False) vs per-channel delta payloads,
+replaying one hour of a synthetic 4-channel trace on a simulated clock. Runs on CPython.
+
+    python3 adcdeltabench.py
+
+getdata every 100 ms, oversample 4, no filters, maxInterval 60 s unless a config sets per-channel values.
+  a0f  noisy pin, level holds at 2000 raw, noise sigma 25 raw (crosses threshold 35 now and then)
+  a1f  slow drift 1000 -> 1400 raw over the hour, sigma 5
+  a2f  jumps by 100-800 raw every 5 min, sigma 5
+  a3f  level holds at 3000 raw, sigma 5
+Bytes are payload bytes (no MQTT header) with ujson.dumps, payload.SchemaJSON and payload.SchemaStruct.
+Check: a consumer merging the delta payloads has every a2f jump within one getdata. queued() also sends
+them through pubqueue.PublishQueue (coalesce, 500 ms send window): after every flush the merged payloads
+have to match the merged getdata results, even though espADC reuses the dict it returns.
+'''
+
+import upycompat
+import random, sys, types, ujson, utime
+
+GETDATA_MS = 100
+HOUR = 3600000 // GETDATA_MS
+PINS = [32, 33, 34, 35]
+SIGMA = {32: 25, 33: 5, 34: 5, 35: 5}
+
+
+class _ADC:
+    ATTN_11DB = 3
+
+    def __init__(self, pin):
+        self.pin = pin
+
+    def atten(self, a):
+        pass
+
+    def read(self):
+        v = int(_levels[self.pin] + _rnd.gauss(0, SIGMA[self.pin]))
+        return 0 if v < 0 else 4095 if v > 4095 else v
+
+
+_levels = {}
+_rnd = random.Random()
+_now = [0]
+machine = types.ModuleType('machine')
+machine.Pin, machine.ADC = lambda pin: pin, _ADC
+sys.modules.setdefault('machine', machine)
+utime.ticks_ms = lambda: _now[0]
+
+from adc import espADC
+from payload import SchemaJSON, SchemaStruct
+from pubqueue import PublishQueue
+
+KEYS = ['a0f', 'a1f', 'a2f', 'a3f']
+
+CONFIGS = (
+    ('all channels (current)', {}),
+    ('delta', {'delta': True}),
+    ('delta, snapshot 5 min', {'delta': True, 'snapshot': 300000}),
+    ('delta, a0f threshold 90', {'delta': True, 'noiseThreshold': [90, 35, 35, 35]}),
+    ('delta, per-channel tuned', {'delta': True, 'snapshot': 300000, 'noiseThreshold': [90, 35, 35, 35],
+                                  'maxInterval': [60000, 10000, 300000, 300000]}),
+)
+
+
+def trace(seed=1):
+    rnd = random.Random(seed)
+    out, steps = [], []
+    a2 = 2000
+    for k in range(HOUR):
+        if k and k % 3000 == 0:
+            jump = rnd.randint(100, 800) * rnd.choice((1, -1))
+            if not 300 < a2 + jump < 3800:
+                jump = -jump
+            steps.append((k, a2 + jump))
+            a2 += jump
+        out.append({32: 2000, 33: 1000 + 400 * k // HOUR, 34: a2, 35: 3000})
+    return out, steps
+
+
+def replay(levels, steps, kw):
+    _rnd.seed(2)
+    _levels.update(levels[0])
+    _now[0] = 0
+    args = {'noiseThreshold': 35, 'maxInterval': 60000}
+    args.update(kw)
+    adc = espADC(PINS, oversample=4, **args)
+    encoders = (ujson.dumps, SchemaJSON(KEYS), SchemaStruct(KEYS, 1))
+    nbytes = [0] * len(encoders)
+    msgs = 0
+    merged = {}
+    late = 0
+    stepat = dict(steps)
+    pending = None
+    for k, level in enumerate(levels):
+        _now[0] = k * GETDATA_MS
+        _levels.update(level)
+        if k in stepat:
+            pending = (k, stepat[k])
+        out = adc.getdata()
+        if out is not None:
+            msgs += 1
+            for i, enc in enumerate(encoders):
+                nbytes[i] += len(enc(out))
+            merged.update(out)
+        if pending is not None and k > pending[0]:
+            if abs(merged['a2f'] * 4095 / 3.3 - pending[1]) > 30:
+                late += 1
+            pending = None
+    return msgs, nbytes, late
+
+
+class _Client:
+    def __init__(self):
+        self.sent = []
+
+    def publish(self, topic, payload):
+        self.sent.append((topic, payload))
+
+
+def queued(levels, window=5):
+    _rnd.seed(2)
+    _levels.update(levels[0])
+    _now[0] = 0
+    adc = espADC(PINS, oversample=4, noiseThreshold=35, maxInterval=60000, delta=True)
+    client = _Client()
+    queue = PublishQueue(client, ujson.dumps, coalesce=True)
+    expected, merged = {}, {}
+    for k, level in enumerate(levels):
+        _now[0] = k * GETDATA_MS
+        _levels.update(level)
+        out = adc.getdata()
+        if out is not None:
+            expected.update(out)
+            queue.put(b'esp2nred/adc', out)
+        if k % window == window - 1:
+            queue.flush()
+            for topic, payload in client.sent:
+                merged.update(ujson.loads(payload))
+            client.sent.clear()
+            assert merged == expected, (k, merged, expected)
+    return queue.puts, queue.packets
+
+
+def main():
+    levels, steps = trace()
+    puts, packets = queued(levels)
+    print('delta through PublishQueue: {0} puts, {1} packets, merged payloads match ok'.format(puts, packets))
+    print('one hour, 4 channels, {0} jumps on a2f'.format(len(steps)))
+    print('{0:<26} {1:>6} {2:>9} {3:>9} {4:>9}'.format('', 'msgs/h', 'ujson B', 'schema B', 'struct B'))
+    for label, kw in CONFIGS:
+        msgs, nbytes, late = replay(levels, steps, kw)
+        assert late == 0, (label, late)
+        print('{0:<26} {1:6d} {2:9d} {3:9d} {4:9d}'.format(label, msgs, *nbytes))
+
+
+if __name__ == "__main__":
+    main()
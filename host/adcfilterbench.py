@@ -0,0 +1,140 @@
+''' espADC publish volume and change latency with the adcfilter.py filters, replaying one hour of synthetic
+noisy traces on a simulated clock. Runs on CPython.
+
+    python3 adcfilterbench.py
+
+One channel, getdata every 100 ms (36000 per hour), oversample 4, maxInterval 60 s for every config.
+Each read is the trace level plus gaussian noise (sigma 25 raw, a noisy esp32 ADC pin).
+  quiet    level holds at 2000 raw
+  spikes   quiet plus a +400 raw spike on 0.2% of the getdata calls (a relay switching, a motor starting)
+  steps    the level jumps by 100-800 raw up or down every 5 min
+msgs/h counts getdata calls that returned data. Step latency is the time from a jump to the first report
+that is closer to the new level than to the old one (max 60 s from maxInterval).
+'''
+
+import upycompat
+import random, sys, types, utime
+
+GETDATA_MS = 100
+HOUR = 3600000 // GETDATA_MS
+OVERSAMPLE = 4
+SIGMA = 25
+
+
+class _ADC:
+    ATTN_11DB = 3
+
+    def __init__(self, pin):
+        pass
+
+    def atten(self, a):
+        pass
+
+    def read(self):
+        v = int(_level[0] + _rnd.gauss(0, SIGMA))
+        return 0 if v < 0 else 4095 if v > 4095 else v
+
+
+_level = [0]
+_rnd = random.Random()
+_now = [0]
+machine = types.ModuleType('machine')
+machine.Pin, machine.ADC = lambda pin: pin, _ADC
+sys.modules.setdefault('machine', machine)
+utime.ticks_ms = lambda: _now[0]
+
+from adc import espADC
+from adcfilter import EMA, Median, Deadband, Chain
+
+BAND = 40 * OVERSAMPLE                  # Deadband in sum units: 40 raw
+
+CONFIGS = (
+    ('raw, threshold 35 (old)', 35, lambda: None),
+    ('EMA(3), threshold 35', 35, lambda: EMA(3)),
+    ('Median(5), threshold 35', 35, lambda: Median(5)),
+    ('Deadband(40)', 0, lambda: Deadband(BAND)),
+    ('Deadband(80)', 0, lambda: Deadband(2 * BAND)),
+    ('EMA(2) + Deadband(40)', 0, lambda: Chain(EMA(2), Deadband(BAND))),
+    ('Median(5) + Deadband(40)', 0, lambda: Chain(Median(5), Deadband(BAND))),
+)
+
+
+def check():
+    # Filters against plain Python versions on random input
+    rnd = random.Random(3)
+    xs = [rnd.randint(0, 4095 * 16) for i in range(2000)]
+    for n in (1, 3, 5, 9):
+        med = Median(n)
+        for i, x in enumerate(xs):
+            win = sorted(xs[max(0, i - n + 1):i + 1])
+            assert med(x) == win[len(win) // 2], (n, i)
+    ema, y = EMA(3), xs[0]
+    for x in xs:
+        y = y + (x - y) / 8
+        assert abs(ema(x) - y) <= 8, (ema.acc >> 3, y)
+    band, out = Deadband(100), xs[0]
+    for x in xs[:50] + [5000 + rnd.randint(-100, 100) for i in range(500)]:
+        if abs(x - out) > 100:
+            out = x
+        assert band(x) == out
+    assert Chain(Median(3), Deadband(10))(7) == 7
+
+
+def trace(kind, seed=1):
+    # Level per getdata call and the step times
+    rnd = random.Random(seed)
+    levels, steps = [], []
+    level = 2000
+    for k in range(HOUR):
+        if kind == 'steps' and k and k % 3000 == 0:
+            jump = rnd.randint(100, 800) * rnd.choice((1, -1))
+            if not 300 < level + jump < 3800:
+                jump = -jump
+            steps.append((k, level, level + jump))
+            level += jump
+        spike = 400 if kind == 'spikes' and rnd.random() < 0.002 else 0
+        levels.append(level + spike)
+    return levels, steps
+
+
+def replay(levels, steps, threshold, make_filter):
+    _rnd.seed(2)
+    _now[0] = 0
+    _level[0] = levels[0]
+    f = make_filter()
+    adc = espADC([34], noiseThreshold=threshold, maxInterval=60000, oversample=OVERSAMPLE,
+                 filters=None if f is None else [f])
+    reports = []
+    for k, level in enumerate(levels):
+        _now[0] = k * GETDATA_MS
+        _level[0] = level
+        out = adc.getdata()
+        if out is not None:
+            reports.append((k, out['a0f'] * 4095 / 3.3))
+    lat = []
+    for k0, old, new in steps:
+        for k, v in reports:
+            if k >= k0 and abs(v - new) < abs(v - old):
+                lat.append((k - k0) * GETDATA_MS)
+                break
+    return len(reports), lat
+
+
+def main():
+    check()
+    traces = [(kind,) + trace(kind) for kind in ('quiet', 'spikes', 'steps')]
+    print('msgs/h per trace, step latency in ms (mean / max over {0} steps)'.format(len(traces[2][2])))
+    print('{0:<26} {1:>7} {2:>7} {3:>7}   {4}'.format('', 'quiet', 'spikes', 'steps', 'latency'))
+    for label, threshold, make_filter in CONFIGS:
+        row = []
+        for kind, levels, steps in traces:
+            n, lat = replay(levels, steps, threshold, make_filter)
+            row.append(n)
+        assert len(lat) == len(steps), label   # Every step reported (maxInterval at worst)
+        assert max(lat) < 60000, label          # ... and by the change check, not by waiting for maxInterval
+        print('{0:<26} {1:7d} {2:7d} {3:7d}   {4:.0f} / {5}'.format(label, row[0], row[1], row[2],
+                                                                   sum(lat) / len(lat), max(lat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+''' Command-to-servo latency under a burst of servo commands: one packet per check vs a bounded drain. Runs on CPython.
+
+    python3 drainbench.py [commands]
+
+fakebroker sends a burst of servoZCMD commands at once. The main.py loop is rebuilt with the real Scheduler:
+a 10 ms poll task applies the newest commanded duty to the "servo", a 400 ms check_msg task reads commands.
+  one/check   client.drain(1, None): one packet per 400 ms check, like wait_msg before the incremental parser
+  drain       client.drain(16, 3000) per check, and the poll task keeps draining while a backlog remains
+handled = ms from the broker sending a command to mqtt_on_message running for it
+settle  = ms from the last command being sent to the servo moving to it
+'''
+
+import upycompat
+import sys, time
+from fakebroker import FakeBroker
+from umqttsimple import MQTTClient
+from scheduler import Scheduler
+
+TOPIC = b'nred2esp/servoZCMD/0'
+
+def run(broker, n, max_pkts, budget_us, catchup):
+    sent, handled = [], [None] * n
+    state = {'cmd': None, 'duty': None, 'backlog': 0, 'applied': None}
+    def on_message(topic, msg):
+        k = int(msg)
+        handled[k] = time.monotonic()
+        state['cmd'] = k
+    client = MQTTClient(b'drainbench', '127.0.0.1', broker.port)
+    client.set_callback(on_message)
+    client.connect()
+    client.subscribe(b'nred2esp/+/+')
+
+    def checkmsgs():
+        processed, state['backlog'] = client.drain(max_pkts, budget_us)
+    def poll():
+        if catchup and state['backlog']:
+            checkmsgs()
+        if state['cmd'] is not None and state['cmd'] != state['duty']:
+            state['duty'] = state['cmd']                     # servo[servoID].duty(...)
+            if state['duty'] == n - 1:
+                state['applied'] = time.monotonic()
+
+    sched = Scheduler()
+    sched.add('poll', poll, 10, 0, priority=2)
+    sched.add('check_msg', checkmsgs, 400, 0, priority=1)
+    for k in range(n):
+        sent.append(time.monotonic())
+        broker.send(TOPIC, str(k).encode())
+    t0 = time.monotonic()
+    while state['applied'] is None and time.monotonic() - t0 < n:
+        sched.run_once()
+    client.disconnect()
+    lat = sorted((h - s) * 1000 for h, s in zip(handled, sent) if h is not None)
+    return lat, (state['applied'] - sent[-1]) * 1000 if state['applied'] else None, sched
+
+def main(n=100):
+    broker = FakeBroker().start()
+    print('burst of {0} servo commands, check_msg every 400 ms, poll every 10 ms'.format(n))
+    for label, max_pkts, budget_us, catchup in (('one/check', 1, None, False), ('drain', 16, 3000, True)):
+        lat, settle, sched = run(broker, n, max_pkts, budget_us, catchup)
+        p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))]
+        check = [t for t in sched.tasks if t.name == 'check_msg'][0]
+        print('{0:<10} handled {1:3d}  mean {2:7.0f} ms  p95 {3:7.0f} ms  max {4:7.0f} ms  settle {5:7.0f} ms  check_msg max {6:5d} us'.format(
+            label, len(lat), sum(lat) / len(lat), p(0.95), lat[-1], settle, check.runtime_max))
+    broker.shutdown()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -0,0 +1,171 @@
+''' Minimal MQTT 3.1.1 broker stand-in for host tests and benchmarks. Runs on CPython.
+Handles CONNECT, SUBSCRIBE (no wildcards beyond + and #), PUBLISH qos 0/1, PINGREQ and DISCONNECT.
+Runs its asyncio loop in a background thread so blocking clients (umqttsimple) can use it from the main thread.
+
+    broker = FakeBroker().start()
+    ... connect a client to ('127.0.0.1', broker.port) ...
+    broker.received        # [(time.monotonic(), topic, payload), ...] for every PUBLISH from a client
+    broker.send(b'nred2esp/servoZCMD/0', b'40')   # PUBLISH to every client subscribed to the topic
+    broker.stop()          # Drop every connection and stop listening (simulated outage). start() again to recover
+Subscriptions of clean_session=False clients are kept by client id across stop/start (sessions=False to forget them).
+Set connack_rc (ex: 3 server unavailable) to refuse connects and suback_fail to answer SUBSCRIBE with 0x80.
+'''
+
+import asyncio, struct, threading, time
+
+
+def topic_matches(pattern, topic):
+    p, t = pattern.split(b'/'), topic.split(b'/')
+    for i, level in enumerate(p):
+        if level == b'#':
+            return True
+        if i >= len(t) or (level != b'+' and level != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+def _remaining_length(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7f
+        n >>= 7
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(out)
+
+
+def publish_packet(topic, payload, qos=0, pid=0, retain=False, dup=False):
+    var = struct.pack('!H', len(topic)) + topic + (struct.pack('!H', pid) if qos else b'')
+    body = var + payload
+    return bytes([0x30 | dup << 3 | qos << 1 | retain]) + _remaining_length(len(body)) + body
+
+
+class FakeBroker:
+    def __init__(self, host='127.0.0.1', port=0, sessions=True, puback=True, pingresp=True):
+        self.host = host
+        self.port = port
+        self.sessions = {} if sessions else None # client id -> topic filters kept for clean_session=False clients
+        self.puback = puback                     # False: swallow PUBACKs to force qos 1 retransmits
+        self.pingresp = pingresp                 # False: ignore PINGREQ, like a half-open connection
+        self.pingreqs = 0
+        self.connack_rc = 0                      # CONNACK return code, not 0 refuses the connect
+        self.suback_fail = False                 # True: grant 0x80 (failure) to every SUBSCRIBE
+        self.received = []
+        self.connects = 0
+        self.subscriptions = {}                  # writer -> [topic filters]
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    # ---- thread side ----
+    def start(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._listen(), self._loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+
+    def shutdown(self):
+        if self._loop is not None:
+            self.stop()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def send(self, topic, payload, qos=0):
+        asyncio.run_coroutine_threadsafe(self._send(topic, payload, qos), self._loop).result()
+
+    def wait_for(self, n, timeout=5):
+        # Block until n PUBLISH packets have arrived from clients
+        t0 = time.monotonic()
+        while len(self.received) < n and time.monotonic() - t0 < timeout:
+            time.sleep(0.001)
+        return len(self.received) >= n
+
+    # ---- loop side ----
+    async def _listen(self):
+        self._server = await asyncio.start_server(self._client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]   # Keep the same port across stop/start
+
+    async def _close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for w in list(self.subscriptions):
+            w.close()
+        self.subscriptions.clear()
+
+    async def _send(self, topic, payload, qos):
+        pkt = publish_packet(topic, payload, qos, 1 if qos else 0)
+        for w, filters in list(self.subscriptions.items()):
+            if any(topic_matches(f, topic) for f in filters):
+                w.write(pkt)
+                await w.drain()
+
+    async def _client(self, reader, writer):
+        self.subscriptions[writer] = []
+        try:
+            while True:
+                hdr = await reader.readexactly(1)
+                n, shift = 0, 0
+                while True:
+                    b = (await reader.readexactly(1))[0]
+                    n |= (b & 0x7f) << shift
+                    shift += 7
+                    if not b & 0x80:
+                        break
+                body = await reader.readexactly(n)
+                op = hdr[0] & 0xf0
+                if op == 0x10:                                   # CONNECT
+                    self.connects += 1
+                    clean = body[7] & 0x02
+                    cid = body[12:12 + struct.unpack_from('!H', body, 10)[0]]
+                    present = 0
+                    if self.sessions is not None:
+                        if clean:
+                            self.sessions.pop(cid, None)
+                        else:
+                            present = int(cid in self.sessions)
+                            self.subscriptions[writer] = self.sessions.setdefault(cid, self.subscriptions[writer])
+                    if self.connack_rc:
+                        writer.write(bytes([0x20, 2, 0, self.connack_rc]))
+                        await writer.drain()
+                        break
+                    writer.write(bytes([0x20, 2, present, 0]))
+                elif op == 0x30:                                 # PUBLISH
+                    qos = (hdr[0] >> 1) & 3
+                    tlen = struct.unpack_from('!H', body)[0]
+                    topic = body[2:2 + tlen]
+                    i = 2 + tlen
+                    if qos:
+                        pid = struct.unpack_from('!H', body, i)[0]
+                        i += 2
+                        if self.puback:
+                            writer.write(bytes([0x40, 2]) + struct.pack('!H', pid))
+                    self.received.append((time.monotonic(), topic, body[i:]))
+                elif op == 0x80:                                 # SUBSCRIBE
+                    pid = body[:2]
+                    i, granted = 2, b''
+                    while i < len(body):
+                        tlen = struct.unpack_from('!H', body, i)[0]
+                        self.subscriptions[writer].append(body[i + 2:i + 2 + tlen])
+                        i += 2 + tlen + 1
+                        granted += b'\x80' if self.suback_fail else b'\x00'
+                    writer.write(bytes([0x90, 2 + len(granted)]) + pid + granted)
+                elif op == 0xc0:                                 # PINGREQ
+                    self.pingreqs += 1
+                    if self.pingresp:
+                        writer.write(b'\xd0\x00')
+                elif op == 0xe0:                                 # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.subscriptions.pop(writer, None)
+            writer.close()
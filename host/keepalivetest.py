@@ -0,0 +1,112 @@
+''' MQTTClient keepalive: PINGREQ only when the link is quiet, PINGRESP tracking and dead link detection
+against fakebroker. Runs on CPython.
+
+    python3 keepalivetest.py
+'''
+
+import upycompat
+import time
+from fakebroker import FakeBroker
+from umqttsimple import MQTTClient
+from mqttconn import MQTTConnection
+
+TOPIC = b'esp2nred/adc/esp'
+
+
+def client(broker, keepalive=1, grace=300):
+    c = MQTTClient(b'keepalive', '127.0.0.1', broker.port, keepalive=keepalive, ping_grace_ms=grace)
+    c.set_callback(lambda topic, msg: None)
+    return c
+
+
+def loop(c, seconds, publish_ms=None):
+    # 10 ms main loop, optionally publishing every publish_ms
+    t0 = time.monotonic()
+    tpub = t0
+    while time.monotonic() - t0 < seconds:
+        c.check_msg()
+        if publish_ms is not None and (time.monotonic() - tpub) * 1000 >= publish_ms:
+            tpub = time.monotonic()
+            c.publish(TOPIC, b'1')
+        time.sleep(0.01)
+
+
+def idle_link_pings(broker):
+    c = client(broker)
+    c.connect()
+    loop(c, 2.2)                            # keepalive 1 s: a ping every 500 ms of silence
+    assert 3 <= c.pings <= 5, c.pings
+    assert broker.pingreqs == c.pings
+    c.disconnect()
+
+
+def no_ping_without_keepalive(broker):
+    c = client(broker, keepalive=0)
+    c.connect()
+    loop(c, 1.0)
+    assert c.pings == 0
+    c.disconnect()
+
+
+def publishing_still_pings(broker):
+    # Sending all the time but never hearing back: still pings, so a half-open link can't hide
+    c = client(broker)
+    c.connect()
+    loop(c, 1.2, publish_ms=50)
+    assert c.pings >= 2, c.pings
+    c.disconnect()
+
+
+def chatty_link_does_not_ping(broker):
+    # Traffic both ways (qos 1 publish + PUBACK) inside every keepalive/2: no PINGREQ needed
+    c = client(broker)
+    c.connect()
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 1.5:
+        c.publish(TOPIC, b'1', qos=1)
+        c.check_msg()
+        time.sleep(0.05)
+    assert c.pings == 0, c.pings
+    c.disconnect()
+
+
+def half_open_detected(broker):
+    broker.pingresp = False
+    c = client(broker, grace=300)
+    c.connect()
+    t0 = time.monotonic()
+    try:
+        loop(c, 3.0)
+        assert 0, "OSError expected"
+    except OSError as e:
+        assert e.args[0] == 110
+    elapsed = (time.monotonic() - t0) * 1000
+    assert 700 <= elapsed <= 1200, elapsed  # keepalive/2 idle + grace
+    broker.pingresp = True
+
+
+def connection_recovers(broker):
+    broker.pingresp = False
+    c = client(broker, grace=300)
+    conn = MQTTConnection(c, [b'nred2esp/+/+'], backoff_ms=100)
+    assert conn.connect()
+    t0 = time.monotonic()
+    while conn.outages == 0 and time.monotonic() - t0 < 3:
+        conn.check_msg()
+        time.sleep(0.01)
+    assert conn.outages == 1 and not conn.connected
+    broker.pingresp = True
+    while not conn.connected and time.monotonic() - t0 < 5:
+        conn.check_msg()
+        time.sleep(0.01)
+    assert conn.connected
+    conn.disconnect()
+
+
+broker = FakeBroker().start()
+for test in (idle_link_pings, no_ping_without_keepalive, publishing_still_pings, chatty_link_does_not_ping,
+             half_open_detected, connection_recovers):
+    broker.pingreqs = 0
+    test(broker)
+    print(test.__name__, 'ok')
+broker.shutdown()
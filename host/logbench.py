@@ -0,0 +1,120 @@
+''' Bytes/record of the ulogging text log vs LOG_BINARY records for the records main.py and lib/ actually write,
+and a round-trip check of every binary record through logdecode.py against the text log. Runs on CPython.
+
+    python3 logbench.py
+
+startup   the one-off INFO records of a boot (mostly messages already formatted with .format())
+runtime   the records repeated while running at DEBUG: received commands, rotary encoder data, publishes,
+          reconnect attempts and the periodic stats reports (format strings with args). x100 is 100
+          passes with the counters, payloads and stats changing every pass
+The binary records carry a ticks_ms timestamp that the text log does not have.
+'''
+
+import upycompat
+import importlib.util, os, sys, tempfile, types
+from logdecode import records
+
+boot = types.ModuleType('boot')
+boot.MAIN_FILE_LOGGING, boot.MAIN_FILE_MODE, boot.MAIN_FILE_NAME = False, 'a', 'complete.log'
+boot.LOG_BUFSIZE, boot.LOG_BINARY, boot.LOG_MAXBYTES, boot.LOG_BACKUPS, boot.LOG_TOTALBYTES = 512, False, 0, 2, 0
+machine = types.ModuleType('machine')
+machine.Timer = None
+sys.modules.setdefault('boot', boot)
+sys.modules.setdefault('machine', machine)
+
+# upycompat maps ulogging to CPython logging, load the board module under its own name
+_spec = importlib.util.spec_from_file_location('ulogging_board', os.path.join(upycompat.LIB, 'ulogging.py'))
+ulogging = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ulogging)
+
+STARTUP = [
+    ('main', 20, "(CONNACK) Connected to 10.0.0.115 MQTT broker. Subscribed to b'nred2esp/+/+'", ()),
+    ('main', 20, '\33[36mrotEnc1 Subscribing to: None\033[0m', ()),
+    ('main', 20, "\33[34mrotEnc1 Publishing  to: b'esp2nred/rotEnc1'\033[0m", ()),
+    ('main', 20, "JSON payload keys will be:\33[46m{'RotaryEncoder1': 0, 'RotaryEncoderSW': 1}\033[0m", ()),
+    ('main', 20, 'localtime: 2026-10-18 12:05:41', ()),
+    ('main', 20, 'Servo:PWM(13, freq=50, duty=75) initialized in 1.12 msec', ()),
+    ('main', 20, 'Pins in use:[2, 4, 13, 15, 32, 33, 34, 35]', ()),
+    ('adc', 20, 'ADC setting up 4 channels. Vref:3.3 NoiseTh:35 MaxIntvl:60000ms', ()),
+    ('rotenc', 20, 'Rotary Encoder pins- clk:15 data:4 button:2', ()),
+    ('sched', 20, 'Task %s every %d ms offset %d ms priority %d', ('adc', 100, 0, 1)),
+    ('sched', 20, 'Task %s every %d ms offset %d ms priority %d', ('rotenc', 20, 5, 0)),
+    ('main', 20, 'Log file clean up', ()),
+]
+
+def runtime(i):
+    # One pass of the runtime records. Counters, payloads and stats change every pass like on the board
+    counter, volts = 12 + i, 1.6234 + i / 1000
+    rotdata = {'RotaryEncoder1': counter, 'RotaryEncoderSW': i & 1}
+    return [
+        ('main', 10, 'Received topic(tag): %s payload:%s', (b'nred2esp/servoZCMD/%d' % (i % 2), b'%d' % (40 + i % 75))),
+        ('rotenc', 10, 'counter:%s steps:%s skips:%s glitches:%s button:%s', (counter, 4 * counter, i // 50, i // 10, i % 7 == 0)),
+        ('rotenc', 10, rotdata, ()),
+        ('main', 10, 'Got data %s %s', (b'esp2nred/rotEnc1', rotdata)),
+        ('pubq', 10, 'Published msg %s with payload %s', (b'esp2nred/rotEnc1', '{"RotaryEncoder1": %d, "RotaryEncoderSW": %d}' % (counter, i & 1))),
+        ('pubq', 10, 'Published msg %s with payload %s', (b'esp2nred/adc', '{"a0f": %s, "a1f": 0.0121}' % volts)),
+        ('mqtt', 10, 'Connect attempt %d failed (%s), retry in %d ms', (1 + i % 5, OSError(113), 500 << i % 4)),
+        ('mqtt', 20, 'Reconnected in %d ms (session %s)', (5210 + 37 * i, 'resumed')),
+        ('pubq', 20, 'PublishQueue puts:%d superseded:%d packets:%d', (36012 + i, 35011 + i, 1001)),
+        ('sched', 20, 'Task,%s,runs,%d,jitter mean,%.2f,max,%d,ms,overruns,%d,runtime max,%d,us',
+         ('adc', 36000 + i, 0.25 + i / 100, 3, 0, 812 + i)),
+        ('timer', 20, 'Function,%s,calls,%d,mean,%.1f,min,%d,max,%d,p50,%.0f,p95,%.0f,p99,%.0f',
+         ('getdata', 36000 + i, 812.5 + i, 640, 2380, 800.0, 1024.0, 1536.0)),
+    ]
+
+RUNTIME = runtime(0)
+RUNTIME100 = [r for i in range(100) for r in runtime(i)]
+
+def _never_called():
+    raise AssertionError('a function passed as a log arg was called')
+
+EDGES = [   # Arg types and sizes the main.py records do not hit
+    ('edge', 30, 'ints %d %d %d %d %d', (-128, 127, -32769, 70000, 2**40)),
+    ('edge', 30, 'flags %s %s %s', (True, None, False)),
+    ('edge', 30, 'floats %s %s %.2f %.1f %s', (1.6234, 0.1, 3.14159, -2.25, 1e-07)),
+    ('edge', 30, 'float values %s', (float('inf'),)),
+    ('edge', 30, 'containers %s %s %s', ({'k': [1, 2.5, b'x', {'deep': {'er': 1}}]}, [], (1, 'a'))),
+    ('edge', 30, ['msg', 'is', 'a', 'list'], ()),
+    ('edge', 30, {'msg': 'dict'}, (1, 2)),                  # Unhashable msg with args
+    ('edge', 30, 'too few %s %s', (1,)),
+    ('edge', 30, 'long %s %s', ('x' * 300, b'\x00\xff' * 200)),
+    ('edge', 30, lambda: 'deferred %s' % 1, ()),
+    ('edge', 30, 'function arg %s %s', (_never_called, ValueError)),  # Logged as is, not called
+]
+
+
+def write(path, recs, binary, nloggers=0):
+    h = ulogging.BufferedFileHandler(path, 'w', 512, 60000, ulogging.CRITICAL + 1, binary)
+    loggers = {}
+    for name, level, msg, args in recs:
+        if name not in loggers:
+            loggers[name] = ulogging.Logger(name, None, 'w', True, 60000, 512)
+        h.record(loggers[name], level, msg, args)
+    for i in range(nloggers):       # More names than the 1 byte name table holds
+        h.record(ulogging.Logger('n%d' % i, None, 'w', True, 60000, 512), 20, 'logger %d', (i,))
+    h.flush()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def check(tmp, recs, nloggers=0):
+    text = write(os.path.join(tmp, 't.log'), recs, False, nloggers)
+    data = write(os.path.join(tmp, 'b.log'), recs, True, nloggers)
+    lines = ''.join('{0},{1},{2}\n'.format(level, name, msg) for ticks, level, name, msg in records(data))
+    assert lines == text.decode(), 'binary round trip differs from the text log'
+    return len(text), len(data)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        check(tmp, EDGES, nloggers=300)
+        print('round trip ok (edge args, 300 logger names)')
+        print('{0:<24} {1:>8} {2:>12} {3:>14} {4:>7}'.format('', 'records', 'text B/rec', 'binary B/rec', 'saved'))
+        for label, recs in (('startup', STARTUP), ('runtime', RUNTIME), ('runtime x100', RUNTIME100)):
+            text, binary = check(tmp, recs)
+            print('{0:<24} {1:8d} {2:12.2f} {3:14.2f} {4:6.0f}%'.format(label, len(recs), text / len(recs),
+                                                                      binary / len(recs), 100 - 100 * binary / text))
+
+
+if __name__ == "__main__":
+    main()
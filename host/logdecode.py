@@ -0,0 +1,138 @@
+''' Decode a binary ulogging file (LOG_BINARY = True in boot.py) on the PC. Runs on CPython.
+
+    python3 logdecode.py complete.log              # CSV to stdout: ticks_ms,level,name,message
+    python3 logdecode.py complete.log -o out.csv
+    python3 logdecode.py complete.log --text       # Same layout as the text log: LEVEL,name,message
+
+Record layout is documented in ulogging.BufferedFileHandler.
+'''
+
+import argparse, csv, struct, sys
+
+LEVELS = {50: "CRIT", 40: "ERROR", 30: "WARN", 20: "INFO", 10: "DEBUG", 0: "NOTSET"}
+
+_FIXED = {b'c': ("<b", 1), b'h': ("<h", 2), b'i': ("<i", 4), b'q': ("<q", 8)}
+_CONST = {b'n': None, b'T': True, b'F': False}
+
+class _Repr(str):
+    # Item inside a dict/list that the board sent as its repr() text, prints as is
+    def __repr__(self):
+        return str(self)
+
+def _varint(data, i):
+    n = sh = 0
+    while True:
+        b = data[i]
+        i += 1
+        n |= (b & 0x7F) << sh
+        if not b & 0x80:
+            return n, i
+        sh += 7
+
+def _arg(data, i, strs):
+    tag = data[i:i + 1]
+    i += 1
+    if tag in _FIXED:
+        fmt, n = _FIXED[tag]
+        return struct.unpack_from(fmt, data, i)[0], i + n
+    if tag in _CONST:
+        return _CONST[tag], i
+    if tag == b'@':
+        return strs[data[i]], i + 1
+    if tag in (b'd', b'l'):
+        n, i = data[i], i + 1
+        items = []
+        for _ in range(2 * n if tag == b'd' else n):
+            v, i = _arg(data, i, strs)
+            items.append(v)
+        if tag == b'd':
+            return dict(zip(items[::2], items[1::2])), i
+        return items, i
+    if tag in (b's', b'b', b'r', b'x', b'S', b'B', b'X'):
+        if tag in (b's', b'b', b'r', b'x'):
+            n, i = data[i], i + 1
+        else:
+            n, i = struct.unpack_from("<H", data, i)[0], i + 2
+        raw = bytes(data[i:i + n])
+        if tag == b'r':
+            return float(raw), i + n
+        if tag in (b'x', b'X'):
+            return _Repr(raw.decode("utf-8", "replace")), i + n
+        return (raw.decode("utf-8", "replace") if tag in (b's', b'S') else raw), i + n
+    raise ValueError("bad arg tag {0!r} at offset {1}".format(tag, i - 1))
+
+def records(data):
+    ''' Yield (ticks_ms, level, name, message) for every record in data '''
+    names, fmts, strs = {}, {0: "%s"}, {}
+    ticks = 0
+    i = 0
+    while i < len(data):
+        kind = data[i]
+        if kind == 0xFE:
+            nid, i = _varint(data, i + 1)
+            n = data[i]
+            names[nid] = bytes(data[i + 1:i + 1 + n]).decode()
+            i += 1 + n
+        elif kind == 0xFD:
+            fid, i = _varint(data, i + 1)
+            n = struct.unpack_from("<H", data, i)[0]
+            fmts[fid] = bytes(data[i + 2:i + 2 + n]).decode()
+            i += 2 + n
+        elif kind == 0xFB:
+            aid, tag, n = data[i + 1], data[i + 2], data[i + 3]
+            raw = bytes(data[i + 4:i + 4 + n])
+            strs[aid] = raw.decode() if tag == 0x73 else raw
+            i += 4 + n
+        elif kind == 0xFC:
+            ticks = struct.unpack_from("<I", data, i + 1)[0]
+            i += 5
+        else:
+            code, nid = kind >> 5, kind & 0x1F
+            i += 1
+            if code:
+                level = code * 10
+            else:
+                level, i = data[i], i + 1
+            if nid == 31:
+                nid, i = _varint(data, i)
+            delta, i = _varint(data, i)
+            ticks += delta
+            fid, i = _varint(data, i)
+            if fid:
+                nargs, i = data[i], i + 1
+            else:
+                nargs = 1
+            args = []
+            for _ in range(nargs):
+                a, i = _arg(data, i, strs)
+                args.append(a)
+            fmt = fmts.get(fid)
+            try:
+                msg = fmt % tuple(args)
+            except (TypeError, ValueError):
+                msg = "{0} {1}".format(fmt, tuple(args))   # Same as ulogging's _render
+            yield ticks, LEVELS.get(level, "LVL%s" % level), names.get(nid, "?%d" % nid), msg
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("logfile")
+    p.add_argument("-o", "--output", help="write to this file instead of stdout")
+    p.add_argument("--text", action="store_true", help="LEVEL,name,message lines like the text log")
+    a = p.parse_args(argv)
+    with open(a.logfile, "rb") as f:
+        data = f.read()
+    out = open(a.output, "w", newline="") if a.output else sys.stdout
+    try:
+        if a.text:
+            for ticks, level, name, msg in records(data):
+                out.write("{0},{1},{2}\n".format(level, name, msg))
+        else:
+            w = csv.writer(out)
+            w.writerow(["ticks_ms", "level", "name", "message"])
+            w.writerows(records(data))
+    finally:
+        if a.output:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+''' ulogging RotatingFileHandler rotation and the shared flash budget (setBudget): the backups deleted to fit
+the budget are the oldest ones across all log files, whatever file they belong to. Runs on CPython.
+
+    python3 logrotatetest.py
+'''
+
+import upycompat
+import importlib.util, os, sys, tempfile, types
+
+boot = types.ModuleType('boot')
+boot.MAIN_FILE_LOGGING, boot.MAIN_FILE_MODE, boot.MAIN_FILE_NAME = False, 'a', 'complete.log'
+boot.LOG_BUFSIZE, boot.LOG_BINARY, boot.LOG_MAXBYTES, boot.LOG_BACKUPS, boot.LOG_TOTALBYTES = 512, False, 0, 2, 0
+machine = types.ModuleType('machine')
+machine.Timer = None
+sys.modules.setdefault('boot', boot)
+sys.modules.setdefault('machine', machine)
+
+# upycompat maps ulogging to CPython logging, load the board module under its own name
+_spec = importlib.util.spec_from_file_location('ulogging_board', os.path.join(upycompat.LIB, 'ulogging.py'))
+ulogging = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ulogging)
+
+RECORD = b'x' * 99 + b'\n'      # One flush per record, 100 bytes
+
+
+def handler(path, backups=3):
+    h = ulogging.RotatingFileHandler(path, 'a', 0, 0, ulogging.ERROR, maxbytes=200, backups=backups)
+    ulogging._handlers[path] = h
+    return h
+
+
+def contents(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write(h, tag, n=1):
+    for i in range(n):
+        h.emit(ulogging.INFO, tag + RECORD[len(tag):])
+
+
+def rotation(tmp):
+    h = handler(os.path.join(tmp, 'a.log'), backups=2)
+    for tag in (b'1', b'2', b'3', b'4', b'5', b'6', b'7'):
+        write(h, tag)
+    assert contents(h.filename)[:1] == b'7'             # 200 bytes per file: 7 | 5 6 | 3 4, 1 2 dropped
+    assert contents(h._backup(1))[:1] == b'5' and contents(h._backup(2))[:1] == b'3'
+    assert not os.path.exists(h._backup(3)) and h.backupsizes == [200, 200]
+    print('rotation keeps {0} backups ok'.format(h.backups))
+
+
+def budget_drops_oldest(tmp):
+    # a.log has the most backup bytes, but b.log holds the oldest backup
+    b = handler(os.path.join(tmp, 'b.log'))
+    a = handler(os.path.join(tmp, 'a.log'))
+    write(b, b'b-old', 3)                               # b.log.1 made first
+    write(a, b'a', 9)                                   # a.log.1 .. a.log.3 made after it
+    assert len(a.backupsizes) == 3 and len(b.backupsizes) == 1
+    ulogging.setBudget(a.total() + b.total() - 100)     # One backup has to go
+    assert len(b.backupsizes) == 0 and not os.path.exists(b._backup(1)), 'oldest backup is in b.log'
+    assert len(a.backupsizes) == 3
+    ulogging.setBudget(a.total() + b.total() - 100)     # Next oldest is a.log.3
+    assert len(a.backupsizes) == 2 and not os.path.exists(a._backup(3))
+    ulogging.setBudget(0)
+    print('budget drops the oldest backup across files ok')
+
+
+def restart_backups_are_older(tmp):
+    # Backups already on flash at start up go before any made since
+    a = handler(os.path.join(tmp, 'c.log'))
+    write(a, b'c-old', 4)                               # c.log.1 from the previous run
+    b = handler(os.path.join(tmp, 'c.log'))             # Reboot, takes the place of a in the handler table
+    d = handler(os.path.join(tmp, 'd.log'))
+    write(d, b'd', 3)                                   # d.log.1 made this run
+    ulogging.setBudget(b.total() + d.total() - 100)
+    assert len(b.backupsizes) == 0 and len(d.backupsizes) == 1
+    ulogging.setBudget(0)
+    print('backups from the previous run dropped first ok')
+
+
+for test in (rotation, budget_drops_oldest, restart_backups_are_older):
+    with tempfile.TemporaryDirectory() as tmp:
+        ulogging._handlers.clear()
+        test(tmp)
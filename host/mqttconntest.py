@@ -0,0 +1,128 @@
+''' MQTTConnection failure paths against fakebroker: refused connects, failed subscribes, a failing onconnect
+(also one whose publish fails during a reconnect, which must not count a second outage), a broker host that accepts TCP but never answers, and a stale broker session at boot. None of them may raise
+out of check_msg/drain, each has to back off and recover. Runs on CPython.
+
+    python3 mqttconntest.py
+'''
+
+import upycompat
+import socket, time
+from fakebroker import FakeBroker
+from umqttsimple import MQTTClient
+from mqttconn import MQTTConnection
+
+TOPICS = [b'nred2esp/servoZCMD/+']
+
+
+def client(port, cid=b'conntest', timeout=5):
+    c = MQTTClient(cid, '127.0.0.1', port, connect_timeout=timeout)
+    c.set_callback(lambda topic, msg: None)
+    return c
+
+
+def loop(conn, seconds, until=None):
+    # 10 ms main loop, check_msg and drain alternately like main.py
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < seconds:
+        conn.check_msg()
+        conn.drain()
+        if until is not None and until():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def refused_then_accepted():
+    broker = FakeBroker().start()
+    broker.connack_rc = 3                               # Server unavailable
+    conn = MQTTConnection(client(broker.port), TOPICS, backoff_ms=50, backoff_max_ms=200)
+    loop(conn, 0.5)
+    assert not conn.connected and conn.attempts >= 2
+    broker.connack_rc = 0
+    assert loop(conn, 2, lambda: conn.connected)
+    broker.shutdown()
+    print('refused connect backs off, then connects ok')
+
+
+def suback_failure():
+    broker = FakeBroker().start()
+    broker.suback_fail = True
+    conn = MQTTConnection(client(broker.port), TOPICS, backoff_ms=50, backoff_max_ms=200)
+    loop(conn, 0.5)
+    assert not conn.connected and conn.attempts >= 2
+    broker.suback_fail = False
+    assert loop(conn, 2, lambda: conn.connected)
+    broker.shutdown()
+    print('failed subscribe backs off ok')
+
+
+def onconnect_failure():
+    broker = FakeBroker().start()
+    calls = []
+    def onconnect(conn):
+        calls.append(1)
+        if len(calls) < 3:
+            raise OSError(104)                          # Status publish hits a reset socket
+        conn.publish(b'esp2nred/status', b'up')
+    conn = MQTTConnection(client(broker.port), TOPICS, backoff_ms=50, backoff_max_ms=200, onconnect=onconnect)
+    assert loop(conn, 3, lambda: conn.connected)
+    assert len(calls) == 3 and broker.wait_for(1) and broker.received[0][1] == b'esp2nred/status'
+    broker.shutdown()
+    print('failing onconnect retried ok')
+
+
+def onconnect_publish_failure_after_outage():
+    # onconnect's publish fails inside the reconnect: still one outage, time-to-recover from the drop
+    broker = FakeBroker().start()
+    fail = [0]
+    def onconnect(conn):
+        if fail[0]:
+            fail[0] -= 1
+            conn.client.sock.close()                    # Status publish hits a dead socket
+        conn.publish(b'esp2nred/status', b'up')
+    conn = MQTTConnection(client(broker.port), TOPICS, backoff_ms=50, backoff_max_ms=100, onconnect=onconnect)
+    assert loop(conn, 2, lambda: conn.connected)
+    broker.stop()
+    t0 = time.monotonic()
+    assert loop(conn, 2, lambda: not conn.connected)
+    fail[0] = 2
+    broker.start()
+    assert loop(conn, 5, lambda: conn.connected)
+    down_ms = (time.monotonic() - t0) * 1000
+    assert fail[0] == 0 and conn.outages == 1 and conn.recover_count == 1, (conn.outages, conn.recover_count)
+    assert conn.recover_max >= down_ms - 50, (conn.recover_max, down_ms)
+    broker.shutdown()
+    print('failing onconnect publish after an outage counted once, recovered in {0} ms ok'.format(conn.recover_max))
+
+
+def silent_host():
+    # Accepts the TCP connection (kernel backlog) but never sends a CONNACK
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    conn = MQTTConnection(client(listener.getsockname()[1], timeout=0.2), TOPICS, backoff_ms=50, backoff_max_ms=100)
+    t0 = time.monotonic()
+    conn.check_msg()
+    assert not conn.connected and time.monotonic() - t0 < 1
+    listener.close()
+    print('silent host times out in {0:.0f} ms ok'.format((time.monotonic() - t0) * 1000))
+
+
+def stale_session_at_boot():
+    broker = FakeBroker().start()
+    broker.sessions[b'conntest'] = []                   # Session from an older firmware without these topics
+    conn = MQTTConnection(client(broker.port), TOPICS, clean_session=False)
+    assert loop(conn, 2, lambda: conn.connected)
+    assert loop(conn, 1, lambda: broker.sessions[b'conntest'] == TOPICS)
+    resubscribes = conn.resubscribes
+    broker.stop()                                       # Outage, the session survives it
+    time.sleep(0.05)
+    broker.start()
+    assert loop(conn, 5, lambda: conn.connected and conn.outages == 1)
+    assert conn.resubscribes == resubscribes            # Session resumed, no resubscribe after boot
+    broker.shutdown()
+    print('stale session subscribed at boot ok')
+
+
+for test in (refused_then_accepted, suback_failure, onconnect_failure, onconnect_publish_failure_after_outage, silent_host, stale_session_at_boot):
+    test()
@@ -0,0 +1,106 @@
+''' Sensor-to-publish latency: the synchronous main loop vs the asyncio runtime. Runs on CPython.
+
+    python3 mqttlatency.py [seconds]
+
+A simulated sensor changes value at random times (mean 50 ms apart). Latency is the time from a change
+until the broker stand-in receives the PUBLISH carrying it.
+  sync loop    umqttsimple.MQTTClient in the original main.py loop: check_msg every 400 ms,
+               getdata + publish every 100 ms (ticks_diff flags, busy loop)
+  async        umqttasync.MQTTClientAsync, receive task + one poll() coroutine per device
+'''
+
+import upycompat
+import asyncio, json, random, sys, time, utime
+from fakebroker import FakeBroker
+from umqttsimple import MQTTClient
+from umqttasync import MQTTClientAsync
+import asyncdevices
+
+TOPIC = b'esp2nred/adc/esp'
+
+class Sensor:
+    # Value k becomes visible at changes[k]. getdata returns the newest value once per change
+    def __init__(self, duration, mean_ms=50, seed=1):
+        rnd = random.Random(seed)
+        self.t0 = time.monotonic()
+        t, self.changes = 0.0, []
+        while t < duration:
+            t += rnd.expovariate(1000 / mean_ms)
+            self.changes.append(self.t0 + t)
+        self.last = -1
+
+    def getdata(self):
+        now = time.monotonic()
+        k = self.last
+        while k + 1 < len(self.changes) and self.changes[k + 1] <= now:
+            k += 1
+        if k != self.last:
+            self.last = k
+            return {'v': k}
+
+def latencies(broker, sensor):
+    out = []
+    for t, topic, payload in broker.received:
+        if topic == TOPIC:
+            out.append((t - sensor.changes[json.loads(payload)['v']]) * 1000)
+    return sorted(out)
+
+def summary(label, lat, sensor):
+    if not lat:
+        print('{0:<22} no messages'.format(label))
+        return
+    p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))]
+    print('{0:<22} msgs {1:4d}/{2:<4d} mean {3:6.1f} ms  p50 {4:6.1f}  p95 {5:6.1f}  max {6:6.1f}'.format(
+        label, len(lat), len(sensor.changes), sum(lat) / len(lat), p(0.5), p(0.95), lat[-1]))
+
+def sync_loop(broker, duration):
+    sensor = Sensor(duration)
+    client = MQTTClient(b'sync', '127.0.0.1', broker.port)
+    client.set_callback(lambda topic, msg: None)
+    client.connect()
+    client.subscribe(b'nred2esp/+/+')
+    t0onmsg_ms = t0_datapub_ms = utime.ticks_ms()
+    t_end = time.monotonic() + duration
+    while time.monotonic() < t_end:
+        getdata = False
+        if utime.ticks_diff(utime.ticks_ms(), t0onmsg_ms) > 400:
+            client.check_msg()
+            t0onmsg_ms = utime.ticks_ms()
+        if utime.ticks_diff(utime.ticks_ms(), t0_datapub_ms) > 100:
+            getdata = True
+            t0_datapub_ms = utime.ticks_ms()
+        if getdata:
+            data = sensor.getdata()
+            if data is not None:
+                client.publish(TOPIC, json.dumps(data))
+    time.sleep(0.05)
+    client.disconnect()
+    return sensor
+
+async def async_runtime(broker, duration, period_ms):
+    sensor = Sensor(duration)
+    client = MQTTClientAsync(b'async', '127.0.0.1', broker.port)
+    client.set_callback(lambda topic, msg: None)
+    await client.connect()
+    await client.subscribe(b'nred2esp/+/+')
+    tasks = [asyncio.create_task(client.run()),
+             asyncio.create_task(asyncdevices.poll(sensor.getdata, period_ms, asyncdevices.publisher(client, TOPIC, json.dumps)))]
+    await asyncio.sleep(duration + 0.05)
+    for task in tasks:
+        task.cancel()
+    await client.disconnect()
+    return sensor
+
+def main(duration=5.0):
+    broker = FakeBroker().start()
+    print('sensor changes every ~50 ms for {0} s'.format(duration))
+    sensor = sync_loop(broker, duration)
+    summary('sync loop (100 ms)', latencies(broker, sensor), sensor)
+    for period_ms in (100, 10):
+        broker.received.clear()
+        sensor = asyncio.run(async_runtime(broker, duration, period_ms))
+        summary('async poll ({0} ms)'.format(period_ms), latencies(broker, sensor), sensor)
+    broker.shutdown()
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0)
@@ -0,0 +1,175 @@
+''' Outbox store-and-forward against fakebroker with a simulated outage. Runs on CPython.
+
+    python3 outboxtest.py
+'''
+
+import upycompat
+import os, shutil, tempfile, time
+from fakebroker import FakeBroker
+from umqttsimple import MQTTClient
+import outbox
+from outbox import Outbox
+
+TOPIC = b'esp2nred/adc/esp'
+
+
+def connect(broker):
+    client = MQTTClient(b'outboxtest', '127.0.0.1', broker.port)
+    client.connect()
+    return client
+
+
+def drain_all(box, client):
+    total = 0
+    while box.pending():
+        box.t0 -= box.drain_ms             # Skip the throttle wait in the test
+        n = box.drain(client, 7)
+        assert n <= 7
+        total += n
+    return total
+
+
+def outage_and_reboot(path):
+    broker = FakeBroker().start()
+    client = connect(broker)
+    box = Outbox(path, segbytes=256, maxsegs=50, headmax=4)
+    client.publish(TOPIC, b'live 0')
+    assert broker.wait_for(1)
+
+    broker.stop()                          # Broker goes away
+    try:
+        for i in range(3):
+            client.check_msg()             # Reads EOF and raises once the close arrives
+            time.sleep(0.01)
+        assert 0, "OSError expected"
+    except OSError:
+        pass
+    for i in range(30):
+        box.put(TOPIC, 'queued %d' % i)    # Readings taken during the outage
+    assert box.pending()
+    box.sync()
+
+    box = Outbox(path, segbytes=256, maxsegs=50, headmax=4)   # Reboot: queue comes back from flash
+    assert box.pending()
+    broker.start()
+    client = connect(broker)
+    sent = drain_all(box, client)
+    assert sent == 30, sent
+    assert broker.wait_for(31)
+    assert [m for t, topic, m in broker.received[1:]] == [b'queued %d' % i for i in range(30)]
+    assert not os.listdir(path), os.listdir(path)  # Drained segments and read pointer deleted
+    broker.shutdown()
+
+
+def resume_after_partial_drain(path):
+    broker = FakeBroker().start()
+    client = connect(broker)
+    box = Outbox(path, segbytes=128, maxsegs=50, headmax=1)
+    for i in range(20):
+        box.put(TOPIC, 'm%d' % i)
+    box.t0 -= box.drain_ms
+    assert box.drain(client, 5) == 5
+    box = Outbox(path, segbytes=128, maxsegs=50, headmax=1)   # Reboot mid drain
+    drain_all(box, client)
+    assert broker.wait_for(20)
+    assert [m for t, topic, m in broker.received] == [b'm%d' % i for i in range(20)]
+    broker.shutdown()
+
+
+def flash_is_bounded(path):
+    box = Outbox(path, segbytes=100, maxsegs=3, headmax=1)
+    for i in range(200):
+        box.put(TOPIC, 'reading %03d' % i)
+    used = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    assert len(box.segs) <= 3 and used <= 3 * 100 + 40, used
+    assert box.dropped > 0
+    received = []
+    class Sink:
+        def publish(self, topic, msg, retain=False, qos=0):
+            received.append(msg)
+    drain_all(box, Sink())
+    assert received[-1] == b'reading 199'  # Newest data kept, oldest dropped
+    assert received == sorted(received)
+
+
+def torn_tail_is_skipped(path):
+    box = Outbox(path, segbytes=1000, maxsegs=3, headmax=1)
+    for i in range(3):
+        box.put(TOPIC, 'ok %d' % i)
+    with open(os.path.join(path, '0.q'), 'ab') as f:
+        f.write(b'\xa5\x00\x10\x00')        # Power lost half way through a header
+    box = Outbox(path, segbytes=1000, maxsegs=3, headmax=1)
+    for i in range(3):
+        box.put(TOPIC, 'after %d' % i)      # Queued after the reboot, still offline
+    box = Outbox(path, segbytes=1000, maxsegs=3, headmax=1)
+    received = []
+    class Sink:
+        def publish(self, topic, msg, retain=False, qos=0):
+            received.append(msg)
+    drain_all(box, Sink())
+    assert received == [b'ok 0', b'ok 1', b'ok 2', b'after 0', b'after 1', b'after 2'], received
+
+
+def read_position_writes(path):
+    # outbox/rd is written per segment or per save_every records, never for a drain that sent nothing
+    writes = []
+    def counting_open(name, mode='r'):
+        if name.endswith('/rd') and 'w' in mode:
+            writes.append(name)
+        return open(name, mode)
+    outbox.open = counting_open
+    try:
+        box = Outbox(path, segbytes=1000, maxsegs=50, headmax=1, save_every=20)
+        for i in range(100):
+            box.put(TOPIC, 'reading %03d' % i)
+        nsegs = len(box.segs)
+        received = []
+        class Down:
+            def publish(self, topic, msg, retain=False, qos=0):
+                raise OSError(113)
+        class Sink:
+            def publish(self, topic, msg, retain=False, qos=0):
+                received.append(msg)
+        box.t0 -= box.drain_ms
+        box.drain(Sink(), 1)
+        n = len(writes)
+        for i in range(10):                # Broker down again: nothing consumed, nothing written
+            box.t0 -= box.drain_ms
+            try:
+                box.drain(Down(), 1)
+                assert 0, "OSError expected"
+            except OSError:
+                pass
+        assert len(writes) == n, writes
+        for i in range(30):
+            box.t0 -= box.drain_ms
+            box.drain(Sink(), 1)
+        assert len(writes) <= n + 2, len(writes)   # 30 single record drains, one save_every write at most
+        box = Outbox(path, segbytes=1000, maxsegs=50, headmax=1, save_every=20)  # Reboot without sync
+        drain_all(box, Sink())
+        assert len(received) - 100 <= 20, len(received)      # At-least-once: up to save_every sent again
+        assert sorted(set(received)) == [b'reading %03d' % i for i in range(100)]
+        assert len(writes) <= 1 + nsegs + 100 // 20 + 2, len(writes)
+        assert not os.listdir(path), os.listdir(path)
+
+        box = Outbox(path, segbytes=1000, maxsegs=50, headmax=1, save_every=20)
+        for i in range(10):
+            box.put(TOPIC, 'synced %d' % i)
+        box.t0 -= box.drain_ms
+        box.drain(Sink(), 3)
+        box.sync()                          # Before a reset the position is saved
+        box = Outbox(path, segbytes=1000, maxsegs=50, headmax=1, save_every=20)
+        del received[:]
+        drain_all(box, Sink())
+        assert received == [b'synced %d' % i for i in range(3, 10)], received
+    finally:
+        del outbox.open
+
+
+for test in (outage_and_reboot, resume_after_partial_drain, flash_is_bounded, torn_tail_is_skipped, read_position_writes):
+    path = tempfile.mkdtemp()
+    try:
+        test(os.path.join(path, 'outbox'))
+    finally:
+        shutil.rmtree(path)
+    print(test.__name__, 'ok')
@@ -0,0 +1,109 @@
+''' Fuzz test for the MQTTClient receive parser: random packet streams cut into random fragments. Runs on CPython.
+
+    python3 parsertest.py [rounds]
+
+The socket is a stand-in that hands out the stream a few bytes at a time, sometimes nothing (None, the
+non-blocking "no data yet"). check_msg must never read while blocking, must deliver every PUBLISH once and
+in order, ack qos 1, clear PUBACKed ids and PINGRESPs, and keep working through packets bigger than rbuf.
+A last check runs a burst through fakebroker: one check_msg call picks up every queued message.
+'''
+
+import upycompat
+import random, struct, sys, time, utime
+from fakebroker import FakeBroker, publish_packet
+from umqttsimple import MQTTClient
+
+
+class FragmentSock:
+    def __init__(self, stream, rnd):
+        self.stream = stream
+        self.pos = 0
+        self.rnd = rnd
+        self.blocking = True
+        self.written = bytearray()
+        self.reads = 0
+
+    def setblocking(self, flag):
+        self.blocking = flag
+
+    def readinto(self, buf, n=None):
+        assert not self.blocking, "check_msg read from a blocking socket"
+        self.reads += 1
+        if self.pos >= len(self.stream) or self.rnd.random() < 0.3:
+            return None                                     # Nothing arrived yet
+        n = min(len(buf), self.rnd.choice((1, 1, 2, 3, 7, 50, 500)), len(self.stream) - self.pos)
+        buf[:n] = self.stream[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def write(self, buf, n=None):
+        self.written += bytes(buf[:n] if n is not None else buf)
+
+
+def random_stream(rnd, count):
+    # Returns (stream bytes, expected [(topic, msg)], qos 1 pids to ack, PUBACK pids, PINGRESP count)
+    stream, expected, acks, pubacks, pings = bytearray(), [], [], [], 0
+    for i in range(count):
+        kind = rnd.random()
+        if kind < 0.6:
+            topic = b'nred2esp/servoZCMD/' + str(i).encode()
+            msg = bytes(rnd.getrandbits(8) for _ in range(rnd.choice((0, 1, 5, 100, 126, 127, 128, 300, 1000, 20000))))
+            qos = rnd.choice((0, 1))
+            pid = rnd.randint(1, 65535) if qos else 0
+            stream += publish_packet(topic, msg, qos, pid)
+            expected.append((topic, msg))
+            if qos:
+                acks.append(pid)
+        elif kind < 0.8:
+            pid = rnd.randint(1, 65535)
+            stream += b'\x40\x02' + struct.pack('!H', pid)
+            pubacks.append(pid)
+        else:
+            stream += b'\xd0\x00'
+            pings += 1
+    return bytes(stream), expected, acks, pubacks, pings
+
+
+def fuzz(seed):
+    rnd = random.Random(seed)
+    stream, expected, acks, pubacks, pings = random_stream(rnd, rnd.randint(1, 40))
+    got = []
+    c = MQTTClient(b'fuzz', 'localhost', rbufsize=rnd.choice((16, 64, 256)))
+    c.set_callback(lambda topic, msg: got.append((topic, msg)))
+    c.sock = FragmentSock(stream, rnd)
+    for pid in pubacks:
+        c.inflight[pid] = [utime.ticks_ms(), b't', b'm', False]   # Recent, so no retransmit writes
+    c.ping_at = 0 if pings else None                       # A PINGREQ waiting for its PINGRESP
+    calls = 0
+    while c.sock.pos < len(stream) or c.rlen:
+        c.check_msg()
+        calls += 1
+        assert calls < 100000, "parser stuck"
+    assert got == expected, seed
+    assert bytes(c.sock.written) == b''.join(b'\x40\x02' + struct.pack('!H', pid) for pid in acks), seed
+    assert not c.inflight and c.ping_at is None, seed
+    assert c.rpos == c.rlen == 0
+    return len(stream)
+
+
+def burst():
+    broker = FakeBroker().start()
+    got = []
+    c = MQTTClient(b'burst', '127.0.0.1', broker.port)
+    c.set_callback(lambda topic, msg: got.append(msg))
+    c.connect()
+    c.subscribe(b'nred2esp/+/+')
+    for i in range(50):
+        broker.send(b'nred2esp/servoZCMD/0', str(i).encode())
+    time.sleep(0.2)
+    c.check_msg()
+    c.disconnect()
+    broker.shutdown()
+    assert got == [str(i).encode() for i in range(50)], got
+    return len(got)
+
+
+rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+total = sum(fuzz(seed) for seed in range(rounds))
+print('fuzz ok: {0} streams, {1} bytes'.format(rounds, total))
+print('burst ok: {0} messages in one check_msg'.format(burst()))
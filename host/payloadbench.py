@@ -0,0 +1,93 @@
+''' Device payload encoding: ujson.dumps vs payload.SchemaJSON vs payload.SchemaStruct. Size, encode time and a parse check.
+
+    python3 payloadbench.py [encodes]         # PC
+    import payloadbench; payloadbench.main()   # Board: copy this file to /lib
+
+Check: random values (ints, floats of every magnitude and sign, bools, None) and random key subsets are
+encoded and parsed back with json.loads. Keys and order must match, ints exactly, floats to the precision.
+Out of schema keys and str values must fall back to ujson.dumps.
+'''
+
+try:
+    import upycompat            # On the PC
+except ImportError:
+    pass                        # On the board
+import gc, ujson, utime
+try:
+    import urandom as random
+except ImportError:
+    import random
+from payload import SchemaJSON, SchemaStruct
+
+ADC = ['a0f', 'a1f', 'a2f', 'a3f']
+ROTENC = ['RotEnc1Ci', 'RotEnc1Bi']
+
+def rand_value():
+    kind = random.getrandbits(3)
+    if kind == 0:
+        return random.getrandbits(20) - (1 << 19)
+    if kind == 1:
+        return [True, False, None][random.getrandbits(8) % 3]
+    mag = 10 ** (random.getrandbits(4) % 12 - 6)                     # 1e-6 .. 1e5
+    return (random.getrandbits(24) / (1 << 23) - 1) * mag
+
+def check(rounds=2000, precision=4):
+    enc = SchemaJSON(ADC + ROTENC, precision)
+    keys = ADC + ROTENC
+    for r in range(rounds):
+        data = {}
+        for key in keys:
+            if random.getrandbits(2):                              # Random subset, sometimes empty
+                data[key] = rand_value()
+        out = ujson.loads(bytes(enc.encode(data)))
+        assert list(out) == [k for k in keys if k in data], (data, out)
+        for key, v in data.items():
+            if isinstance(v, float):
+                assert abs(out[key] - v) <= 0.5 / 10 ** precision + abs(v) * 1e-12, (key, v, out[key])
+            else:
+                assert out[key] == v and type(out[key]) == type(v), (key, v, out[key])
+    assert ujson.loads(bytes(enc.encode({'a0f': 1.5}))) == {'a0f': 1.5}
+    assert enc.encode({'a0f': 1.0}) == b'{"a0f":1.0}'
+    if precision == 4:
+        assert enc.encode({'a0f': -0.00001}) == b'{"a0f":0.0}'
+    assert enc.encode({}) == b'{}'
+    f = enc.fallbacks
+    assert ujson.loads(enc.encode({'a0f': 1.5, 'other': 2})) == {'a0f': 1.5, 'other': 2}
+    assert ujson.loads(enc.encode({'a0f': 'na'})) == {'a0f': 'na'}
+    assert enc.fallbacks == f + 2
+
+def bench(keys, data, n):
+    out = []
+    for f in (ujson.dumps, SchemaJSON(keys).encode, SchemaStruct(keys, 1).encode):
+        f(data)
+        t0 = utime.ticks_us()
+        for i in range(n):
+            f(data)
+        us = utime.ticks_diff(utime.ticks_us(), t0) / n
+        alloc = None
+        if hasattr(gc, 'mem_alloc'):
+            gc.collect()
+            gc.disable()
+            a0 = gc.mem_alloc()
+            for i in range(100):
+                f(data)
+            alloc = (gc.mem_alloc() - a0) / 100
+            gc.enable()
+        out.append((len(f(data)), us, alloc))
+    return out
+
+def main(n=2000):
+    check()
+    print('parse check ok')
+    cases = (('adc 4 floats', ADC, {'a0f': 1.6234133, 'a1f': 0.01208791, 'a2f': 3.3, 'a3f': 2.501831}),
+             ('rotenc 2 ints', ROTENC, {'RotEnc1Ci': 17, 'RotEnc1Bi': 1}),
+             ('adc delta 1 of 4', ADC, {'a2f': 3.2911}))
+    for label, keys, data in cases:
+        fmt = lambda a: 'n/a' if a is None else '{0:.0f}'.format(a)
+        print(label)
+        for name, (size, us, alloc) in zip(('ujson', 'schema json', 'struct'), bench(keys, data, n)):
+            print('    {0:<12} {1:3d} B {2:6.2f} us {3:>3} B alloc'.format(name, size, us, fmt(alloc)))
+
+if __name__ == "__main__":
+    import sys
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
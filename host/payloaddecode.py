@@ -0,0 +1,59 @@
+''' Decode device payloads on the PC / Node-RED side. Runs on CPython, no MicroPython modules needed.
+
+Devices set up with codec='struct' publish packed payloads (payload.SchemaStruct) and, on every connect,
+their schema as retained JSON on esp2nred/schema/<ESPID>/<id>. Schema ids are only unique per board (the
+device number), so schemas are kept per board: the schema's "board" field is the ESPID, the last level
+of the board's publish topics (esp2nred/<lvl2>/<ESPID>). Pass it to decode. Feed the schemas in, then
+decode any payload. A payload starting with '{' is JSON (ujson/SchemaJSON devices, or a SchemaStruct
+fallback) and is parsed as such.
+
+    from payloaddecode import Decoder
+    dec = Decoder()
+    dec.add_schema(schema_msg)          # bytes/str/dict {"board": "esp", "id": 1, "keys": ["a0f", ...], "types": "ffff"}
+    dec.decode(payload, 'esp')          # -> {'a0f': 1.6234..., ...}
+
+    python3 payloaddecode.py '{"board":"esp","id":1,"keys":["a0f","a1f"],"types":"ff"}' 0103...   # hex payload -> JSON
+'''
+
+import json, struct, sys
+
+class Decoder:
+    def __init__(self):
+        self.schemas = {}               # (board, id) -> (header format, [(key, format, size)])
+
+    def add_schema(self, desc):
+        if isinstance(desc, (bytes, bytearray, str)):
+            desc = json.loads(desc)
+        keys, types = desc['keys'], desc['types']
+        if len(keys) != len(types) or len(keys) > 32:
+            raise ValueError('bad schema {0}'.format(desc))
+        hdr = '<BB' if len(keys) <= 8 else '<BH' if len(keys) <= 16 else '<BI'
+        self.schemas[(desc.get('board'), desc['id'])] = (hdr, [(k, '<' + t, struct.calcsize(t)) for k, t in zip(keys, types)])
+
+    def decode(self, payload, board=None):
+        payload = bytes(payload)
+        if payload[:1] == b'{':
+            return json.loads(payload)
+        if not payload:
+            raise ValueError('empty payload')
+        schema = self.schemas.get((board, payload[0]))
+        if schema is None:
+            raise KeyError('unknown schema id {0} for board {1}'.format(payload[0], board))
+        hdr, fields = schema
+        sid, mask = struct.unpack_from(hdr, payload)
+        i = struct.calcsize(hdr)
+        out = {}
+        for n, (key, fmt, size) in enumerate(fields):
+            if mask >> n & 1:
+                if i + size > len(payload):
+                    raise ValueError('payload too short for schema {0}'.format(sid))
+                out[key] = struct.unpack_from(fmt, payload, i)[0]
+                i += size
+        if i != len(payload):
+            raise ValueError('{0} trailing bytes for schema {1}'.format(len(payload) - i, sid))
+        return out
+
+if __name__ == "__main__":
+    dec = Decoder()
+    dec.add_schema(sys.argv[1])
+    print(json.dumps(dec.decode(bytes.fromhex(sys.argv[2]), json.loads(sys.argv[1]).get('board'))))
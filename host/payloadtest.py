@@ -0,0 +1,96 @@
+''' Round trip: payload.SchemaStruct on the device side -> payloaddecode.Decoder on the PC. Runs on CPython.
+
+    python3 payloadtest.py
+'''
+
+import upycompat
+import json, random, struct
+from payload import SchemaStruct, SchemaJSON
+from payloaddecode import Decoder
+
+ADC = ['a0f', 'a1f', 'a2f', 'a3f']
+ROTENC = ['RotEnc1Ci', 'RotEnc1Bi']
+
+
+def f32(v):
+    return struct.unpack('<f', struct.pack('<f', v))[0]
+
+
+def random_subsets(rounds=5000):
+    rnd = random.Random(1)
+    keys = ADC + ROTENC
+    enc = SchemaStruct(keys, 7)
+    dec = Decoder()
+    dec.add_schema(json.dumps(enc.describe()))             # No board: schemas added without one
+    for r in range(rounds):
+        data = {}
+        for key in keys:
+            if rnd.random() < 0.6:
+                data[key] = rnd.randint(-2 ** 31, 2 ** 31 - 1) if key.endswith('i') else rnd.uniform(-5, 5)
+        if rnd.random() < 0.1:
+            data[ADC[0]] = None                             # Left out, like a missing key
+        out = dec.decode(enc.encode(data))
+        assert out == {k: (f32(v) if k in ADC else v) for k, v in data.items() if v is not None}, (data, out)
+    assert enc.fallbacks == 0
+
+
+def layouts():
+    enc = SchemaStruct(ADC, 1)
+    assert enc.types == 'ffff' and enc.describe() == {'id': 1, 'keys': ADC, 'types': 'ffff'}
+    payload = bytes(enc.encode({'a0f': 1.6234, 'a1f': 0.0121, 'a2f': 3.3, 'a3f': 2.5}))
+    assert len(payload) == 2 + 16 and payload[:2] == b'\x01\x0f'
+    assert bytes(enc.encode({'a2f': 3.3})) == b'\x01\x04' + struct.pack('<f', 3.3)   # Delta: header + one value
+    rot = SchemaStruct(ROTENC, 2, types='hB')              # Smaller types where the range allows
+    assert bytes(rot.encode({'RotEnc1Ci': -3.0, 'RotEnc1Bi': 1})) == b'\x02\x03\xfd\xff\x01'
+    wide = SchemaStruct(['k%di' % n for n in range(20)], 3)
+    dec = Decoder()
+    for e in (enc, rot, wide):
+        dec.add_schema(e.describe())
+    data = {'k%di' % n: n * 1000 for n in range(0, 20, 3)}
+    assert dec.decode(wide.encode(data)) == data
+    assert len(wide.encode(data)) == 5 + 4 * len(data)     # '<BI' header past 16 keys
+
+
+def two_boards():
+    # Same schema id on two boards with different devices: each board's payloads decode with its own layout
+    a, b = SchemaStruct(ADC, 1), SchemaStruct(ROTENC, 1, types='hB')
+    dec = Decoder()
+    for board, enc in (('espA', a), ('espB', b)):
+        desc = enc.describe()
+        desc['board'] = board                               # As main.py publishes it on esp2nred/schema/<ESPID>/1
+        dec.add_schema(json.dumps(desc))
+    assert dec.decode(a.encode({'a2f': 1.5}), 'espA') == {'a2f': 1.5}
+    assert dec.decode(b.encode({'RotEnc1Ci': -3, 'RotEnc1Bi': 1}), 'espB') == {'RotEnc1Ci': -3, 'RotEnc1Bi': 1}
+    try:
+        dec.decode(a.encode({'a2f': 1.5}), 'espC')
+        assert 0
+    except KeyError:
+        pass
+
+
+def fallbacks():
+    rot = SchemaStruct(ROTENC, 2, types='hB')
+    dec = Decoder()
+    dec.add_schema(rot.describe())
+    for data in ({'RotEnc1Ci': 'na'}, {'RotEnc1Bi': 300}, {'RotEnc1Ci': 1, 'other': 2}):
+        payload = rot.encode(data)
+        assert isinstance(payload, str) and dec.decode(payload.encode()) == data
+    assert rot.fallbacks == 3
+    assert dec.decode(bytes(SchemaJSON(ADC).encode({'a0f': 1.5}))) == {'a0f': 1.5}   # JSON devices on the same decoder
+
+
+def bad_input():
+    dec = Decoder()
+    dec.add_schema({'id': 1, 'keys': ADC, 'types': 'ffff'})
+    for payload, err in ((b'', ValueError), (b'\x09\x01', KeyError), (b'\x01\x03' + b'\0' * 4, ValueError),
+                         (b'\x01\x01' + b'\0' * 5, ValueError)):
+        try:
+            dec.decode(payload)
+            assert 0, payload
+        except err:
+            pass
+
+
+for test in (random_subsets, layouts, two_boards, fallbacks, bad_input):
+    test()
+    print(test.__name__, 'ok')
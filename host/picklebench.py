@@ -0,0 +1,70 @@
+''' Save/restore cost for the fread-write.py cases: old repr/eval pickle vs the binary pickle vs ujson.
+
+    python3 picklebench.py [rounds]           # PC
+    import picklebench; picklebench.main()     # Board: copy this file to /lib
+
+Each round is dumps + loads of the value (bytes in RAM, no flash writes). ujson has no array type, so the
+array goes through tuple() and back through array() like fread-write.py does. Size is the dumped bytes.
+'''
+
+try:
+    import upycompat            # On the PC
+except ImportError:
+    pass                        # On the board
+import ujson, utime
+from array import array
+import pickle
+
+def legacy_dumps(obj):
+    # lib/pickle.py before the binary format
+    return repr(obj).encode()
+
+def legacy_loads(s):
+    d = {}
+    s = s.decode()
+    if "(" in s:
+        qualname = s.split("(", 1)[0]
+        if "." in qualname:
+            pkg = qualname.rsplit(".", 1)[0]
+            mod = __import__(pkg)
+            d[pkg] = mod
+    return eval(s, d)
+
+def json_dumps(obj):
+    return ujson.dumps(tuple(obj) if isinstance(obj, array) else obj)
+
+def json_loads(s, typecode=None):
+    obj = ujson.loads(s)
+    return array(typecode, obj) if typecode else obj
+
+CASES = (
+    ('array f x10', array('f', range(10)), 'f'),
+    ('dict 2 keys', {"key1": 1, "key2": 2}, None),
+    ('config', {"pins": [34, 35, 32, 33], "vref": 3.3, "noise": 35, "maxInterval": 1000,
+                "keys": ["a0f", "a1f", "a2f", "a3f"], "name": "adc"}, None),
+)
+
+def bench(dumps, loads, obj, n):
+    s = dumps(obj)
+    t0 = utime.ticks_us()
+    for i in range(n):
+        loads(dumps(obj))
+    return len(s), utime.ticks_diff(utime.ticks_us(), t0) / n
+
+def main(n=500):
+    print('dumps + loads, us per round trip ({0} rounds)'.format(n))
+    for label, obj, tc in CASES:
+        rows = []
+        for name, dumps, loads in (('repr/eval', legacy_dumps, legacy_loads),
+                                   ('binary', pickle.dumps, pickle.loads),
+                                   ('ujson', json_dumps, lambda s: json_loads(s, tc))):
+            try:
+                size, us = bench(dumps, loads, obj, n)
+                rows.append('{0} {1:3d} B {2:7.1f} us'.format(name, size, us))
+            except Exception as e:      # repr/eval can't rebuild some values on some ports
+                rows.append('{0} failed ({1})'.format(name, type(e).__name__))
+        print('{0:<12} {1}'.format(label, '   '.join(rows)))
+
+if __name__ == "__main__":
+    import sys
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
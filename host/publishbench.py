@@ -0,0 +1,95 @@
+''' Publish path cost: the original umqttsimple publish vs the single-write buffered publish.
+
+    python3 publishbench.py [publishes]      # PC: publishes go over a real TCP socket to fakebroker
+    import publishbench; publishbench.main()  # Board: copy this file to /lib. Writes are only counted
+
+Reports publishes/sec, socket writes per publish and, on the board, heap bytes allocated per publish
+(gc.mem_alloc with the collector disabled). CPython has no equivalent allocation counter.
+'''
+
+try:
+    import upycompat            # On the PC
+except ImportError:
+    pass                        # On the board
+import gc, ujson, utime
+import ustruct as struct
+from umqttsimple import MQTTClient
+
+class CountingSock:
+    def __init__(self, sock=None):
+        self.sock = sock
+        self.writes = 0
+
+    def write(self, buf, n=None):
+        self.writes += 1
+        if self.sock is not None:
+            self.sock.write(buf, n)
+
+class LegacyClient(MQTTClient):
+    # publish as it was before the reusable buffer: new bytearray per call, one write per field
+    def _send_str(self, s):
+        self.sock.write(struct.pack("!H", len(s)))
+        self.sock.write(s)
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        pkt = bytearray(b"\x30\0\0\0")
+        pkt[0] |= qos << 1 | retain
+        sz = 2 + len(topic) + len(msg)
+        assert sz < 2097152
+        i = 1
+        while sz > 0x7f:
+            pkt[i] = (sz & 0x7f) | 0x80
+            sz >>= 7
+            i += 1
+        pkt[i] = sz
+        self.sock.write(pkt, i + 1)
+        self._send_str(topic)
+        self.sock.write(msg)
+
+def run(cls, n, payload, port):
+    client = cls(b'bench', '127.0.0.1', port)
+    if port:
+        client.connect()
+        client.sock = CountingSock(client.sock)
+    else:
+        client.sock = CountingSock()
+    topic = b'esp2nred/adc/esp'
+    msg = ujson.dumps(payload)
+    client.publish(topic, msg)                     # Warm up (topic cache)
+    client.sock.writes = 0
+    t0 = utime.ticks_us()
+    for i in range(n):
+        client.publish(topic, ujson.dumps(payload))
+    elapsed = utime.ticks_diff(utime.ticks_us(), t0)
+    writes = client.sock.writes / n
+    alloc = None
+    if hasattr(gc, 'mem_alloc'):
+        gc.collect()
+        gc.disable()
+        a0 = gc.mem_alloc()
+        for i in range(100):
+            client.publish(topic, msg)
+        alloc = (gc.mem_alloc() - a0) / 100
+        gc.enable()
+    return n * 1000000 / elapsed, writes, alloc
+
+def main(n=2000):
+    broker, port = None, 0
+    try:
+        from fakebroker import FakeBroker
+        broker = FakeBroker().start()
+        port = broker.port
+    except ImportError:
+        pass
+    payload = {'a0f': 1.6234, 'a1f': 0.0121, 'a2f': 3.3, 'a3f': 2.5}
+    print('{0} publishes of {1} ({2})'.format(n, ujson.dumps(payload), 'TCP to fakebroker' if port else 'counted writes'))
+    for label, cls in (('before', LegacyClient), ('after', MQTTClient)):
+        rate, writes, alloc = run(cls, n, payload, port)
+        print('{0:<7} {1:9.0f} publishes/sec  {2:.1f} writes/publish  {3} bytes allocated/publish'.format(
+            label, rate, writes, 'n/a' if alloc is None else '{0:.0f}'.format(alloc)))
+    if broker is not None:
+        broker.shutdown()
+
+if __name__ == "__main__":
+    import sys
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,241 @@
+''' quadrature.Quadrature and RotaryEncoder fed with synthetic edge sequences much faster than the main
+loop polls. Every step must be counted. Then timed edge traces (slow turns, fast flicks, contact bounce,
+glitches) replayed on a simulated ticks_us clock through RotaryEncoder polled every 100 ms: counts,
+glitch filter, acceleration and messages published. Runs on CPython, the pins and clock are simulated.
+
+    python3 quadraturetest.py
+'''
+
+import upycompat
+import random, sys, types, utime
+
+GRAY = (0b00, 0b01, 0b11, 0b10)        # +1 direction, state = a << 1 | b
+
+
+class FakePin:
+    IN, PULL_UP, IRQ_FALLING, IRQ_RISING = 1, 2, 2, 1
+
+    def __init__(self, id=None, mode=None, pull=None, v=1):
+        self.v = v
+        self.handler = None
+
+    def value(self):
+        return self.v
+
+    def irq(self, trigger=None, handler=None, hard=False):
+        self.handler = handler
+
+
+sys.modules.setdefault('machine', types.ModuleType('machine')).Pin = FakePin
+import quadrature
+from quadrature import Quadrature, schedule
+from rotaryencoder import RotaryEncoder
+
+
+class Knob:
+    # Turns the encoder: sets the pins and calls the handlers like the irq would
+    def __init__(self, a, b):
+        self.a, self.b = a, b
+        self.pos = GRAY.index(a.v << 1 | b.v)
+        self.truth = 0
+
+    def _set(self, step):
+        self.pos = (self.pos + step) % 4
+        self.truth += step
+        s = GRAY[self.pos]
+        changed = self.a if (s >> 1) != self.a.v else self.b
+        self.a.v, self.b.v = s >> 1, s & 1
+        return changed
+
+    def step(self, d):
+        pin = self._set(d)
+        pin.handler(pin)
+
+    def step2(self, d):
+        # Two edges before the handler runs: both handler calls see the final state
+        pins = (self._set(d), self._set(d))
+        for pin in pins:
+            pin.handler(pin)
+
+
+def clean_edges(rounds=100000):
+    rnd = random.Random(1)
+    a, b = FakePin(), FakePin()
+    quad = Quadrature(a, b, size=32)
+    knob = Knob(a, b)
+    poll = 0
+    for i in range(rounds):
+        knob.step(rnd.choice((1, -1)) if rnd.random() < 0.2 else 1)
+        poll -= 1
+        if poll <= 0:                   # Main loop polls every 1..200 edges, the ring (31 steps) overflows
+            assert quad.read() == knob.truth
+            poll = rnd.randint(1, 200)
+    assert quad.read() == knob.truth and quad.skips == 0
+    assert quad.over != 0               # The overflow path was used
+    print('clean edges: {0} steps, overflow {1}, ok'.format(rounds, quad.over))
+
+
+def missed_edges(bursts=5000):
+    # Fast spins: IRQ latency longer than the time between edges, two edges per handler run at times
+    rnd = random.Random(2)
+    a, b = FakePin(), FakePin()
+    quad = Quadrature(a, b, size=32)
+    knob = Knob(a, b)
+    pairs = 0
+    for i in range(bursts):
+        d = rnd.choice((1, -1))
+        knob.step(d)                    # First edge of a spin is seen on its own
+        for n in range(rnd.randint(0, 40)):
+            if rnd.random() < 0.3:
+                knob.step2(d)
+                pairs += 1
+            else:
+                knob.step(d)
+        if rnd.random() < 0.5:
+            assert quad.read() == knob.truth
+    assert quad.read() == knob.truth and quad.skips == pairs
+    print('missed edges: {0} double edges recovered, ok'.format(pairs))
+
+
+def bounce():
+    a, b = FakePin(), FakePin()
+    quad = Quadrature(a, b)
+    knob = Knob(a, b)
+    for i in range(1000):               # Contact bounce: a step and back, handler sees both
+        knob.step(1)
+        knob.step(-1)
+    assert quad.read() == 0 and knob.truth == 0
+    print('bounce ok')
+
+
+def onchange():
+    calls = []
+    scheduled = []
+    quadrature.schedule = lambda f, arg: scheduled.append((f, arg))
+    a, b = FakePin(), FakePin()
+    quad = Quadrature(a, b, onchange=lambda q: calls.append(q.read()))
+    knob = Knob(a, b)
+    for i in range(10):
+        knob.step(1)
+    assert len(scheduled) == 1          # Once per burst, not per edge
+    f, arg = scheduled.pop()
+    f(arg)
+    knob.step(1)
+    assert calls == [10] and len(scheduled) == 1
+    quadrature.schedule = schedule
+    print('onchange ok')
+
+
+def rotaryencoder():
+    enc = RotaryEncoder(15, 4, 25, 'RotEnc1Ci', 'RotEnc1Bi', glitch_us=0)   # Real clock, edges are microseconds apart
+    knob = Knob(enc.clkPin, enc.dtPin)
+    assert enc.getdata() is None
+    for i in range(3 * 4):              # 3 detents between two polls
+        knob.step(1)
+    assert enc.getdata() == {'RotEnc1Ci': 3, 'RotEnc1Bi': 1}
+    knob.step(-1)                       # Wobble around the detent
+    knob.step(1)
+    knob.step(1)
+    assert enc.getdata() is None
+    for i in range(7 * 4 + 1):
+        knob.step(-1)
+    assert enc.getdata()['RotEnc1Ci'] == -4
+    enc.button.v = 0
+    enc._button_callback(enc.button)
+    assert enc.getdata() == {'RotEnc1Ci': -4, 'RotEnc1Bi': 0}
+    print('rotaryencoder ok')
+
+
+def gesture(t, detents, period_us, d=1, bounce=0.0, rnd=None):
+    # Edge trace [(t_us, step)], detents at period_us, optional contact bounce (a step back and forth 50 us later)
+    trace = []
+    for i in range(detents * 4):
+        t += period_us // 4
+        trace.append((t, d))
+        if rnd is not None and rnd.random() < bounce:
+            trace += [(t + 50, -d), (t + 100, d)]
+    return t, trace
+
+
+def flicks(n, detents=10, period_us=6000, pause_us=300000, d=1):
+    # Fast spin of the knob, let go and grip again, n times
+    t, trace = 0, []
+    for i in range(n):
+        t, g = gesture(t + pause_us, detents, period_us, d)
+        trace += g
+    return trace
+
+
+def replay(enc, trace, poll_us=100000):
+    # Edges on the simulated clock, getdata every poll_us like the main loop. Returns the published messages
+    clock = [0]
+    utime.ticks_us = lambda: clock[0]
+    enc.t = enc.quad.t = 0
+    knob = Knob(enc.clkPin, enc.dtPin)
+    msgs = []
+    tpoll = poll_us
+    for t, step in trace + [(trace[-1][0] + 2 * poll_us, 0)]:
+        while tpoll <= t:
+            clock[0] = tpoll
+            out = enc.getdata()
+            if out is not None:
+                msgs.append(out['RotEnc1Ci'])
+            tpoll += poll_us
+        clock[0] = t
+        if step:
+            knob.step(step)
+    utime.ticks_us = ticks_us
+    return msgs
+
+
+def encoder(**kw):
+    return RotaryEncoder(15, 4, 25, 'RotEnc1Ci', 'RotEnc1Bi', **kw)
+
+
+def slow_turns():
+    # Fine adjustment with bouncy contacts: every detent counted once, acceleration does not kick in
+    rnd = random.Random(3)
+    t, up = gesture(0, 12, 150000, 1, 0.3, rnd)
+    t, down = gesture(t + 500000, 5, 200000, -1, 0.3, rnd)
+    for kw in ({}, {'accel': ACCEL}):
+        enc = encoder(**kw)
+        msgs = replay(enc, up + down)
+        # One message per detent, polls are faster than the turning
+        assert msgs == list(range(1, 13)) + list(range(11, 6, -1)), (kw, msgs)
+        assert enc.quad.count == 7 * 4 and enc.glitches == 0
+    print('slow turns: 17 detents, 17 messages, ok')
+
+
+def glitches():
+    # A full detent back and forth in 1 ms while turning (EMI on the pins): dropped, then the turn goes on
+    t, trace = gesture(0, 5, 30000)
+    trace += [(t + 300, -1), (t + 400, -1), (t + 500, -1), (t + 600, -1),
+              (t + 700, 1), (t + 800, 1), (t + 900, 1), (t + 1000, 1)]
+    t, more = gesture(t + 1000, 5, 30000)
+    enc = encoder()
+    assert replay(enc, trace + more)[-1] == 10 and enc.glitches == 1
+    enc = encoder(glitch_us=0)                  # Without the filter the glitch is counted
+    assert replay(enc, trace + more)[-1] == 10 and enc.glitches == 0
+    print('glitches ok')
+
+
+ACCEL = ((8000, 10), (20000, 4), (50000, 2))
+
+
+def acceleration():
+    # Cover a range of 200 with 10 detent flicks at 6 ms per detent: first detent of a flick x1, the rest x10
+    plain = encoder()
+    msgs_plain = replay(plain, flicks(20))
+    fast = encoder(accel=ACCEL)
+    msgs_fast = replay(fast, flicks(3))
+    assert msgs_plain[-1] == 200 and msgs_fast[-1] == 3 * (1 + 9 * 10)
+    assert len(msgs_fast) * 5 <= len(msgs_plain)
+    back = replay(fast, flicks(1, d=-1))        # Same speed the other way
+    assert back[-1] == 3 * 91 - 91
+    print('acceleration: range 200 in {0} messages without, {1} in {2} messages with acceleration, ok'.format(
+        len(msgs_plain), msgs_fast[-1], len(msgs_fast)))
+
+
+ticks_us = utime.ticks_us
+for test in (clean_edges, missed_edges, bounce, onchange, rotaryencoder, slow_turns, glitches, acceleration):
+    test()
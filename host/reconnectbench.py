@@ -0,0 +1,91 @@
+''' Time-to-recover from a broker outage: MQTTConnection reconnect vs the old reboot path. Runs on CPython.
+
+    python3 reconnectbench.py [outage_ms]
+
+The broker stand-in is stopped for outage_ms and started again on the same port.
+  reconnect    mqttconn.MQTTConnection in a 10 ms main loop. check_msg retries on backoff + jitter,
+               clean_session=False so the subscriptions survive and are not sent again
+  reboot       the old mqtt_reset(): sleep 5000 ms, reset, clean connect and subscribe every topic,
+               reset again 5000 ms later while the broker is still down. Boot and the Wi-Fi join are
+               not part of the host numbers, on the board they come on top of every reset
+down    = ms from the broker going away to the client connected and subscribed again
+recover = ms from the broker being back to the client connected and subscribed again
+samples = main loop passes (sensor reads) during the outage. The reboot path samples nothing.
+'''
+
+import upycompat
+import sys, threading, time
+from fakebroker import FakeBroker
+from umqttsimple import MQTTClient
+from mqttconn import MQTTConnection
+
+TOPICS = [b'nred2esp/servoZCMD/+', b'nred2esp/rotencoderZCMD/+', b'nred2esp/adcZCMD/+']
+RESET_SLEEP_MS = 5000   # mqtt_reset() in the old main.py
+
+def outage(broker, outage_ms):
+    # Stop now, start again outage_ms later from a thread. Returns [time stopped, time back (None until then)]
+    back = [time.monotonic(), None]
+    broker.stop()
+    def restart():
+        time.sleep(outage_ms / 1000)
+        broker.start()
+        back[1] = time.monotonic()
+    threading.Thread(target=restart).start()
+    return back
+
+def reconnect(broker, outage_ms):
+    client = MQTTClient(b'reconnect', '127.0.0.1', broker.port)
+    client.set_callback(lambda topic, msg: None)
+    conn = MQTTConnection(client, TOPICS, clean_session=False)
+    assert conn.connect()
+    back = outage(broker, outage_ms)
+    samples = 0
+    while not conn.connected or back[1] is None:
+        samples += 1                                   # A sensor read per pass keeps going
+        conn.check_msg()
+        time.sleep(0.01)
+    down, recover = (time.monotonic() - back[0]) * 1000, (time.monotonic() - back[1]) * 1000
+    broker.send(b'nred2esp/servoZCMD/0', b'40')        # Still subscribed without sending SUBSCRIBE again
+    got = []
+    client.set_callback(lambda topic, msg: got.append(msg))
+    t0 = time.monotonic()
+    while not got and time.monotonic() - t0 < 2:
+        conn.check_msg()
+    assert got == [b'40'], got
+    conn.disconnect()
+    return down, recover, samples, conn.resubscribes - 1, conn.attempts - 1
+
+def reboot(broker, outage_ms):
+    client = MQTTClient(b'reboot', '127.0.0.1', broker.port)
+    client.set_callback(lambda topic, msg: None)
+    client.connect()
+    back = outage(broker, outage_ms)
+    attempts = 0
+    while True:
+        time.sleep(RESET_SLEEP_MS / 1000)              # mqtt_reset(), then machine.reset()
+        attempts += 1
+        client = MQTTClient(b'reboot', '127.0.0.1', broker.port)
+        client.set_callback(lambda topic, msg: None)
+        try:
+            client.connect()
+            for topic in TOPICS:
+                client.subscribe(topic)
+            break
+        except (OSError, IndexError):
+            continue
+    down, recover = (time.monotonic() - back[0]) * 1000, (time.monotonic() - back[1]) * 1000
+    client.disconnect()
+    return down, recover, 0, 1, attempts
+
+def main(outage_ms=2000):
+    broker = FakeBroker().start()
+    print('broker down for {0} ms, {1} subscriptions'.format(outage_ms, len(TOPICS)))
+    for label, run in (('reconnect', reconnect), ('reboot', reboot)):
+        down, recover, samples, resubs, attempts = run(broker, outage_ms)
+        print('{0:<10} down {1:6.0f} ms  recover {2:6.0f} ms  samples during outage {3:4d}  resubscribes {4}  connect attempts {5}'.format(
+            label, down, recover, samples, resubs, attempts))
+    print('reboot path also pays boot + Wi-Fi join on every reset (not simulated)')
+    broker.shutdown()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
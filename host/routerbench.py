@@ -0,0 +1,86 @@
+''' Incoming message dispatch cost: the old regex mqtt_on_message vs router.TopicRouter, 1/10/100 devices.
+
+    python3 routerbench.py [messages]       # PC
+    import routerbench; routerbench.main()   # Board: copy this file to /lib
+
+Each device subscribes nred2esp/<lvl2>ZCMD/+ and messages cycle through every device with servo IDs 0-3.
+  regex    re.match on the topic, group list, then the lvl2 compared device by device (old mqtt_on_message)
+  router   TopicRouter.route with the default cachesize=32 that main.py uses. Past 8 devices there are
+           more topics than cache slots, the topics beyond the first 32 walk the trie every time
+  cached   TopicRouter(cachesize=4*devices), every topic cached (best case, not what the firmware runs)
+Before timing, both are checked to call the same handler with the same ID for every topic.
+'''
+
+try:
+    import upycompat            # On the PC
+except ImportError:
+    pass                        # On the board
+import re, utime
+from router import TopicRouter
+
+REGEX = rb'nred2esp/([^/]+)/([^/]+)'
+
+def setup(ndev, cachesize=32):
+    hits = [0] * ndev
+    lvl2s = [b'dev' + str(i).encode() + b'ZCMD' for i in range(ndev)]
+    def handler(i):
+        def f(topic, msg, params):
+            hits[i] += int(params[0]) + 1
+        return f
+    handlers = [handler(i) for i in range(ndev)]
+    router = TopicRouter(cachesize=cachesize)
+    for i in range(ndev):
+        router.add(b'nred2esp/' + lvl2s[i] + b'/+', handlers[i])
+    def regex_on_message(topic, msg):
+        msgmatch = re.match(REGEX, topic)
+        if msgmatch:
+            mqtt_topic = [msgmatch.group(0), msgmatch.group(1), msgmatch.group(2)]
+            for i in range(ndev):
+                if mqtt_topic[1] == lvl2s[i]:
+                    hits[i] += int(mqtt_topic[2]) + 1
+                    return
+    topics = [b'nred2esp/' + lvl2s[i] + b'/' + str(k).encode() for k in range(4) for i in range(ndev)]
+    return hits, router, regex_on_message, topics
+
+def check(ndev):
+    hits, router, regex_on_message, topics = setup(ndev)
+    for topic in topics:
+        regex_on_message(topic, b'75')
+    expect = hits[:]
+    for i in range(ndev):
+        hits[i] = 0
+    for topic in topics:
+        assert router.route(topic, b'75') == 1
+    assert hits == expect, (hits, expect)
+    assert router.route(b'nred2esp/other/0', b'75') == 0
+    seen = []
+    router.add(b'nred2esp/#', lambda topic, msg, params: seen.append(params))
+    router.add(b'+/dev0ZCMD/+', lambda topic, msg, params: seen.append(params))
+    assert router.route(b'nred2esp/dev0ZCMD/3', b'75') == 3
+    assert seen == [(b'dev0ZCMD/3',), (b'nred2esp', b'3')], seen
+    assert router.route(b'nred2esp', b'75') == 1 and seen[-1] == (b'',)
+
+def bench(ndev, n):
+    hits, router, regex_on_message, topics = setup(ndev)
+    cached = setup(ndev, 4 * ndev)[1]
+    out = []
+    for f in (regex_on_message, router.route, cached.route):
+        for topic in topics:
+            f(topic, b'75')                       # Warm up, fills the router cache
+        t0 = utime.ticks_us()
+        for k in range(n):
+            f(topics[k % len(topics)], b'75')
+        out.append(utime.ticks_diff(utime.ticks_us(), t0) / n)
+    return out
+
+def main(n=2000):
+    print('dispatch us/message ({0} messages)'.format(n))
+    for ndev in (1, 10, 100):
+        check(ndev)
+        regex_us, router_us, cached_us = bench(ndev, n)
+        print('{0:4d} devices  regex {1:7.2f}  router {2:7.2f} ({3:.1f}x)  cached {4:7.2f} ({5:.1f}x)'.format(
+            ndev, regex_us, router_us, regex_us / router_us, cached_us, regex_us / cached_us))
+
+if __name__ == "__main__":
+    import sys
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
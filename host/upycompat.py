@@ -0,0 +1,85 @@
+''' Run lib/ modules under CPython on the PC. Import this first in any host script.
+Puts lib/ on sys.path and registers the MicroPython module names that lib/ imports
+(utime, ustruct, ubinascii, ujson, uos, usocket, ulogging) backed by their CPython equivalents.
+usocket.socket gets the MicroPython stream API (read/write/readinto) on top of a CPython socket.
+Only what the host scripts in this folder need, machine/network are not provided.
+'''
+
+import sys, os, time, struct, binascii, json, logging, socket as _socket, types
+
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+if LIB not in sys.path:
+    sys.path.insert(0, LIB)
+
+# utime: ticks wrap at 2**30 like the esp32 port
+_TICKS_PERIOD = 1 << 30
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+utime = types.ModuleType('utime')
+utime.ticks_ms = lambda: int(time.monotonic() * 1000) % _TICKS_PERIOD
+utime.ticks_us = lambda: int(time.monotonic() * 1000000) % _TICKS_PERIOD
+utime.ticks_add = lambda t, delta: (t + delta) % _TICKS_PERIOD
+utime.ticks_diff = lambda a, b: ((a - b + _TICKS_HALF) % _TICKS_PERIOD) - _TICKS_HALF
+utime.sleep_ms = lambda ms: time.sleep(ms / 1000)
+utime.sleep_us = lambda us: time.sleep(us / 1000000)
+utime.sleep = time.sleep
+utime.time = time.time
+utime.localtime = time.localtime
+
+
+class _StreamSocket:
+    # MicroPython sockets are streams: read(n) returns None when a non-blocking socket has no data
+    # and b'' when the peer closed. write(buf, n) writes the first n bytes
+    def __init__(self, sock=None):
+        self.s = sock or _socket.socket()
+
+    def connect(self, addr):
+        self.s.connect(addr)
+        self.s.setsockopt(_socket.IPPROTO_TCP, _socket.TCP_NODELAY, 1)
+
+    def setblocking(self, flag):
+        self.s.setblocking(flag)
+
+    def settimeout(self, t):
+        self.s.settimeout(t)
+
+    def read(self, n):
+        buf = b''
+        while len(buf) < n:
+            try:
+                chunk = self.s.recv(n - len(buf))
+            except BlockingIOError:
+                if not buf:
+                    return None
+                self.s.setblocking(True)   # Finish a partial read like a MicroPython stream would
+                continue
+            if not chunk:
+                break
+            buf += chunk
+        return buf
+
+    def readinto(self, buf, n=None):
+        try:
+            return self.s.recv_into(buf, n or len(buf))
+        except BlockingIOError:
+            return None
+
+    def write(self, buf, n=None):
+        if isinstance(buf, str):           # MicroPython streams accept str
+            buf = buf.encode()
+        if n is not None:
+            buf = memoryview(buf)[:n]
+        self.s.sendall(buf)
+        return len(buf)
+
+    def close(self):
+        self.s.close()
+
+
+usocket = types.ModuleType('usocket')
+usocket.socket = _StreamSocket
+usocket.getaddrinfo = _socket.getaddrinfo
+
+for name, mod in (('utime', utime), ('ustruct', struct), ('ubinascii', binascii), ('ujson', json),
+                  ('uos', os), ('usocket', usocket), ('ulogging', logging)):  # getLogger/info/debug(fmt, *args) match
+    sys.modules.setdefault(name, mod)
@@ -1,4 +1,4 @@
-''' esp32 ADC.  If any channel has a delta (current-previous) that is above the
+''' esp32 ADC.  If any channel has a delta (current - last reported) that is above the
 noise threshold or if the max Time interval exceeded then the 
 voltage from all initialized channels will be returned.
  When creating object, pass: pins, Vref, noise threshold, and max time interval
@@ -9,66 +9,141 @@ Noise is in raw ADC
 
 Max time interval is used to catch drift/creep that is below the noise threshold.
 
+Each channel is read oversample times per getdata into one preallocated array('H') block (raw, channel x
+is raw[x*oversample:(x+1)*oversample]). The reads are summed as integers and the noise threshold is
+compared against the sums (noiseThreshold * oversample), so there is no division. The voltage is the
+sum times a scale worked out once (vref / 4095 / oversample). Keys and the returned dict are reused,
+don't keep a reference to it across calls (pubqueue.PublishQueue copies it at put).
+
+filters (optional) is one filter per channel from adcfilter.py (EMA, Median, Deadband, Chain) or None
+for a raw channel. The change check and the voltage both use the filtered sum.
+
+noiseThreshold and maxInterval can be a list with one value per channel. With delta=True each channel is
+tracked on its own and getdata returns only the channels that changed or whose maxInterval ran out, so
+one noisy pin no longer sends every channel. snapshot (ms, optional) sends all channels that often
+anyway, for a consumer that has just (re)subscribed. payload.SchemaJSON/SchemaStruct encode a subset
+of the keys as is.
+
 '''
 
 from machine import Pin, ADC
 import utime, ulogging
-from timer import TimerFunc
+from array import array
+#from timer import TimerFunc  # Only needed with the @TimerFunc below uncommented
 
 class espADC:
-    def __init__(self, pinlist, vref=3.3, noiseThreshold=35, maxInterval=1000, logger=None):
+    def __init__(self, pinlist, vref=3.3, noiseThreshold=35, maxInterval=1000, logger=None, oversample=16, filters=None,
+                 delta=False, snapshot=None):
         self.vref = vref
         self.numOfChannels = len(pinlist)
         if logger is not None:                         # Use logger passed as argument
             self.logger = logger
         else:                                          # Root logger already exists and no custom logger passed
             self.logger = ulogging.getLogger(__name__) # Create from root logger
-        self.logger.info("ADC setting up {0} channels. Vref:{1} NoiseTh:{2} MaxIntvl:{3}sec".format(self.numOfChannels, vref, noiseThreshold, maxInterval/1000))
+        self.logger.info("ADC setting up {0} channels. Vref:{1} NoiseTh:{2} MaxIntvl:{3}ms".format(self.numOfChannels, vref, noiseThreshold, maxInterval))
         self.chan = []
         for i, pin in enumerate(pinlist):
             self.chan.append(ADC(Pin(pin)))
             self.chan[i].atten(ADC.ATTN_11DB) # Full range: 0-3.3V
         self.logger.info("ADC setup:{0}".format(self.chan))   
-        self.noiseThreshold = noiseThreshold
-        self.numOfSamples = 3
-        self.sensorAve = [x for x in range(self.numOfChannels)]
-        self.sensorLastRead = [x for x in range(self.numOfChannels)]
-        for x in range(self.numOfChannels): # initialize the first read for comparison later
-            self.sensorLastRead[x] = self.chan[x].read()
+        self.noiseThreshold = self._perchannel(noiseThreshold)
+        self.numOfSamples = oversample
+        self.threshold = [t * oversample for t in self.noiseThreshold]  # Compared against sums of oversample reads
+        self.scale = vref / 4095 / oversample              # Sum of reads -> volts
+        self.reads = [c.read for c in self.chan]           # Bound once
+        self.keys = ['a' + str(x) + 'f' for x in range(self.numOfChannels)]
+        self.raw = array('H', bytes(2 * self.numOfChannels * oversample))
+        self.sensorSum = array('L', [0] * self.numOfChannels)
+        self.filters = filters if filters is not None else [None] * self.numOfChannels
+        self.sensorLastRead = array('L', [c.read() * oversample for c in self.chan])  # First read for comparison later
+        for x, f in enumerate(self.filters):
+            if f is not None:
+                self.sensorLastRead[x] = f(self.sensorLastRead[x])
         self.voltage = {}
-        self.sensor = [[x for x in range(0, self.numOfSamples)] for x in range(0, self.numOfChannels)]
-        self.maxInterval = maxInterval # interval in ms to check for update
-        self.time0 = utime.ticks_ms()   # time 0
+        self.changed = {}                                  # Channels to send, delta mode
+        self.maxInterval = self._perchannel(maxInterval)   # interval in ms to check for update
+        self.time0 = [utime.ticks_ms()] * self.numOfChannels  # time 0, per channel
+        self.delta = delta
+        self.snapshot = snapshot
+        self.snapshot0 = utime.ticks_ms()
+
+    def _perchannel(self, value):
+        if isinstance(value, (list, tuple)):
+            if len(value) != self.numOfChannels:
+                raise ValueError('need one value per channel: {0}'.format(value))
+            return list(value)
+        return [value] * self.numOfChannels
     
-    def _valmap(self, value, istart, istop, ostart, ostop):
-        return ostart + (ostop - ostart) * ((value - istart) / (istop - istart))
+    def sample(self):
+        # Read every channel oversample times into raw and sum the reads per channel into sensorSum
+        raw, sums, n = self.raw, self.sensorSum, self.numOfSamples
+        j = 0
+        for x in range(self.numOfChannels):
+            read = self.reads[x]
+            acc = 0
+            for i in range(n):
+                v = read()
+                raw[j] = v
+                acc += v
+                j += 1
+            sums[x] = acc
+        return sums
 
     #@TimerFunc  # Can uncomment to see how long it takes to get readings
     def getdata(self):
-        sensorChanged = False
-        timelimit = False
-        if utime.ticks_diff(utime.ticks_ms(), self.time0) > self.maxInterval:
-            timelimit = True
+        now = utime.ticks_ms()
+        sums = self.sample()
+        last, threshold, scale, keys, voltage = self.sensorLastRead, self.threshold, self.scale, self.keys, self.voltage
+        filters, time0, maxInterval, changed = self.filters, self.time0, self.maxInterval, self.changed
+        changed.clear()
         for x in range(self.numOfChannels):
-            for i in range(self.numOfSamples):  # get samples points from analog pin and average
-                self.sensor[x][i] = self.chan[x].read()
-                #self.logger.debug("chan:{0} raw:{1}".format(x, self.sensor[x][i]))
-            self.sensorAve[x] = sum(self.sensor[x])/len(self.sensor[x])
-            if abs(self.sensorAve[x] - self.sensorLastRead[x]) > self.noiseThreshold:
-                sensorChanged = True
-            #self.logger.debug("delta from last read: {0}".format(self.sensorAve[x] - self.sensorLastRead[x]))
-            self.sensorLastRead[x] = self.sensorAve[x]
-            self.voltage['a' + str(x) + 'f'] = self._valmap(self.sensorAve[x], 0, 4095, 0, self.vref) # 4mV change is approx 500
-            #self.logger.debug("chan:{0} V:{1}".format(x, self.voltage))
-        if sensorChanged or timelimit:
-            self.time0 = utime.ticks_ms()
-            return self.voltage
+            acc = sums[x]
+            f = filters[x]
+            if f is not None:
+                sums[x] = acc = f(acc)
+            v = voltage[keys[x]] = acc * scale  # 4mV change is approx 5 raw
+            # Against the last reported value, so a filter ramping in steps below the threshold still adds up
+            if acc - last[x] > threshold[x] or last[x] - acc > threshold[x] or utime.ticks_diff(now, time0[x]) > maxInterval[x]:
+                changed[keys[x]] = v
+        snapshot = self.delta and self.snapshot is not None and utime.ticks_diff(now, self.snapshot0) > self.snapshot
+        if self.delta and not snapshot:
+            if changed:
+                for x in range(self.numOfChannels):
+                    if keys[x] in changed:
+                        time0[x] = now
+                        last[x] = sums[x]
+                return changed
+        elif changed or snapshot:       # All channels: any channel changed (delta=False) or time for a snapshot
+            self.snapshot0 = now
+            for x in range(self.numOfChannels):
+                time0[x] = now
+                last[x] = sums[x]
+            return voltage
 
 if __name__ == "__main__":
-    import time
-    # Run main loop
+    import gc, time
     pinlist = [34, 35]
-    adc = espADC(pinlist, 3.3, 40, 10000, setupinfo=True, debuginfo=True)
+
+    def measure(label, adc, n=100):
+        t0 = utime.ticks_us()
+        for i in range(n):
+            adc.getdata()
+        us = utime.ticks_diff(utime.ticks_us(), t0) / n
+        gc.collect()
+        a0 = gc.mem_alloc()
+        adc.getdata()
+        print('{0}: {1:.0f} samples/s, {2:.0f} us/getdata, {3} B alloc/getdata'.format(
+            label, len(pinlist) * adc.numOfSamples * 1000000 / us, us, gc.mem_alloc() - a0))
+
+    try:
+        from adcbench import LegacyADC      # host/adcbench.py copied to /lib, the getdata before the array block
+        measure('old, 3 samples', LegacyADC(pinlist, 3.3, 40, 10000))
+    except ImportError:
+        print('Copy host/adcbench.py to /lib to measure the old getdata too')
+    for oversample in (16, 64):
+        adc = espADC(pinlist, 3.3, 40, 10000, oversample=oversample)
+        measure('oversample {0}'.format(oversample), adc)
+    # Run main loop
     while True:
         print(adc.getdata())
         time.sleep(1)
\ No newline at end of file
@@ -0,0 +1,82 @@
+''' Per-channel filters for espADC (adc.py). Integers in, integers out, nothing allocated per call.
+
+    from adcfilter import EMA, Median, Deadband, Chain
+    adc = espADC([34, 35], noiseThreshold=0, filters=[Chain(Median(5), Deadband(32 * 16)), EMA(3)])
+
+Values are what espADC works with: the sum of oversample reads (raw * oversample), so give Deadband
+bands in those units. espADC reports a channel as changed when its filtered value moved by more than
+noiseThreshold since the value it last reported, so an EMA ramp made of small steps is still reported
+once it has moved that far.
+
+EMA(shift)      exponential moving average, weight 1/2**shift on the new value. Smooths white noise,
+                a step shows up gradually (about 2**shift reads to get 63% of the way)
+Median(n)       median of the last n values (n odd). Drops spikes shorter than n/2 reads, a step
+                passes whole after n/2 reads
+Deadband(band)  hysteresis: the output holds until the input is more than band away, then jumps to it.
+                Noise inside the band never changes the output, so with noiseThreshold=0 a report
+                is a real change
+Chain(f, ...)   runs filters in order
+'''
+
+from array import array
+
+class EMA:
+    def __init__(self, shift=3):
+        self.shift = shift
+        self.acc = None                # Value << shift, fixed point
+
+    def __call__(self, x):
+        if self.acc is None:
+            self.acc = x << self.shift
+        else:
+            self.acc += x - (self.acc >> self.shift)
+        return self.acc >> self.shift
+
+class Median:
+    def __init__(self, n=5):
+        self.n = n
+        self.ring = array('L', [0] * n)    # Last n values, oldest at pos
+        self.sorted = array('L', [0] * n)  # Same values kept in order
+        self.pos = 0
+        self.count = 0
+
+    def __call__(self, x):
+        ring, s, n = self.ring, self.sorted, self.n
+        if self.count < n:             # Filling up
+            i = self.count
+            self.count += 1
+        else:                          # Take the oldest value out of the sorted array
+            old = ring[self.pos]
+            i = 0
+            while s[i] != old:
+                i += 1
+            while i < n - 1:
+                s[i] = s[i + 1]
+                i += 1
+        ring[self.pos] = x
+        self.pos = (self.pos + 1) % n
+        while i > 0 and s[i - 1] > x:  # Insert x in order
+            s[i] = s[i - 1]
+            i -= 1
+        s[i] = x
+        return s[self.count >> 1]
+
+class Deadband:
+    def __init__(self, band):
+        self.band = band
+        self.out = None
+
+    def __call__(self, x):
+        out = self.out
+        if out is None or x - out > self.band or out - x > self.band:
+            self.out = out = x
+        return out
+
+class Chain:
+    def __init__(self, *filters):
+        self.filters = filters
+
+    def __call__(self, x):
+        for f in self.filters:
+            x = f(x)
+        return x
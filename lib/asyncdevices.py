@@ -0,0 +1,26 @@
+''' Device polling as independent coroutines for the asyncio runtime (see umqttasync).
+Each device gets its own task so a slow read or a publish waiting on the network never delays
+another device's sampling.
+
+    asyncio.create_task(poll(rotenc.getdata, 10, publisher(client, pubtopic, ujson.dumps)))
+    asyncio.create_task(poll(updateServo, 20))
+'''
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+async def poll(getdata, period_ms, onchange=None):
+    # Call getdata every period_ms. When it returns something other than None, await onchange(data)
+    while True:
+        data = getdata()
+        if data is not None and onchange is not None:
+            await onchange(data)
+        await asyncio.sleep(period_ms / 1000)
+
+def publisher(client, topic, encode):
+    # onchange coroutine for poll() that publishes encode(data) on topic
+    async def publish(data):
+        await client.publish(topic, encode(data))
+    return publish
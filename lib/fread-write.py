@@ -28,11 +28,18 @@ with open('log.py', 'r') as f:
 
 z = ujson.load(f)
 print(z)
-''' To use pickle just search/replace ujson with pickle
+
+import pickle
+with open('test.pkl', 'wb') as f:   # pickle is binary: 'wb'/'rb', not 'w'/'r'
+    pickle.dump(array('f', range(10)), f)   # No tuple() needed, arrays are supported
+with open('test.pkl', 'rb') as f:
+    z = pickle.load(f)
+print(z)
+''' To use pickle replace ujson with pickle and open the files in binary mode ('wb'/'rb')
 
 JSON (universal format that works with other languages like js) supports most Python data types
-pickle (python specific) supports all python types
-Have to convert arrays to tuple since it is not a native data type
+pickle (python specific, binary) supports None, bool, int, float, str, bytes, list, tuple, dict and array
+Have to convert arrays to tuple for JSON since it is not a native data type
 '''
 dir(uos)
 dir(f)
@@ -0,0 +1,144 @@
+''' Connection manager around umqttsimple.MQTTClient. Replaces the reboot on a lost broker connection.
+A failed check_msg/publish marks the link down instead of raising into the main loop. check_msg() then
+retries the connect on an exponential backoff with jitter (backoff_ms doubling up to backoff_max_ms, each wait
+random between half and all of it), and only when wlan (network.WLAN) reports connected, so nothing ever
+busy-waits on Wi-Fi. The main loop keeps sampling devices the whole time. Publishes made while down raise OSError (PublishQueue stores them in its outbox).
+
+clean_session=False asks the broker to keep the subscriptions (and queued qos 1 messages) between connects.
+topics are subscribed on the first connect after boot (the broker session may be stale, from before topics
+were added), after that only again when the CONNACK says the broker has no session for this client id.
+onconnect(conn) runs after every successful connect (ex: publish a status message). If it fails the
+connect counts as failed and is retried on the backoff. A refused connect (MQTTException), a failed
+subscribe or a broker that doesn't answer within the client's connect_timeout all back off the same way.
+
+stats: outages, connect attempts, resubscribes and time-to-recover (ms from losing the link to connected again).
+report() logs them.
+'''
+
+import utime, ulogging
+from umqttsimple import MQTTException
+try:
+    import urandom as random
+except:
+    import random
+
+class MQTTConnection:
+    def __init__(self, client, topics=(), wlan=None, clean_session=False, backoff_ms=500, backoff_max_ms=4000, onconnect=None, logger=None):
+        self.client = client
+        self.topics = topics             # Filters to subscribe to. Can be the list setup_device appends to
+        self.wlan = wlan
+        self.clean_session = clean_session
+        self.backoff_ms = backoff_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.onconnect = onconnect
+        if logger is not None:                         # Use logger passed as argument
+            self.logger = logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = ulogging.getLogger(__name__) # Create from root logger
+        self.connected = False
+        self.subscribed = False          # Subscribed since boot
+        self.delay = backoff_ms
+        self.retry_at = utime.ticks_ms()
+        self.down_at = None              # ticks_ms the link was lost (None before the first connect)
+        self.connecting = False          # Inside connect(): a failing onconnect publish is that attempt failing, not an outage
+        self.outages = 0
+        self.attempts = 0
+        self.resubscribes = 0
+        self.recover_count = 0
+        self.recover_total = 0
+        self.recover_max = 0
+
+    def connect(self):
+        # One attempt, now. True when connected and subscribed
+        if self.wlan is not None and not self.wlan.isconnected():
+            return False                 # Wi-Fi still joining, not worth a socket attempt
+        self.attempts += 1
+        self.connecting = True
+        try:
+            present = self.client.connect(self.clean_session)
+            if not present or not self.subscribed:
+                for topic in self.topics:
+                    self.client.subscribe(topic)
+                self.subscribed = True
+                self.resubscribes += 1
+            self.connected = True        # onconnect publishes through self
+            if self.onconnect is not None:
+                self.onconnect(self)
+        except (OSError, MQTTException, IndexError, TypeError, AssertionError) as e:  # Refused, reset, timeout or a short/garbled CONNACK
+            self.connected = False
+            self._close()
+            wait = self.delay // 2 + random.getrandbits(16) % (self.delay // 2 + 1)  # Jitter so devices don't retry in step
+            self.delay = min(self.delay * 2, self.backoff_max_ms)
+            self.retry_at = utime.ticks_add(utime.ticks_ms(), wait)
+            self.logger.debug('Connect attempt %d failed (%s), retry in %d ms', self.attempts, e, wait)
+            return False
+        finally:
+            self.connecting = False
+        self.delay = self.backoff_ms
+        if self.down_at is not None:
+            ms = utime.ticks_diff(utime.ticks_ms(), self.down_at)
+            self.recover_count += 1
+            self.recover_total += ms
+            self.recover_max = max(self.recover_max, ms)
+            self.down_at = None
+            self.logger.info('Reconnected in %d ms (session %s)', ms, 'resumed' if present else 'new, resubscribed')
+        return True
+
+    def _close(self):
+        try:
+            self.client.sock.close()
+        except (OSError, AttributeError):
+            pass
+
+    def _lost(self, e):
+        self.connected = False
+        self.outages += 1
+        self.down_at = utime.ticks_ms()
+        self.retry_at = self.down_at     # First retry straight away, backoff after that
+        self._close()
+        self.logger.warning('MQTT connection lost (%s). Reconnecting in the background', e)
+
+    def check_msg(self):
+        # Call from the main loop. Processes an incoming packet when up, tries a reconnect when due while down
+        if self.connected:
+            try:
+                return self.client.check_msg()
+            except (OSError, MQTTException) as e:
+                self._lost(e)
+        elif utime.ticks_diff(utime.ticks_ms(), self.retry_at) >= 0:
+            self.connect()
+        return None
+
+    def drain(self, max_pkts=16, budget_us=5000):
+        # check_msg with a packet/time budget, see MQTTClient.drain. Returns (processed, remaining)
+        if self.connected:
+            try:
+                return self.client.drain(max_pkts, budget_us)
+            except (OSError, MQTTException) as e:
+                self._lost(e)
+        elif utime.ticks_diff(utime.ticks_ms(), self.retry_at) >= 0:
+            self.connect()
+        return 0, 0
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        if not self.connected:
+            raise OSError(-1)
+        try:
+            return self.client.publish(topic, msg, retain, qos)
+        except OSError as e:
+            if not self.connecting:      # connect() closes and backs off itself, keeping the outage's down_at
+                self._lost(e)
+            raise
+
+    def disconnect(self):
+        if self.connected:
+            self.connected = False
+            try:
+                self.client.disconnect()
+            except OSError:
+                pass
+
+    def report(self):
+        self.logger.info('MQTTConnection outages:%d attempts:%d resubscribes:%d recovered:%d mean:%d ms max:%d ms',
+                         self.outages, self.attempts, self.resubscribes, self.recover_count,
+                         self.recover_total // self.recover_count if self.recover_count else 0, self.recover_max)
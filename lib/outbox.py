@@ -0,0 +1,176 @@
+''' Store-and-forward queue for publishes made while the broker is unreachable.
+Messages go into a small in-RAM head list first and are appended to flash in batches, into
+numbered segment files (outbox/0.q, outbox/1.q ...). Once the broker is back, drain() sends them
+oldest first, at most maxmsgs per call and no more often than every drain_ms, so the backlog does not
+starve the main loop. Fully sent segments are deleted.
+
+Flash use is bounded to roughly segbytes * maxsegs. When full the oldest segment is dropped
+(dropped counts the segments lost). The read position is saved in outbox/rd so the queue survives a
+reboot. To spare the flash it is only written when it moved, and then only when drain() finishes a
+segment or every save_every records. Call sync() before a reset to push the RAM head and the read
+position to flash. Delivery is at-least-once: messages sent after the last saved read position can be
+sent again after a reboot.
+
+Record framing: magic 0xA5 (B), flags (B: bit0 retain, bits1-2 qos), topic len (H), msg len (H),
+topic, msg. A torn record at the end of a segment (power loss mid write) is skipped. Writing starts in a
+new segment after every start-up so nothing is ever appended behind a torn record.
+'''
+
+import uos, utime
+import ustruct as struct
+
+_MAGIC = 0xA5
+_HDR = "<BBHH"
+_HDRLEN = 6
+
+class Outbox:
+    def __init__(self, path='outbox', segbytes=4096, maxsegs=8, headmax=8, drain_ms=100, save_every=50):
+        self.path = path
+        self.segbytes = segbytes
+        self.maxsegs = maxsegs
+        self.headmax = headmax
+        self.drain_ms = drain_ms
+        self.save_every = save_every
+        self.head = []                  # Encoded records not yet on flash
+        self.dropped = 0
+        self.t0 = utime.ticks_add(utime.ticks_ms(), -drain_ms)
+        try:
+            uos.mkdir(path)
+        except OSError:
+            pass                        # Already exists
+        self.segs = sorted([int(name[:-2]) for name in uos.listdir(path) if name.endswith('.q')])
+        self.wseg = self.segs[-1] + 1 if self.segs else 0  # Fresh segment: the last one may end in a torn record
+        self.wsize = 0
+        self.rseg, self.roff = self.segs[0] if self.segs else 0, 0
+        self.saved = None               # Read position in outbox/rd, None when there is no file
+        self.unsaved = 0                # Records sent since it was last written
+        try:
+            with open(self._name('rd'), 'r') as f:
+                rseg, roff = f.read().split()
+            self.saved = (int(rseg), int(roff))
+            if self.saved[0] in self.segs:
+                self.rseg, self.roff = self.saved
+        except (OSError, ValueError):
+            pass
+
+    def _name(self, seg):
+        return "%s/%s" % (self.path, seg if seg == 'rd' else "%d.q" % seg)
+
+    def _size(self, seg):
+        try:
+            return uos.stat(self._name(seg))[6]
+        except OSError:
+            return 0
+
+    def pending(self):
+        return bool(self.head or self.segs)
+
+    def put(self, topic, msg, retain=False, qos=0):
+        if isinstance(msg, str):
+            msg = msg.encode()
+        elif not isinstance(msg, bytes):
+            msg = bytes(msg)            # bytearray/memoryview from a reused encode buffer
+        self.head.append(struct.pack(_HDR, _MAGIC, retain | qos << 1, len(topic), len(msg)) + topic + msg)
+        if len(self.head) >= self.headmax:
+            self._append()
+
+    def sync(self):
+        # RAM head and read position to flash
+        self._append()
+        self._save()
+
+    def _append(self):
+        # Append the RAM head to the current segment in one write
+        if not self.head:
+            return
+        batch = b''.join(self.head)
+        self.head.clear()
+        if self.wsize and self.wsize + len(batch) > self.segbytes:
+            self.wseg += 1
+            self.wsize = 0
+        if self.wseg not in self.segs:
+            self.segs.append(self.wseg)
+            while len(self.segs) > self.maxsegs:    # Over budget, lose the oldest data
+                old = self.segs.pop(0)
+                uos.remove(self._name(old))
+                self.dropped += 1
+                if self.rseg == old:
+                    self.rseg, self.roff = self.segs[0], 0
+        with open(self._name(self.wseg), 'ab') as f:
+            f.write(batch)
+        self.wsize += len(batch)
+
+    def _save(self):
+        # Write the read position, only if it moved since the last write
+        pos = (self.rseg, self.roff) if self.segs else None
+        if pos != self.saved:
+            if pos is None:
+                try:
+                    uos.remove(self._name('rd'))
+                except OSError:
+                    pass
+            else:
+                with open(self._name('rd'), 'w') as f:
+                    f.write("%d %d" % pos)
+            self.saved = pos
+        self.unsaved = 0
+
+    def _read(self, n):
+        # Up to n (topic, msg, retain, qos, next offset) from the read segment. Fewer means the segment is used up
+        out = []
+        try:
+            f = open(self._name(self.rseg), 'rb')
+        except OSError:
+            return out
+        with f:
+            f.seek(self.roff)
+            off = self.roff
+            while len(out) < n:
+                hdr = f.read(_HDRLEN)
+                if len(hdr) < _HDRLEN:
+                    break
+                magic, flags, tlen, mlen = struct.unpack(_HDR, hdr)
+                body = f.read(tlen + mlen)
+                if magic != _MAGIC or len(body) < tlen + mlen:
+                    break               # Torn or corrupt tail, nothing usable after it
+                off += _HDRLEN + tlen + mlen
+                out.append((body[:tlen], body[tlen:], flags & 1, flags >> 1 & 3, off))
+        return out
+
+    def _next_segment(self):
+        # Read segment is used up. Delete it and move on
+        uos.remove(self._name(self.rseg))
+        self.segs.remove(self.rseg)
+        if self.rseg == self.wseg:
+            self.wsize = 0
+        self.rseg, self.roff = (self.segs[0], 0) if self.segs else (self.wseg, 0)
+
+    def drain(self, client, maxmsgs=10):
+        # Publish up to maxmsgs, oldest first. Returns the number sent. An OSError from publish is
+        # raised, the failed message is retried next time
+        if utime.ticks_diff(utime.ticks_ms(), self.t0) < self.drain_ms:
+            return 0
+        self.t0 = utime.ticks_ms()
+        sent = 0
+        try:
+            while sent < maxmsgs and self.segs:
+                want = maxmsgs - sent
+                batch = self._read(want)
+                for topic, msg, retain, qos, off in batch:
+                    client.publish(topic, msg, retain, qos)
+                    self.roff = off
+                    self.unsaved += 1
+                    sent += 1
+                if len(batch) < want:
+                    self._next_segment()
+            while sent < maxmsgs and self.head and not self.segs:
+                rec = self.head[0]
+                magic, flags, tlen, mlen = struct.unpack(_HDR, rec[:_HDRLEN])
+                client.publish(rec[_HDRLEN:_HDRLEN + tlen], rec[_HDRLEN + tlen:], flags & 1, flags >> 1 & 3)
+                self.head.pop(0)
+                sent += 1
+        finally:
+            # Save per segment or per save_every records, not on every call
+            if not self.segs or self.saved is None or self.rseg != self.saved[0] or self.unsaved >= self.save_every:
+                self._save()
+        return sent
@@ -0,0 +1,192 @@
+''' Payload encoders compiled from a device's data keys (the data_keys given to setup_device).
+
+SchemaJSON(keys, precision=4)
+    JSON for a fixed set of keys. The '"key":' segments are built once, encode(data) only writes the values
+    into a reused buffer: ints as digits, floats with at most precision decimals (trailing zeros dropped),
+    bools/None as true/false/null. Output is compact JSON ({"a0f":1.6234,"a1f":0.0121}), keys in schema order.
+    data may hold any subset of the keys (delta payloads), only those are written.
+    Anything it can't write (a str value, a key outside the schema, nan/inf) falls back to ujson.dumps.
+    Lossy: floats are rounded to precision decimals. Opt-in per device (codec='schema' in setup_device), on the
+    PC it is slower than ujson.dumps for float payloads (host/payloadbench.py), only use it where the board shows a gain.
+
+SchemaStruct(keys, schema_id, types=None)
+    Packed ustruct layout with a schema id and a presence bitmask, see the class. Decoded on the PC/Node-RED
+    side by host/payloaddecode.py. (CBOR was considered, the fixed layout is smaller and needs no library.)
+
+encode() returns a memoryview of the internal buffer, valid until the next encode call. publish copies it
+straight into the packet. Keep bytes(...) of it if the payload has to outlive the next encode.
+'''
+
+import ujson
+import ustruct as struct
+
+_MISSING = object()
+
+class SchemaJSON:
+    def __init__(self, keys, precision=4):
+        self.keys = list(keys)
+        self.segs = [ujson.dumps(key).encode() + b':' for key in self.keys]   # '"a0f":' escaped once here
+        self.fields = [(key, seg, b',' + seg) for key, seg in zip(self.keys, self.segs)]
+        self.precision = precision
+        self.scale = 10 ** precision
+        self.buf = bytearray(2 + sum(len(seg) + 20 + precision for seg in self.segs))  # sign, 16 digits, '.', decimals, ','
+        self.mv = memoryview(self.buf)
+        self.fallbacks = 0
+
+    def _int(self, i, n):
+        # Write int n at buf[i], return the end position. Digits are written right to left, no str made
+        buf = self.buf
+        if n < 0:
+            buf[i] = 45                 # -
+            i += 1
+            n = -n
+        end = i
+        m = n
+        while 1:
+            end += 1
+            m //= 10
+            if not m:
+                break
+        j = end
+        while 1:
+            j -= 1
+            buf[j] = 48 + n % 10
+            n //= 10
+            if not n:
+                return end
+
+    def _float(self, i, v):
+        # Scaled to an int once (1.6234 -> 16234 at precision 4), then one right to left pass writes the
+        # decimals, the '.' and the integer part
+        buf = self.buf
+        p = self.precision
+        if v < 0:
+            n = int(-v * self.scale + 0.5)
+            if n:
+                buf[i] = 45
+                i += 1
+        else:
+            n = int(v * self.scale + 0.5)
+        d = p + 1                       # Digits to write: the decimals and at least one integer digit
+        m = n // self.scale
+        while m >= 10:
+            d += 1
+            m //= 10
+        end = i + d + 1
+        j = end
+        while j > end - p:              # Decimals
+            j -= 1
+            buf[j] = 48 + n % 10
+            n //= 10
+        j -= 1
+        buf[j] = 46                     # .
+        while j > i:
+            j -= 1
+            buf[j] = 48 + n % 10
+            n //= 10
+        while end > i + d - p + 2 and buf[end - 1] == 48:
+            end -= 1                    # 1.5000 -> 1.5, 3.0000 -> 3.0
+        return end
+
+    def encode(self, data):
+        buf = self.buf
+        buf[0] = 123                    # {
+        i = 1
+        found = 0
+        for key, first, seg in self.fields:
+            v = data.get(key, _MISSING)
+            if v is _MISSING:
+                continue
+            if not found:
+                seg = first             # No ',' before the first value
+            found += 1
+            buf[i:i + len(seg)] = seg
+            i += len(seg)
+            if type(v) is float:
+                if v != v or not -1e15 < v < 1e15:   # nan/inf, or too long for the buffer
+                    return self._fallback(data)
+                i = self._float(i, v)
+            elif v is True or v is False or v is None:
+                seg = b'true' if v is True else b'false' if v is False else b'null'
+                buf[i:i + len(seg)] = seg
+                i += len(seg)
+            elif type(v) is int and -9999999999999999 <= v <= 9999999999999999:
+                i = self._int(i, v)
+            else:
+                return self._fallback(data)
+        if found != len(data):          # Keys outside the schema
+            return self._fallback(data)
+        buf[i] = 125                    # }
+        return self.mv[:i + 1]
+
+    def _fallback(self, data):
+        self.fallbacks += 1
+        return ujson.dumps(data)
+
+    __call__ = encode                   # Usable wherever an encode function is expected (PublishQueue, publisher)
+
+class SchemaStruct:
+    ''' Packed binary payload for a fixed set of keys, 3-4x smaller than the JSON.
+    Layout (little endian): schema_id (B), presence mask (B/H/I for up to 8/16/32 keys, bit n = keys[n]
+    present), then the present values in key order. types has one ustruct code per key. By default it comes
+    from the key suffix used by the devices: ...i -> 'i' (int32), anything else -> 'f' (float32).
+    None values are left out like missing keys. Anything that can't be packed (str, out of range int,
+    keys outside the schema) falls back to ujson.dumps. JSON starts with '{' (0x7B), so schema_id must be
+    1-122 and a decoder tells the two apart by the first byte.
+    describe() gives the {"id", "keys", "types"} a decoder needs (host/payloaddecode.py).
+    '''
+    _RANGE = {'b': (-128, 127), 'B': (0, 255), 'h': (-32768, 32767), 'H': (0, 65535),
+              'i': (-2147483648, 2147483647), 'I': (0, 4294967295)}
+
+    def __init__(self, keys, schema_id, types=None):
+        assert 0 < schema_id < 0x7B and len(keys) <= 32
+        self.keys = list(keys)
+        self.schema_id = schema_id
+        if types is None:
+            types = ''.join('i' if key.endswith('i') else 'f' for key in self.keys)
+        assert len(types) == len(self.keys)
+        self.types = types
+        self.hdr = '<BB' if len(keys) <= 8 else '<BH' if len(keys) <= 16 else '<BI'
+        self.hdrlen = struct.calcsize(self.hdr)
+        self.fields = []                # (key, '<f', size, int range or None)
+        for key, t in zip(self.keys, types):
+            self.fields.append((key, '<' + t, struct.calcsize(t), self._RANGE.get(t)))
+        self.buf = bytearray(self.hdrlen + sum(f[2] for f in self.fields))
+        self.mv = memoryview(self.buf)
+        self.fallbacks = 0
+
+    def encode(self, data):
+        buf = self.buf
+        i = self.hdrlen
+        mask = 0
+        seen = 0
+        bit = 1
+        for key, fmt, size, rng in self.fields:
+            v = data.get(key, _MISSING)
+            if v is not _MISSING:
+                seen += 1
+                if v is not None:
+                    if rng is None:
+                        if not isinstance(v, (int, float)):
+                            return self._fallback(data)
+                    else:
+                        v = int(v) if isinstance(v, (int, float)) else None
+                        if v is None or not rng[0] <= v <= rng[1]:
+                            return self._fallback(data)
+                    struct.pack_into(fmt, buf, i, v)
+                    i += size
+                    mask |= bit
+            bit <<= 1
+        if seen != len(data):           # Keys outside the schema
+            return self._fallback(data)
+        struct.pack_into(self.hdr, buf, 0, self.schema_id, mask)
+        return self.mv[:i]
+
+    def _fallback(self, data):
+        self.fallbacks += 1
+        return ujson.dumps(data)
+
+    def describe(self):
+        return {'id': self.schema_id, 'keys': self.keys, 'types': self.types}
+
+    __call__ = encode
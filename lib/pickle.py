@@ -1,22 +1,188 @@
-HIGHEST_PROTOCOL = 0
+''' Compact binary serializer for the values the project saves to flash. Same API as pickle
+(dump/dumps/load/loads) but nothing is ever eval'd, so a corrupt or hostile file can only raise ValueError.
+Lists, tuples and dicts nest MAXDEPTH deep at most (deeper raises ValueError in dump and load), so a
+crafted file can't run the recursive reader out of stack.
 
-def dump(obj, f, proto=0):
-    f.write(repr(obj))
+Types: None, bool, int (any size), float, str, bytes, bytearray, list, tuple, dict, array.array.
+Anything else raises TypeError in dump. Format, one tag byte per value:
+    N T F                 None True False
+    i <varint>            int, zigzag encoded (small ints of either sign are 1-2 bytes)
+    f <8 bytes>           float, little endian double
+    s b y <varint> data   str (utf-8), bytes, bytearray
+    l t d <varint> items  list, tuple (count items), dict (count key, value pairs)
+    a <tc> <varint> data  array: typecode, byte length, raw items
+varint is unsigned LEB128. dump() writes straight to the file as it walks the object and load() reads
+straight from it, so neither holds a second copy of a large object in RAM.
+Files written by the old repr/eval pickle are not readable (they raise ValueError).
+Files must be opened in binary mode ('wb'/'rb'). load() on a text mode file and loads() of a str raise ValueError.
+'''
 
-def dumps(obj, proto=0):
-    return repr(obj).encode()
+import ustruct as struct
+from array import array
+
+HIGHEST_PROTOCOL = 1
+MAXDEPTH = 20           # Container nesting. The recursion stays well inside the esp32 stack
+
+def _head(tag, n):
+    out = bytearray(tag)
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+def _typecode(a):
+    try:
+        return a.typecode
+    except AttributeError:
+        return repr(a[:0])[7]           # MicroPython arrays have no typecode attribute. "array('f')"
+
+def _dump(obj, w, depth=0):
+    t = type(obj)
+    if t is int:
+        w(_head(b'i', obj << 1 if obj >= 0 else (-obj << 1) - 1))
+    elif t is float:
+        w(b'f' + struct.pack('<d', obj))
+    elif t is str:
+        obj = obj.encode()
+        w(_head(b's', len(obj)))
+        w(obj)
+    elif t is dict:
+        _nest(depth)
+        w(_head(b'd', len(obj)))
+        for k, v in obj.items():
+            _dump(k, w, depth + 1)
+            _dump(v, w, depth + 1)
+    elif t is list or t is tuple:
+        _nest(depth)
+        w(_head(b'l' if t is list else b't', len(obj)))
+        for v in obj:
+            _dump(v, w, depth + 1)
+    elif obj is None:
+        w(b'N')
+    elif t is bool:
+        w(b'T' if obj else b'F')
+    elif t is bytes or t is bytearray:
+        w(_head(b'b' if t is bytes else b'y', len(obj)))
+        w(obj)
+    elif t is array:
+        raw = bytes(obj)
+        w(_head(b'a' + _typecode(obj).encode(), len(raw)))
+        w(raw)
+    else:
+        raise TypeError("can't serialize {0}".format(t))
+
+def _nest(depth):
+    if depth >= MAXDEPTH:
+        raise ValueError('nested deeper than {0}'.format(MAXDEPTH))
+
+def dump(obj, f, proto=HIGHEST_PROTOCOL):
+    _dump(obj, f.write)
+
+def dumps(obj, proto=HIGHEST_PROTOCOL):
+    out = []
+    _dump(obj, out.append)
+    return b''.join(out)
+
+class _BytesReader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def byte(self):
+        try:
+            b = self.data[self.pos]
+        except IndexError:
+            raise ValueError('truncated data')
+        self.pos += 1
+        return b
+
+    def read(self, n):
+        end = self.pos + n
+        if end > len(self.data):
+            raise ValueError('truncated data')
+        b = self.data[self.pos:end]
+        self.pos = end
+        return b
+
+class _FileReader:
+    def __init__(self, f):
+        self.f = f
+
+    def byte(self):
+        return self.read(1)[0]
+
+    def read(self, n):
+        b = self.f.read(n)
+        if isinstance(b, str):
+            raise ValueError("text mode file, open it with 'rb'")
+        if b is None or len(b) < n:
+            raise ValueError('truncated data')
+        return b
+
+def _uint(r):
+    b = r.byte()
+    if b < 0x80:                        # Most lengths and small ints
+        return b
+    n = b & 0x7f
+    sh = 7
+    while 1:
+        b = r.byte()
+        n |= (b & 0x7f) << sh
+        if not b & 0x80:
+            return n
+        sh += 7
+
+def _load(r, depth=0):
+    tag = r.byte()
+    if tag == 0x69:                     # i
+        n = _uint(r)
+        return -(n + 1 >> 1) if n & 1 else n >> 1
+    if tag == 0x66:                     # f
+        return struct.unpack('<d', r.read(8))[0]
+    if tag == 0x73:                     # s
+        try:
+            return str(r.read(_uint(r)), 'utf-8')
+        except UnicodeError:
+            raise ValueError('bad utf-8')
+    if tag == 0x64:                     # d
+        _nest(depth)
+        d = {}
+        for i in range(_uint(r)):
+            k = _load(r, depth + 1)
+            try:
+                d[k] = _load(r, depth + 1)
+            except TypeError:           # Unhashable key
+                raise ValueError('bad dict key')
+        return d
+    if tag == 0x6c or tag == 0x74:      # l t
+        _nest(depth)
+        out = [_load(r, depth + 1) for i in range(_uint(r))]
+        return out if tag == 0x6c else tuple(out)
+    if tag == 0x4e:                     # N
+        return None
+    if tag == 0x54 or tag == 0x46:      # T F
+        return tag == 0x54
+    if tag == 0x62:                     # b
+        return bytes(r.read(_uint(r)))
+    if tag == 0x79:                     # y
+        return bytearray(r.read(_uint(r)))
+    if tag == 0x61:                     # a
+        tc = chr(r.byte())
+        try:
+            return array(tc, bytes(r.read(_uint(r))))
+        except (ValueError, TypeError):
+            raise ValueError('bad array')
+    raise ValueError('bad tag {0}'.format(tag))
 
 def load(f):
-    s = f.read()
-    return loads(s)
+    return _load(_FileReader(f))
 
 def loads(s):
-    d = {}
-    s = s.decode()
-    if "(" in s:
-        qualname = s.split("(", 1)[0]
-        if "." in qualname:
-            pkg = qualname.rsplit(".", 1)[0]
-            mod = __import__(pkg)
-            d[pkg] = mod
-    return eval(s, d)
\ No newline at end of file
+    if isinstance(s, str):
+        raise ValueError('loads needs bytes, not str')
+    r = _BytesReader(s)
+    obj = _load(r)
+    if r.pos != len(r.data):
+        raise ValueError('trailing data')
+    return obj
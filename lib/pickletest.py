@@ -1,6 +1,7 @@
 import pickle
 import sys
 import io
+from array import array
 
 
 def dump_load(val):
@@ -17,9 +18,63 @@ dump_load(b"bytes")
 dump_load((1,))
 dump_load([1, 2])
 dump_load({1:2, 3: 4})
+dump_load(None)
+dump_load(True)
+dump_load(-1)
+dump_load(2**70)
+dump_load(-2**70)
+dump_load(-2.5)
+dump_load("")
+dump_load("\u00b0C")
+dump_load(bytearray(b"ba"))
+dump_load(())
+dump_load({"key1": [1, (2.5, "x")], "key2": {"n": None}, 3: b"\x00"})
+dump_load(array('f', range(10)))
+dump_load(array('H', [0, 65535]))
+
+f = io.BytesIO()   # Streaming to/from a file
+val = {"pins": [34, 35], "data": array('f', [1.5, 2.5])}
+pickle.dump(val, f)
+pickle.dump([1, 2], f)
+f.seek(0)
+assert pickle.load(f) == val
+assert pickle.load(f) == [1, 2]
+
+assert len(pickle.dumps(5)) == 2    # Small ints are 2 bytes
+
+for bad in (b"1; import micropython", b"", b"s\x05abc", b"l\x02i\x02", b"i\x02i\x02", b"Z",
+            b"d\x01l\x00i\x00"):
+    try:
+        pickle.loads(bad)
+        assert 0, "ValueError expected"
+    except ValueError:
+        pass
+
+for bad in ("s\x01a", io.StringIO("i\x02")):   # str / text mode file instead of bytes
+    try:
+        pickle.loads(bad) if isinstance(bad, str) else pickle.load(bad)
+        assert 0, "ValueError expected"
+    except ValueError:
+        pass
+
+deep = []
+for i in range(pickle.MAXDEPTH - 1):   # Deepest nesting that round trips
+    deep = [deep]
+assert pickle.loads(pickle.dumps(deep)) == deep
+for bad in (b"l\x01" * 100000, b"d\x01i\x00" * 100000, b"t\x01" * (pickle.MAXDEPTH + 1) + b"N"):
+    try:
+        pickle.loads(bad)               # Nested past MAXDEPTH: ValueError, not RecursionError
+        assert 0, "ValueError expected"
+    except ValueError:
+        pass
+try:
+    pickle.dumps([deep, [deep]])
+    assert 0, "ValueError expected"
+except ValueError:
+    pass
 
 try:
-    pickle.loads(b"1; import micropython")
-    assert 0, "SyntaxError expected"
-except SyntaxError:
+    pickle.dumps(object())
+    assert 0, "TypeError expected"
+except TypeError:
     pass
\ No newline at end of file
@@ -0,0 +1,98 @@
+''' Publish queue that batches device updates and sends them once per send window.
+put() is called whenever a device has new data, flush() once per window (ex: the 100 ms getdata task).
+
+coalesce=True     last value wins. A topic updated several times inside one window is published once
+                  with its newest data (a fast spinning rotary encoder only sends where it stopped). Dict data
+                  is copied at the first put() of the window and later puts update the copy key by key, so a
+                  device that reuses its dict can't change a queued entry and a delta payload (adc.py
+                  delta=True) keeps every key that changed in the window
+coalesce=False    every update is published. Data is encoded at put() since devices reuse their dicts
+combined_topic    pack every pending device into one payload {key: data, ...} on this topic (coalesce only)
+set_encoder       per topic encode function in place of encode (ex: payload.SchemaJSON for the device's keys)
+outbox            outbox.Outbox. While it holds a backlog new messages queue behind it (order is kept), and
+                  a publish that fails with OSError is stored there instead of raising (the client, or an
+                  mqttconn.MQTTConnection, deals with the broken link)
+
+stats: puts, superseded (updates dropped by coalescing) and packets actually published.
+'''
+
+import ujson, ulogging
+
+class PublishQueue:
+    def __init__(self, client, encode=ujson.dumps, coalesce=True, combined_topic=None, logger=None, outbox=None):
+        self.client = client
+        self.outbox = outbox
+        self.encode = encode
+        self.coalesce = coalesce
+        self.combined_topic = combined_topic
+        if logger is not None:                         # Use logger passed as argument
+            self.logger = logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = ulogging.getLogger(__name__) # Create from root logger
+        self.pending = {}       # topic -> newest data (coalesce)
+        self.keys = {}          # topic -> key used in the combined payload
+        self.order = []         # topics in the order they were first put this window
+        self.queue = []         # (topic, payload) when not coalescing
+        self.combined = {}      # Reused combined payload dict
+        self.encoders = {}      # topic -> encode, see set_encoder
+        self.puts = 0
+        self.superseded = 0
+        self.packets = 0
+
+    def set_encoder(self, topic, encode):
+        self.encoders[topic] = encode
+
+    def put(self, topic, data, key=None):
+        self.puts += 1
+        if not self.coalesce:
+            payload = self.encoders.get(topic, self.encode)(data)
+            if isinstance(payload, memoryview):     # Encoder's reused buffer, keep a copy until the flush
+                payload = bytes(payload)
+            self.queue.append((topic, payload))
+            return
+        if topic in self.pending:
+            self.superseded += 1
+            pending = self.pending[topic]
+            if isinstance(data, dict) and isinstance(pending, dict):
+                pending.update(data)
+                return
+        else:
+            self.order.append(topic)
+            self.keys[topic] = key if key is not None else topic.decode()
+        self.pending[topic] = dict(data) if isinstance(data, dict) else data
+
+    def flush(self):
+        if self.queue:
+            for topic, payload in self.queue:
+                self._publish(topic, payload)
+            self.queue.clear()
+        if not self.order:
+            return
+        if self.combined_topic is not None:
+            for topic in self.order:
+                self.combined[self.keys[topic]] = self.pending[topic]
+            self._publish(self.combined_topic, self.encode(self.combined))
+            self.combined.clear()
+        else:
+            for topic in self.order:
+                self._publish(topic, self.encoders.get(topic, self.encode)(self.pending[topic]))
+        self.pending.clear()
+        self.order.clear()
+
+    def _publish(self, topic, payload):
+        if self.outbox is not None:
+            if self.outbox.pending():
+                self.outbox.put(topic, payload)
+                return
+            try:
+                self.client.publish(topic, payload)
+            except OSError:
+                self.outbox.put(topic, payload)
+                return
+        else:
+            self.client.publish(topic, payload)
+        self.packets += 1
+        self.logger.debug('Published msg %s with payload %s', topic, payload)
+
+    def report(self):
+        self.logger.info('PublishQueue puts:%d superseded:%d packets:%d', self.puts, self.superseded, self.packets)
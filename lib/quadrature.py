@@ -0,0 +1,99 @@
+''' Interrupt driven quadrature decoder. Both encoder pins raise an IRQ on every edge, the handler reads
+both pins and looks the (old state, new state) pair up in a 16 entry table, so every quarter step is
+counted however slowly the main loop polls.
+
+    quad = Quadrature(Pin(15, Pin.IN, Pin.PULL_UP), Pin(4, Pin.IN, Pin.PULL_UP))
+    quad.read()                    # Quarter steps since start, a mechanical detent is usually 4
+
+The handler does not allocate: it writes the step (+1/-1) into a preallocated array ring buffer that
+read() sums up. If read() is not called for a while and the ring fills, steps go into an overflow
+counter instead, so they are late but never lost. Each variable has a single writer (the handler owns
+the write index and overflow, read() owns the read index), so no interrupt disabling is needed.
+A transition where both pins changed means an edge was missed (IRQ latency longer than the time between
+edges). It is counted in skips and taken as two steps in the last known direction. t is the ticks_us of
+the last step.
+
+onchange(quad) is optional and runs through micropython.schedule after the handler, once per burst of
+steps, for anything heavier than recording the step. It may call read(), but then nothing else should.
+'''
+
+import utime
+from array import array
+try:
+    from micropython import schedule
+except ImportError:
+    def schedule(f, arg):              # CPython (host tests): no irq context, run it now
+        f(arg)
+
+# Step for index old state << 2 | new state, state = a << 1 | b. 2 is both pins changed
+# +1: 01 -> 11 -> 10 -> 00 -> 01 (b leads a, same sign as the old rotaryencoder counter)
+_STEP = array('b', (0, 1, -1, 2, -1, 0, 2, 1, 1, 2, 0, -1, 2, -1, 1, 0))
+
+class Quadrature:
+    def __init__(self, pin_a, pin_b, size=32, onchange=None):
+        self.a = pin_a
+        self.b = pin_b
+        self.ring = array('b', bytes(size))
+        self.mask = size - 1           # size must be a power of 2
+        self.w = 0                     # Written by the handler
+        self.r = 0                     # Written by read()
+        self.over = 0                  # Steps that did not fit in the ring, written by the handler
+        self.over_seen = 0             # Part of over already counted by read()
+        self.count = 0
+        self.skips = 0
+        self.dir = 1
+        self.t = utime.ticks_us()
+        self.state = pin_a.value() << 1 | pin_b.value()
+        self.onchange = onchange
+        self.pending = False
+        self._run_ref = self._run      # Bound once, binding in the handler would allocate
+        for pin in (pin_a, pin_b):
+            trigger = pin.IRQ_FALLING | pin.IRQ_RISING
+            try:
+                pin.irq(trigger=trigger, handler=self._irq, hard=True)
+            except TypeError:          # Port without hard irqs
+                pin.irq(trigger=trigger, handler=self._irq)
+
+    def _irq(self, pin):
+        s = self.a.value() << 1 | self.b.value()
+        d = _STEP[self.state << 2 | s]
+        self.state = s
+        if d == 0:
+            return                     # Bounce back to the same state
+        self.t = utime.ticks_us()
+        if d == 2:
+            self.skips += 1
+            d = self.dir << 1
+        else:
+            self.dir = d
+        w = self.w
+        nxt = (w + 1) & self.mask
+        if nxt == self.r:
+            self.over += d
+        else:
+            self.ring[w] = d
+            self.w = nxt
+        if self.onchange is not None and not self.pending:
+            self.pending = True
+            try:
+                schedule(self._run_ref, 0)
+            except RuntimeError:       # Schedule queue full, read() still sees the steps
+                self.pending = False
+
+    def _run(self, arg):
+        self.pending = False
+        self.onchange(self)
+
+    def read(self):
+        # Sum the steps recorded since the last call. Not for use in an interrupt handler
+        r, w, ring, mask = self.r, self.w, self.ring, self.mask
+        n = 0
+        while r != w:
+            n += ring[r]
+            r = (r + 1) & mask
+        self.r = r
+        over = self.over
+        n += over - self.over_seen
+        self.over_seen = over
+        self.count += n
+        return self.count
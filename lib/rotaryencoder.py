@@ -1,8 +1,22 @@
-import ulogging
+''' Rotary encoder with push button. The pins are decoded in an irq (quadrature.py), the counter moves
+one per detent (steps quarter steps). Integers only.
+
+Glitch filter: the counter only moves once the position is a full detent away from the last detent, so
+wobble and bounce around a detent never publish. A detent in the opposite direction less than glitch_us
+after the previous one is noise (no hand turns a knob back that fast) and is dropped.
+
+Acceleration (optional): accel is ((max_us, multiplier), ...) fastest first. A detent that came less than
+max_us after the previous one moves the counter by multiplier, so a fast spin covers a large range with
+fewer detents and fewer published messages. Ex: accel=((8000, 10), (20000, 4), (50000, 2))
+'''
+
+import ulogging, utime
 from machine import Pin
+from quadrature import Quadrature
 
 class RotaryEncoder:
-    def __init__(self, clkPin, dtPin, button, key1='RotEncCi', key2='RotEncBi', logger=None):
+    def __init__(self, clkPin, dtPin, button, key1='RotEncCi', key2='RotEncBi', logger=None, steps=4,
+                 glitch_us=2000, accel=()):
         self.clkPin = Pin(clkPin, Pin.IN, Pin.PULL_UP)
         self.dtPin = Pin(dtPin, Pin.IN, Pin.PULL_UP)
         self.button = Pin(button, Pin.IN, Pin.PULL_UP)
@@ -13,46 +27,52 @@ class RotaryEncoder:
             self.logger = logger
         else:                                          # Root logger already exists and no custom logger passed
             self.logger = ulogging.getLogger(__name__) # Create from root logger
-        self.clkLastState = self.clkPin.value()
-        self.clkState = self.clkPin.value()
-        self.dtState = self.dtPin.value()
+        self.steps = steps                             # Quarter steps per detent
+        self.glitch_us = glitch_us
+        self.accel = accel
+        self.detentpos = 0                             # Quarter step count at the last detent
+        self.dir = 1
+        self.t = utime.ticks_us()                      # Time of the last detent
+        self.glitches = 0
+        self.quad = Quadrature(self.clkPin, self.dtPin, onchange=self._turn)  # Counts every edge on both pins in an irq
         self.button.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=self._button_callback) # link interrupt handler to function for pin falling or rising
         self.logger.info('Rotary Encoder pins- clk:{0} data:{1} button:{2}'.format(self.clkPin, self.dtPin, self.button))
-        self.counter = 0
-        self.clkUpdate = True
+        self.counter = 0                               # Updated by _turn, scheduled after the encoder irq
+        self.published = 0
         self.buttonpressed = False
         
-    def _is_integer(self, n):
-        if n == None or n == "na":
-            return False
-        if isinstance(n, int):
-            return True
-        if abs(round(n) - n) == 0.5:
-            return False
-        else:
-            return True
-    
+    def _turn(self, quad):
+        diff = quad.read() - self.detentpos
+        if -self.steps < diff < self.steps:
+            return                                     # Less than a detent from the last one
+        n = diff // self.steps if diff > 0 else -(-diff // self.steps)
+        dt = utime.ticks_diff(quad.t, self.t) // abs(n)  # us per detent
+        d = 1 if n > 0 else -1
+        if d != self.dir and dt < self.glitch_us:
+            self.glitches += 1                         # Leave it pending, turning back cancels it
+            return
+        self.detentpos += n * self.steps
+        self.t = quad.t
+        self.dir = d
+        for max_us, mult in self.accel:
+            if dt < max_us:
+                n *= mult
+                break
+        self.counter += n
+
     def _button_callback(self, pin):
         self.buttonpressed = True
   
     def getdata(self):
-        self.clkState = self.clkPin.value()
-        self.dtState = self.dtPin.value()
-        if self.clkState != self.clkLastState or self.buttonpressed:
-            if self.clkState != self.clkLastState:
-                if self.dtState != self.clkState:
-                    self.counter -= 0.5
-                else:
-                    self.counter += 0.5
-                self.clkLastState = self.clkState
-            self.logger.debug('counter:{0} dtState:{1} clkState:{2} button:{3}'.format(self.counter, self.dtState, self.clkState, self.buttonpressed))
-            buttonstate = self.button.value()
+        counter = self.counter
+        if counter != self.published or self.buttonpressed:
+            self.logger.debug('counter:%s steps:%s skips:%s glitches:%s button:%s', counter, self.quad.count, self.quad.skips, self.glitches, self.buttonpressed)
+            self.published = counter
             self.buttonpressed = False
-            if self._is_integer(self.counter):
-                self.outgoing[self.og_counter] = self.counter
-                self.outgoing[self.og_button] = buttonstate
-                self.logger.debug(self.outgoing)
-                return self.outgoing
+            self.outgoing[self.og_counter] = counter
+            self.outgoing[self.og_button] = self.button.value()
+            self.logger.debug(self.outgoing)
+            return self.outgoing
 
 if __name__ == "__main__":
     logger_rotenc = ulogging.getLogger('rotenc')
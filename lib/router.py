@@ -0,0 +1,72 @@
+''' Topic router for incoming MQTT messages. Replaces re.match on every message in mqtt_on_message.
+Handlers are registered per topic filter (MQTT wildcards: + one level, # the rest, last level only) in a
+trie keyed on topic levels. The first message on a topic walks the trie once. The matched handlers are then
+cached per exact topic (up to cachesize topics), so a repeat message is one dict lookup and the calls.
+
+    router = TopicRouter()
+    router.add(b'nred2esp/servoZCMD/+', servo_cmd)
+    router.route(topic, msg)       # servo_cmd(topic, msg, params) for every matching filter
+
+params is a tuple of the levels the wildcards matched, in order (# gives the rest of the topic as one
+bytes). Ex: b'nred2esp/servoZCMD/1' -> (b'1',). It is built once per topic and reused, don't modify it.
+'''
+
+class TopicRouter:
+    def __init__(self, cachesize=32):
+        self.root = ({}, [])            # Node: (children by level, handlers for a filter ending here)
+        self.cache = {}                 # topic -> [(handler, params), ...]
+        self.cachesize = cachesize
+
+    def add(self, pattern, handler):
+        node = self.root
+        for level in pattern.split(b'/'):
+            child = node[0].get(level)
+            if child is None:
+                child = node[0][level] = ({}, [])
+            node = child
+        node[1].append(handler)
+        self.cache.clear()              # Cached topics may match the new filter
+
+    def remove(self, pattern, handler):
+        node = self.root
+        for level in pattern.split(b'/'):
+            node = node[0].get(level)
+            if node is None:
+                return
+        if handler in node[1]:
+            node[1].remove(handler)
+            self.cache.clear()
+
+    def match(self, topic):
+        entries = self.cache.get(topic)
+        if entries is None:
+            entries = []
+            self._walk(self.root, topic.split(b'/'), 0, (), entries)
+            if len(self.cache) < self.cachesize:
+                self.cache[topic] = entries
+        return entries
+
+    def _walk(self, node, levels, i, params, out):
+        children, handlers = node
+        rest = children.get(b'#')
+        if rest is not None:            # Matches the remaining levels, none included (a/# matches a)
+            p = params + (b'/'.join(levels[i:]),)
+            for f in rest[1]:
+                out.append((f, p))
+        if i == len(levels):
+            for f in handlers:
+                out.append((f, params))
+            return
+        child = children.get(levels[i])
+        if child is not None:
+            self._walk(child, levels, i + 1, params, out)
+        child = children.get(b'+')
+        if child is not None:
+            self._walk(child, levels, i + 1, params + (levels[i],), out)
+
+    def route(self, topic, msg):
+        # Call every handler whose filter matches topic. Returns how many were called (0 = unrouted)
+        entries = self.match(topic)
+        for f, params in entries:
+            f(topic, msg, params)
+        return len(entries)
@@ -0,0 +1,100 @@
+''' Cooperative scheduler for the main loop.
+Tasks are registered with a period, a phase offset (to stagger tasks that share a period) and a
+priority. run_once() sleeps until the earliest deadline instead of busy polling ticks_diff, then runs
+every task that is due, highest priority first. Deadlines advance by exactly one period from the
+previous deadline, so timing does not drift with task run time.
+
+Per task stats:
+    jitter    ms between the deadline and the moment the task actually started (mean and max)
+    overruns  deadlines missed completely because the loop was busy (those periods are skipped)
+    runtime   us the callback took (max)
+report() logs them.
+
+profiler (timer.Profiler, optional) runs every callback inside a section named after the task, so the
+sections a callback enters nest under its task and prof.tree() shows each phase's share of that task.
+'''
+
+import utime, ulogging
+
+class Task:
+    def __init__(self, name, callback, period_ms, offset_ms=0, priority=0):
+        self.name = name
+        self.callback = callback
+        self.period = period_ms
+        self.offset = offset_ms
+        self.priority = priority
+        self.due = utime.ticks_add(utime.ticks_ms(), offset_ms)
+        self.runs = 0
+        self.overruns = 0
+        self.jitter_total = 0
+        self.jitter_max = 0
+        self.runtime_max = 0
+
+class Scheduler:
+    def __init__(self, logger=None, profiler=None):
+        if logger is not None:                         # Use logger passed as argument
+            self.logger = logger
+        else:                                          # Root logger already exists and no custom logger passed
+            self.logger = ulogging.getLogger(__name__) # Create from root logger
+        self.tasks = []                                # Kept sorted, highest priority first
+        self.profiler = profiler
+
+    def add(self, name, callback, period_ms, offset_ms=0, priority=0):
+        task = Task(name, callback, period_ms, offset_ms, priority)
+        i = 0
+        while i < len(self.tasks) and self.tasks[i].priority >= priority:
+            i += 1
+        self.tasks.insert(i, task)
+        self.logger.info('Task %s every %d ms offset %d ms priority %d', name, period_ms, offset_ms, priority)
+        return task
+
+    def _next_wait(self):
+        now = utime.ticks_ms()
+        wait = None
+        for task in self.tasks:
+            d = utime.ticks_diff(task.due, now)
+            if wait is None or d < wait:
+                wait = d
+        return wait
+
+    def run_once(self):
+        wait = self._next_wait()
+        if wait is None:
+            return
+        if wait > 0:
+            utime.sleep_ms(wait)       # Nothing to do until the next deadline
+        for task in self.tasks:
+            now = utime.ticks_ms()
+            late = utime.ticks_diff(now, task.due)
+            if late < 0:
+                continue
+            task.runs += 1
+            task.jitter_total += late
+            if late > task.jitter_max:
+                task.jitter_max = late
+            t0 = utime.ticks_us()
+            if self.profiler is not None:
+                with self.profiler.section(task.name):
+                    task.callback()
+            else:
+                task.callback()
+            runtime = utime.ticks_diff(utime.ticks_us(), t0)
+            if runtime > task.runtime_max:
+                task.runtime_max = runtime
+            task.due = utime.ticks_add(task.due, task.period)
+            late = utime.ticks_diff(utime.ticks_ms(), task.due)
+            if late >= task.period:    # Missed one or more whole periods. Skip them rather than run back to back
+                skipped = late // task.period
+                task.overruns += skipped
+                task.due = utime.ticks_add(task.due, skipped * task.period)
+
+    def run(self, duration_ms=None):
+        # Run forever, or for duration_ms
+        t0 = utime.ticks_ms()
+        while duration_ms is None or utime.ticks_diff(utime.ticks_ms(), t0) < duration_ms:
+            self.run_once()
+
+    def report(self):
+        for task in self.tasks:
+            self.logger.info('Task,%s,runs,%d,jitter mean,%.2f,max,%d,ms,overruns,%d,runtime max,%d,us', task.name, task.runs,
+                             task.jitter_total / (task.runs or 1), task.jitter_max, task.overruns, task.runtime_max)
@@ -1,6 +1,7 @@
 from boot import MAIN_FILE_LOGGING, MAIN_FILE_MODE, MAIN_FILE_NAME, logfiles
 import ulogging
 import utime
+from array import array
 
 logger_log_level= 10
 logger_type = "custom"  # 'basic' for basicConfig or 'custom' for custom logger
@@ -24,16 +25,99 @@ elif logger_type == 'custom' and FileMode == 2 and MAIN_FILE_LOGGING:
 
 logger.info(logger)
 
+# TimerFunc keeps running statistics per decorated function instead of logging every call.
+# Each function gets one preallocated array: count, total us (low 32 bits), min us, max us, total us
+# (high 32 bits, 'L' is 32 bit on esp32 and the total passes 2**32 us after ~72 min of timed calls), then a histogram
+# where bucket b counts calls that took [2**(b-1), 2**b) us (bucket 0 is 0 us, last bucket is open ended).
+# Call report() to log count/mean/min/max/p50/p95/p99, or report_every(ms) from the main loop.
+_NBUCKETS = 24              # 2**22 us ~ 4 sec before the last (open) bucket
+_stats = {}
+_t0_report = utime.ticks_ms()
+
+def _calibrate(trials=50):
+    # Smallest time an empty function takes through the same call/timing path as TimerFunc. Subtracted from every sample
+    def empty(*args, **kwargs):
+        pass
+    best = 1000000
+    for i in range(trials):
+        t = utime.ticks_us()
+        empty()
+        best = min(best, utime.ticks_diff(utime.ticks_us(), t))
+    return best
+
+_overhead_us = _calibrate()
+
+def _record(s, us):
+    s[0] += 1
+    total = s[1] + us
+    if total > 0xFFFFFFFF:
+        total -= 0x100000000
+        s[4] += 1
+    s[1] = total
+    if us < s[2]:
+        s[2] = us
+    if us > s[3]:
+        s[3] = us
+    b = 0
+    while us >> b and b < _NBUCKETS - 1:
+        b += 1
+    s[5 + b] += 1
+
+def _percentile(s, p):
+    target = s[0] * p / 100
+    seen = 0
+    for b in range(_NBUCKETS):
+        n = s[5 + b]
+        if n and seen + n >= target:
+            lo = 0 if b == 0 else 1 << (b - 1)
+            hi = min(1 << b, s[3])
+            return lo + (hi - lo) * (target - seen) / n   # Interpolate inside the bucket
+        seen += n
+    return s[3]
+
 def TimerFunc(f, *args, **kwargs):
     name = str(f).split(' ')[1]
+    s = _stats.get(name)
+    if s is None:
+        s = array('L', [0] * (5 + _NBUCKETS))
+        s[2] = 0xFFFFFFFF
+        _stats[name] = s
     def new_func(*args, **kwargs):
         t = utime.ticks_us()
         result = f(*args, **kwargs)
-        delta = utime.ticks_diff(utime.ticks_us(), t)
-        logger.debug('Function,{},time,{:6.3f},ms'.format(name, delta/1000))
+        delta = utime.ticks_diff(utime.ticks_us(), t) - _overhead_us
+        _record(s, delta if delta > 0 else 0)
         return result
     return new_func
 
+def dump():
+    # {function name: {count, mean, min, max, p50, p95, p99}} in us
+    out = {}
+    for name, s in _stats.items():
+        if s[0]:
+            out[name] = {'count': s[0], 'mean': (s[4] << 32 | s[1]) / s[0], 'min': s[2], 'max': s[3],
+                         'p50': _percentile(s, 50), 'p95': _percentile(s, 95), 'p99': _percentile(s, 99)}
+    return out
+
+def report():
+    logger.info('TimerFunc stats in us (decorator overhead %d us subtracted)', _overhead_us)
+    for name, d in dump().items():
+        logger.info('Function,%s,calls,%d,mean,%.1f,min,%d,max,%d,p50,%.0f,p95,%.0f,p99,%.0f',
+                    name, d['count'], d['mean'], d['min'], d['max'], d['p50'], d['p95'], d['p99'])
+
+def report_every(period_ms):
+    # Call from the main loop. Logs a report once every period_ms
+    global _t0_report
+    if utime.ticks_diff(utime.ticks_ms(), _t0_report) >= period_ms:
+        _t0_report = utime.ticks_ms()
+        report()
+
+def reset():
+    for s in _stats.values():
+        for i in range(len(s)):
+            s[i] = 0
+        s[2] = 0xFFFFFFFF
+
 class Timer:
 
     def __init__(self):
@@ -54,3 +138,83 @@ class Timer:
             elapsed = utime.ticks_diff(_end_time, self._start_time)
             self._start_time = None
             return elapsed
+
+class _Section:
+    # One node in the Profiler tree. Reused every time the same section is entered from the same parent
+    def __init__(self, profiler, name, depth):
+        self.profiler = profiler
+        self.name = name
+        self.depth = depth
+        self.children = {}
+        self.order = []         # Child names in the order they were first entered
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._start = 0
+
+    def __enter__(self):
+        self.profiler._push(self)
+        self._start = utime.ticks_us()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = utime.ticks_diff(utime.ticks_us(), self._start)
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.profiler._pop()
+        return False
+
+class Profiler:
+    ''' Nested section timing for loop phase breakdowns. Unlike Timer, sections can nest.
+    with prof.section('loop'):
+        with prof.section('getdata'):
+            with prof.section('adc'):
+    Each section is a node keyed by its parent, so after the first pass entering a section allocates nothing.
+    Totals add up across loop iterations. tree() logs the average us per iteration of each root section
+    with its children indented below and the share of the root each one takes (self = time not in a child). '''
+
+    def __init__(self, maxdepth=8):
+        self.root = _Section(self, '', -1)
+        self._stack = [self.root] * (maxdepth + 1)
+        self._depth = 0
+
+    def section(self, name):
+        parent = self._stack[self._depth]
+        s = parent.children.get(name)
+        if s is None:
+            s = _Section(self, name, parent.depth + 1)
+            parent.children[name] = s
+            parent.order.append(name)
+        return s
+
+    def _push(self, s):
+        self._depth += 1
+        self._stack[self._depth] = s
+
+    def _pop(self):
+        self._depth -= 1
+
+    def reset(self):
+        self.root = _Section(self, '', -1)
+        self._stack = [self.root] * len(self._stack)
+        self._depth = 0
+
+    def tree(self):
+        for name in self.root.order:
+            top = self.root.children[name]
+            if top.count:
+                logger.info('%s: %d iterations, max %d us', name, top.count, top.max)
+                self._tree(top, top.count, top.total)
+
+    def _tree(self, s, iterations, roottotal):
+        logger.info('%s%-*s %8.1f us/iter %5.1f%%', '  ' * s.depth, 16 - 2 * s.depth, s.name, s.total / iterations, 100 * s.total / (roottotal or 1))
+        inchildren = 0
+        for name in s.order:
+            child = s.children[name]
+            inchildren += child.total
+            self._tree(child, iterations, roottotal)
+        if s.order:
+            selftime = s.total - inchildren
+            logger.info('%s%-*s %8.1f us/iter %5.1f%%', '  ' * (s.depth + 1), 14 - 2 * s.depth, '(self)', selftime / iterations, 100 * selftime / (roottotal or 1))
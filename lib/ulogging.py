@@ -1,5 +1,5 @@
-from boot import MAIN_FILE_LOGGING, MAIN_FILE_MODE, MAIN_FILE_NAME
-import sys
+from boot import MAIN_FILE_LOGGING, MAIN_FILE_MODE, MAIN_FILE_NAME, LOG_BUFSIZE, LOG_BINARY, LOG_MAXBYTES, LOG_BACKUPS, LOG_TOTALBYTES
+import sys, utime, uos, ustruct
 from mytools import pcolor, rtcdate
 from machine import Timer
 
@@ -34,17 +34,312 @@ _stream = sys.stderr
 #print(msg % args, file=_stream)
 #_stream.close()
 
+_ARGS = 32         # Interned args per handler
+_ARGLEN = 32       # Longest arg interned (bytes)
+
+def _varint(n):
+    # Unsigned LEB128: 7 bits per byte, low bits first
+    b = bytearray()
+    while n > 0x7F:
+        b.append(n & 0x7F | 0x80)
+        n >>= 7
+    b.append(n)
+    return b
+
+class BufferedFileHandler:
+    ''' Collect formatted records in a preallocated bytearray and write them to flash in bulk.
+    Flushes when the next record will not fit, when flushtime (ms) has passed since the last flush,
+    or when a record at flushlevel or above arrives. Only one handler exists per file (see getHandler)
+    so every logger sharing MAIN_FILE_NAME appends to the same buffer and records stay in order.
+
+    binary=True writes compact records instead of text lines (decode with host/logdecode.py):
+      name definition:   0xFE, id(V), len(B), name
+      format definition: 0xFD, id(V), len(H), format string
+      time base:         0xFC, ticks_ms(I)
+      arg definition:    0xFB, id(B), 's' or 'b', len(B), str/bytes
+      record:            head(B), [level(B)], [name id(V)], ticks delta(V), format id(V), [nargs(B)], args
+      arg:               'c' int8 | 'h' int16 | 'i' int32 | 'q' int64 | 'n' None | 'T' True | 'F' False
+                         'r' len(B) float as repr() text
+                         's' len(B) utf-8 | 'S' len(H) utf-8 | 'b' len(B) bytes | 'B' len(H) bytes
+                         '@' id(B) interned str/bytes | 'd' n(B), n key/value args | 'l' n(B), n args
+                         'x' len(B) | 'X' len(H) repr() text of an item inside a dict/list
+    All little endian, V is an unsigned varint (7 bits per byte, high bit set on all but the last byte).
+    head is the level code in the top 3 bits and the name id in the low 5. Level code 1-5 is DEBUG..CRITICAL
+    (level // 10), 0 means the level follows as a byte. Name id 31 means the id follows as a varint.
+    Ticks delta is ms since the previous record. Every flushed chunk of records starts its first record
+    with a time base (delta 0), so a file (or one that was appended to after a reboot) decodes on its own.
+    Logger names and format strings are written once and then referenced by id. Format id 0 means the
+    record carries the message (already formatted text, or a non-str msg such as a dict) as its only arg
+    and has no nargs byte. A str/bytes arg of up to _ARGLEN bytes seen a second time (a topic, a dict
+    key, a task name) is interned the same way, up to _ARGS of them, so RAM use stays bounded while
+    payloads that change every time are sent inline.
+    Other arg types (tuple, objects ...) are sent as their str(). host/logbench.py measures bytes/record. '''
+
+    def __init__(self, filename, mode='a', bufsize=512, flushtime=2000, flushlevel=ERROR, binary=False):
+        self.filename = filename
+        self.mode = mode[0] + 'b'   # First flush honours w/a. Records are already encoded so write binary
+        self.buf = bytearray(bufsize)
+        self.mv = memoryview(self.buf)
+        self.n = 0                  # Number of bytes waiting in buf
+        self.flushtime = flushtime
+        self.flushlevel = flushlevel
+        self.t0 = utime.ticks_ms()
+        self.binary = binary
+        self.names = {}             # Interned logger names -> id (binary only)
+        self.fmts = {}              # Interned format strings -> id. 0 is reserved for pre-formatted messages
+        self.args = {}              # Interned str/bytes args -> id
+        self.seen = {}              # Args seen once, interned when they come again
+        self.last = 0               # ticks_ms of the previous binary record
+        self.based = False          # A time base was written in the chunk now in buf
+
+    def record(self, logger, level, msg, args):
+        if self.binary:
+            self._timed(level, *self._pack(logger, level, msg, args))
+        else:
+            self.emit(level, ("%s,%s,%s\n" % (logger._level_str(level), logger.name, logger._render(msg, args))).encode())
+
+    def _pack(self, logger, level, msg, args):
+        # (head, body) of a binary record, the ticks delta goes between them (see _timed)
+        name = logger.name
+        nid = self.names.get(name)
+        if nid is None:
+            nid = len(self.names)
+            self.names[name] = nid
+            self.emit(NOTSET, self._define(0xFE, nid, name))
+        if callable(msg):
+            msg = msg()
+        fid = 0
+        if args and isinstance(msg, str):   # Only str formats are interned, msg can be any object (a dict)
+            fid = self.fmts.get(msg)
+            if fid is None and len(self.fmts) < 0xFFFF:
+                fid = len(self.fmts) + 1
+                self.fmts[msg] = fid
+                self.emit(NOTSET, self._define(0xFD, fid, msg))
+        if fid is None or (args and not fid):   # Table full or not a str format: send the formatted message
+            fid, msg = 0, logger._render(msg, args)
+        code = level // 10 if level in _level_dict else 0
+        head = bytearray(1)
+        head[0] = code << 5 | (nid if nid < 31 else 31)
+        if not code:
+            head.append(level & 0xFF)
+        if nid >= 31:
+            head += _varint(nid)
+        body = _varint(fid)
+        if not fid:
+            self._arg(body, msg)
+            return head, body
+        body.append(len(args))
+        for a in args:
+            self._arg(body, a)
+        return head, body
+
+    def _arg(self, body, a, depth=0):
+        # Append one arg to body. Dicts and lists go in item by item (their keys and short strings interned)
+        if a is True:
+            body += b'T'
+        elif a is False:
+            body += b'F'
+        elif isinstance(a, int) and -0x8000000000000000 <= a <= 0x7FFFFFFFFFFFFFFF:
+            if -0x80 <= a <= 0x7F:
+                body += b'c' + ustruct.pack("<b", a)
+            elif -0x8000 <= a <= 0x7FFF:
+                body += b'h' + ustruct.pack("<h", a)
+            elif -0x80000000 <= a <= 0x7FFFFFFF:
+                body += b'i' + ustruct.pack("<i", a)
+            else:
+                body += b'q' + ustruct.pack("<q", a)
+        elif isinstance(a, float):      # The text the board prints. Board floats are single precision,
+            body += self._sized(b'r', repr(a).encode())   # a packed float32/64 decodes to extra digits on the PC
+        elif a is None:
+            body += b'n'
+        elif isinstance(a, (bytes, str)) and len(a) <= _ARGLEN and self._intern(a) is not None:
+            body += b'@' + ustruct.pack("<B", self.args[a])
+        elif isinstance(a, (bytes, bytearray)):
+            body += self._sized(b'b', a)
+        elif isinstance(a, dict) and len(a) <= 0xFF and depth < 2:
+            body += b'd' + ustruct.pack("<B", len(a))
+            for k, v in a.items():
+                self._arg(body, k, depth + 1)
+                self._arg(body, v, depth + 1)
+        elif isinstance(a, list) and len(a) <= 0xFF and depth < 2:
+            body += b'l' + ustruct.pack("<B", len(a))
+            for v in a:
+                self._arg(body, v, depth + 1)
+        elif depth:                     # Inside a container the text is its repr(), as str(container) shows it
+            body += self._sized(b'x', repr(a).encode())
+        else:
+            body += self._sized(b's', str(a).encode())
+
+    def _intern(self, a):
+        # Id of a short str/bytes arg, None while it has only been seen once or the table is full
+        aid = self.args.get(a)
+        if aid is None and len(self.args) < _ARGS:
+            if a in self.seen:
+                del self.seen[a]
+                aid = len(self.args)
+                self.args[a] = aid
+                self.emit(NOTSET, self._define_arg(aid, a))
+            else:
+                if len(self.seen) >= _ARGS:
+                    self.seen.clear()
+                self.seen[a] = None
+        return aid
+
+    def _timed(self, level, head, body):
+        # Put the ticks delta in. The first record of a chunk carries a time base instead, so the chunk
+        # decodes without the records before it (they may be in the previous file after a rotation)
+        now = utime.ticks_ms()
+        while True:
+            if self.based:
+                rec = head + _varint(utime.ticks_diff(now, self.last)) + body
+            else:
+                rec = ustruct.pack("<BI", 0xFC, now & 0xFFFFFFFF) + head + b'\x00' + body
+            if not self.n or self.n + len(rec) <= len(self.buf):
+                break
+            self.flush()            # Doesn't fit, starts a new chunk: rebuild with a time base
+        self.based = True
+        self.last = now
+        self.emit(level, rec)
+
+    def _sized(self, tag, data):
+        # Short strings/bytes (most args: topics, payloads, names) take a 1 byte length, upper case tag for len(H)
+        if len(data) <= 0xFF:
+            return tag + ustruct.pack("<B", len(data)) + data
+        return tag.upper() + ustruct.pack("<H", len(data)) + data
+
+    def _define(self, kind, id, text):
+        text = text.encode()
+        return bytes([kind]) + _varint(id) + ustruct.pack("<B" if kind == 0xFE else "<H", len(text)) + text
+
+    def _define_arg(self, id, a):
+        tag = 0x62                  # 'b'
+        if isinstance(a, str):
+            tag, a = 0x73, a.encode()   # 's'
+        return ustruct.pack("<BBBB", 0xFB, id, tag, len(a)) + a
+
+    def definitions(self):
+        # Every name/format/arg definition so far. Written at the top of a fresh file after rotation
+        d = b''
+        for name, id in self.names.items():
+            d += self._define(0xFE, id, name)
+        for fmt, id in self.fmts.items():
+            d += self._define(0xFD, id, fmt)
+        for a, id in self.args.items():
+            d += self._define_arg(id, a)
+        return d
+
+    def emit(self, level, record):
+        n = len(record)
+        if self.n + n > len(self.buf):
+            self.flush()
+        if n > len(self.buf):       # Record bigger than the whole buffer, write it straight through
+            self._write(record)
+        else:
+            self.buf[self.n:self.n + n] = record
+            self.n += n
+        if level >= self.flushlevel or utime.ticks_diff(utime.ticks_ms(), self.t0) > self.flushtime:
+            self.flush()
+
+    def flush(self):
+        if self.n:
+            self._write(self.mv[:self.n])
+            self.n = 0
+        self.based = False          # Next chunk starts with a time base
+        self.t0 = utime.ticks_ms()
+
+    def _write(self, data):
+        with open(self.filename, self.mode) as f:
+            f.write(data)
+        self.mode = 'ab'            # Remaining flushes append
+
+
+class RotatingFileHandler(BufferedFileHandler):
+    ''' BufferedFileHandler that rolls the file over to file.1, file.2 ... once it would grow past maxbytes.
+    Sizes are tracked with in-memory byte counters (uos.stat is only called once at start up) so the
+    size check costs nothing per write. If a total budget is set (setBudget) the oldest backups across
+    all rotating handlers are deleted until every log file plus backups fits in the budget. Age is the
+    rotation order: backups found at start up are older than any made since, file.2 older than file.1. '''
+
+    def __init__(self, filename, mode='a', bufsize=512, flushtime=2000, flushlevel=ERROR, maxbytes=16384, backups=2, binary=False):
+        super().__init__(filename, mode, bufsize, flushtime, flushlevel, binary)
+        self.maxbytes = maxbytes
+        self.backups = backups
+        self.size = 0 if self.mode[0] == 'w' else self._stat(filename)
+        self.backupsizes = []       # backupsizes[0] is the size of filename.1
+        self.backupseqs = []        # Rotation number of each backup, smaller is older
+        for i in range(1, backups + 1):
+            size = self._stat(self._backup(i))
+            if size == 0:
+                break
+            self.backupsizes.append(size)
+            self.backupseqs.append(-i)
+
+    def _stat(self, filename):
+        try:
+            return uos.stat(filename)[6]
+        except OSError:
+            return 0
+
+    def _backup(self, i):
+        return "%s.%d" % (self.filename, i)
+
+    def _write(self, data):
+        if self.maxbytes and self.size and self.size + len(data) > self.maxbytes:
+            self.rotate()
+        super()._write(data)
+        self.size += len(data)
+        if _budget:
+            _check_budget()
+
+    def rotate(self):
+        global _rotations
+        if self.backups:
+            if len(self.backupsizes) == self.backups:   # Drop the oldest backup to make room
+                self.drop_oldest()
+            for i in range(len(self.backupsizes), 0, -1):
+                uos.rename(self._backup(i), self._backup(i + 1))
+            uos.rename(self.filename, self._backup(1))
+            self.backupsizes.insert(0, self.size)
+            _rotations += 1
+            self.backupseqs.insert(0, _rotations)
+        else:
+            uos.remove(self.filename)
+        self.size = 0
+        self.mode = 'wb'
+        if self.binary:             # New file needs the id tables before any record that uses them
+            defs = self.definitions()
+            BufferedFileHandler._write(self, defs)
+            self.size += len(defs)
+
+    def drop_oldest(self):
+        uos.remove(self._backup(len(self.backupsizes)))
+        self.backupsizes.pop()
+        self.backupseqs.pop()
+
+    def total(self):
+        return self.size + sum(self.backupsizes)
+
+
 class Logger:
 
     level = NOTSET
+    handler = None
 
-    def __init__(self, name, logfile, fmode, autoclose, filetime):
+    def __init__(self, name, logfile, fmode, autoclose, filetime, bufsize=LOG_BUFSIZE):
         self.name = name
+        self._eff = _level
         self.fileopen = False
         self.logfile = logfile
         self.mode = fmode
         self.autoclose = autoclose
-        if self.logfile is not None and MAIN_FILE_LOGGING: # If all modules writing to a single file use 'with' context manager
+        if self.logfile is not None and (bufsize or LOG_MAXBYTES): # Buffer records in RAM and write to flash in bulk
+            if MAIN_FILE_LOGGING:
+                self.logfile = MAIN_FILE_NAME
+                self.mode = MAIN_FILE_MODE
+            self.handler = getHandler(self.logfile, self.mode, bufsize, filetime)
+            if not MAIN_FILE_LOGGING and not self.handler.binary:
+                self.handler.emit(NOTSET, "Initialize file: {0} Initial mode was: {1}\n".format(self.logfile, self.mode).encode())
+        elif self.logfile is not None and MAIN_FILE_LOGGING: # If all modules writing to a single file use 'with' context manager
             self.logfile = MAIN_FILE_NAME 
             self.mode = MAIN_FILE_MODE
             self.fileopen = True
@@ -67,35 +362,46 @@ class Logger:
 
     def setLevel(self, level):
         self.level = level
+        self._eff = level or _level     # Cached effective level so disabled calls are a single compare
 
     def isEnabledFor(self, level):
-        return level >= (self.level or _level)
+        return level >= self._eff
+
+    def _render(self, msg, args):
+        # Deferred formatting. Only runs once the level check passed. msg can be a callable
+        # (ex: lambda: 'data %s' % ujson.dumps(data)) that is only called when the record is kept.
+        # Args are never called, a function or class passed as an arg is logged as is
+        if callable(msg):
+            msg = msg()
+        if args:
+            args = tuple(args)
+            try:
+                msg = str(msg) % args
+            except (TypeError, ValueError):     # Args don't match msg (or msg is a dict/list): log both as is
+                msg = "{0} {1}".format(msg, args)
+        return msg
 
     def log(self, level, msg, *args):
-        if level >= (self.level or _level):
+        if level >= self._eff:
+            if self.handler is not None:                        # Buffered, flushed to file in bulk
+                self.handler.record(self, level, msg, args)
+                return
+            msg = self._render(msg, args)
             if self.fileopen and self.autoclose:
                 with open(self.logfile, self.mode) as self.f:   # If multiple modules writing to file then open/close file safely
                     self.f.write("%s,%s," % (self._level_str(level), self.name))
-                    if not args:
-                        self.f.write("{0}\n".format(msg))
-                    else:
-                        self.f.write(msg % args)
+                    self.f.write("{0}\n".format(msg))
             elif self.fileopen and not self.autoclose:          # If single module writing to file then leave file open for faster writes. Doesn't work with multiple files
                 self.f.write("%s,%s," % (self._level_str(level), self.name))
-                if not args:
-                    self.f.write("{0}\n".format(msg))
-                else:
-                    self.f.write(msg % args)
+                self.f.write("{0}\n".format(msg))
             else:
                 #_stream.write("%s:%s:" % (self._level_str(level), self.name))
                 _stream.write("{0}{1}{2}:{3}:".format(_color[level], self._level_str(level), pcolor.ENDC, self.name))
-                if not args:
-                    print(msg, file=_stream)
-                else:
-                    print(msg % args, file=_stream)
+                print(msg, file=_stream)
 
     def debug(self, msg, *args):
-        self.log(DEBUG, msg, *args)
+        if DEBUG >= self._eff:          # Skip the log() call entirely when debug is off
+            self.log(DEBUG, msg, *args)
 
     def info(self, msg, *args):
         self.log(INFO, msg, *args)
@@ -122,15 +428,51 @@ class Logger:
 
 _level = INFO
 _loggers = {}
+_handlers = {}
+_budget = LOG_TOTALBYTES
+_rotations = 0      # Rotations so far, orders backups across handlers
 
-def getLogger(name, file=None, mode='wb', autoclose=True, filetime=2000):
+def getLogger(name, file=None, mode='wb', autoclose=True, filetime=2000, bufsize=LOG_BUFSIZE):
     if name in _loggers:
         return _loggers[name]
-    l = Logger(name, file, mode, autoclose, filetime)
+    l = Logger(name, file, mode, autoclose, filetime, bufsize)
     _loggers[name] = l
     #print('name:{0} dict:{1}'.format(name, _loggers))
     return l
 
+def getHandler(filename, mode='a', bufsize=LOG_BUFSIZE, flushtime=2000):
+    if filename in _handlers:   # Loggers writing to the same file share one buffer
+        return _handlers[filename]
+    if LOG_MAXBYTES:
+        h = RotatingFileHandler(filename, mode, bufsize, flushtime, ERROR, LOG_MAXBYTES, LOG_BACKUPS, LOG_BINARY)
+    else:
+        h = BufferedFileHandler(filename, mode, bufsize, flushtime, ERROR, LOG_BINARY)
+    _handlers[filename] = h
+    return h
+
+def flush():
+    for h in _handlers.values():
+        h.flush()
+
+def setBudget(nbytes):
+    global _budget
+    _budget = nbytes
+    if _budget:
+        _check_budget()
+
+def _check_budget():
+    rotating = [h for h in _handlers.values() if isinstance(h, RotatingFileHandler)]
+    total = sum(h.total() for h in rotating)
+    while total > _budget:
+        oldest = None   # Handler holding the oldest backup of all the log files
+        for h in rotating:
+            if h.backupseqs and (oldest is None or h.backupseqs[-1] < oldest.backupseqs[-1]):
+                oldest = h
+        if oldest is None:
+            break       # Only live files left. They are bounded by maxbytes
+        total -= oldest.backupsizes[-1]
+        oldest.drop_oldest()
+
 def info(msg, *args):
     getLogger(None).info(msg, *args)
 
@@ -140,9 +482,47 @@ def debug(msg, *args):
 def basicConfig(level=INFO, filename=None, stream=None, format=None):
     global _level, _stream
     _level = level
+    for l in _loggers.values():   # Refresh cached effective levels
+        l.setLevel(l.level)
     if stream:
         _stream = stream
     if filename is not None:
         print("logging.basicConfig: filename arg is not supported")
     if format is not None:
-        print("logging.basicConfig: format arg is not supported")
\ No newline at end of file
+        print("logging.basicConfig: format arg is not supported")
+
+if __name__ == "__main__":
+    # Compare the per-record open/close path against the buffered text and binary handlers. Run on the board
+    n = 200
+    for label, bufsize, binary in (('open/close per record', 0, False), ('buffered text', 512, False), ('buffered binary', 512, True)):
+        fname = 'bench{0}{1}.log'.format(bufsize, int(binary))
+        if bufsize:
+            logger = Logger('bench', None, 'w', True, 60000, bufsize)
+            logger.handler = BufferedFileHandler(fname, 'w', bufsize, 60000, ERROR, binary)
+        else:
+            logger = Logger('bench', fname, 'w', True, 60000, bufsize)
+        logger.setLevel(INFO)
+        t0 = utime.ticks_us()
+        for i in range(n):
+            logger.info('record %d value %d', i, i * 3)
+        if logger.handler is not None:
+            logger.handler.flush()
+        elapsed = utime.ticks_diff(utime.ticks_us(), t0)
+        size = uos.stat(fname)[6]
+        print('{0}: {1} records in {2} ms, {3:.1f} us/record, {4:.0f} records/sec, {5:.1f} bytes/record'.format(label, n, elapsed/1000, elapsed/n, n * 1000000/elapsed, size/n))
+        uos.remove(fname)
+
+    # Cost of a debug call while the logger is at INFO. Eager formats the string before the call, lazy defers it
+    import ujson
+    logger = Logger('bench', None, 'w', True, 0)
+    logger.setLevel(INFO)
+    topic, data = b'esp2nred/adc/esp', {'a0f': 1.6234, 'a1f': 0.0121, 'a2f': 3.3, 'a3f': 2.5}
+    t0 = utime.ticks_us()
+    for i in range(n):
+        logger.debug("Got data {} {}".format(topic, ujson.dumps(data)))
+    eager = utime.ticks_diff(utime.ticks_us(), t0)
+    t0 = utime.ticks_us()
+    for i in range(n):
+        logger.debug("Got data %s %s", topic, data)
+    lazy = utime.ticks_diff(utime.ticks_us(), t0)
+    print('disabled debug: eager {0:.1f} us/call, lazy {1:.1f} us/call'.format(eager/n, lazy/n))
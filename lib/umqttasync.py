@@ -0,0 +1,142 @@
+''' asyncio version of umqttsimple.MQTTClient. Runs under uasyncio on the board and asyncio on CPython.
+Reads and writes go through asyncio streams so a slow broker or a partial packet only suspends
+the coroutine that is waiting on it, the device tasks keep running.
+
+    client = MQTTClientAsync(client_id, server, user=user, password=password)
+    client.set_callback(on_message)            # on_message(topic, msg), same as MQTTClient
+    await client.connect()
+    await client.subscribe(b'nred2esp/servoZCMD/+')
+    asyncio.create_task(client.run())          # Receives messages and calls the callback
+    await client.publish(topic, payload)
+
+Only qos 0 publish/subscribe are supported.
+'''
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import ustruct as struct
+
+class MQTTException(Exception):
+    pass
+
+class MQTTClientAsync:
+
+    def __init__(self, client_id, server, port=1883, user=None, password=None, keepalive=0):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.pswd = password
+        self.keepalive = keepalive
+        self.cb = None
+        self.pid = 0
+        self.reader = None
+        self.writer = None
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def _str(self, s):
+        return struct.pack("!H", len(s)) + s
+
+    def _pkt(self, op, body):
+        # Fixed header + remaining length + body as one buffer so every packet is a single write
+        hdr = bytearray(5)
+        hdr[0] = op
+        sz = len(body)
+        i = 1
+        while sz > 0x7f:
+            hdr[i] = (sz & 0x7f) | 0x80
+            sz >>= 7
+            i += 1
+        hdr[i] = sz
+        return bytes(hdr[:i + 1]) + body
+
+    async def _send(self, pkt):
+        self.writer.write(pkt)
+        await self.writer.drain()
+
+    async def _recv(self):
+        # One packet: (first byte, body)
+        op = (await self.reader.readexactly(1))[0]
+        n = 0
+        sh = 0
+        while 1:
+            b = (await self.reader.readexactly(1))[0]
+            n |= (b & 0x7f) << sh
+            if not b & 0x80:
+                break
+            sh += 7
+        body = await self.reader.readexactly(n) if n else b''
+        return op, body
+
+    async def connect(self, clean_session=True):
+        self.reader, self.writer = await asyncio.open_connection(self.server, self.port)
+        var = bytearray(b"\x00\x04MQTT\x04\x02\0\0")
+        var[7] = clean_session << 1
+        payload = self._str(self.client_id)
+        if self.user is not None:
+            var[7] |= 0xC0
+            payload += self._str(self.user) + self._str(self.pswd)
+        var[8] = self.keepalive >> 8
+        var[9] = self.keepalive & 0x00FF
+        await self._send(self._pkt(0x10, bytes(var) + payload))
+        op, resp = await self._recv()
+        assert op == 0x20 and len(resp) == 2
+        if resp[1] != 0:
+            raise MQTTException(resp[1])
+        return resp[0] & 1
+
+    async def disconnect(self):
+        await self._send(b"\xe0\0")
+        self.writer.close()
+
+    def close(self):
+        # Drop a broken or half-open connection without sending DISCONNECT
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def ping(self):
+        await self._send(b"\xc0\0")
+
+    async def publish(self, topic, msg, retain=False):
+        if isinstance(msg, str):
+            msg = msg.encode()
+        await self._send(self._pkt(0x30 | retain, self._str(topic) + msg))
+
+    async def subscribe(self, topic, qos=0):
+        # Call before run(). Waits here for the SUBACK
+        assert self.cb is not None, "Subscribe callback is not set"
+        self.pid += 1
+        await self._send(self._pkt(0x82, struct.pack("!H", self.pid) + self._str(topic) + bytes([qos])))
+        while 1:
+            op, body = await self._recv()
+            if op == 0x90:
+                if body[2] == 0x80:
+                    raise MQTTException(body[2])
+                return
+            self._dispatch(op, body)
+
+    def _dispatch(self, op, body):
+        if op & 0xf0 != 0x30:
+            return op                  # PINGRESP, PUBACK etc. need no action for qos 0
+        topic_len = (body[0] << 8) | body[1]
+        i = 2 + topic_len
+        if op & 6:
+            i += 2
+        self.cb(body[2:2 + topic_len], body[i:])
+
+    async def run(self):
+        # Receive loop. Run as its own task. Ends with OSError if the broker closes the connection
+        try:
+            while 1:
+                op, body = await self._recv()
+                self._dispatch(op, body)
+        except EOFError:
+            raise OSError(-1)
@@ -3,6 +3,7 @@ try:
 except:
     import socket
 import ustruct as struct
+import utime
 from ubinascii import hexlify
 
 class MQTTException(Exception):
@@ -11,7 +12,8 @@ class MQTTException(Exception):
 class MQTTClient:
 
     def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
-                 ssl=False, ssl_params={}):
+                 ssl=False, ssl_params={}, pbufsize=256, inflight_max=8, retry_ms=2000, ping_grace_ms=5000,
+                 rbufsize=256, connect_timeout=5):
         if port == 0:
             port = 8883 if ssl else 1883
         self.client_id = client_id
@@ -29,21 +31,28 @@ class MQTTClient:
         self.lw_msg = None
         self.lw_qos = 0
         self.lw_retain = False
+        self.pbuf = bytearray(pbufsize)  # Reused by every publish: fixed header + topic + pid + payload in one write
+        self.topics = {}                 # topic -> length prefixed topic bytes, see prepare()
+        self.inflight = {}               # qos 1 pid -> [ticks_ms sent, topic, msg, retain] until PUBACK
+        self.inflight_max = inflight_max
+        self.retry_ms = retry_ms
+        self.retransmits = 0
+        self.ping_grace_ms = ping_grace_ms
+        self.last_tx = 0                 # ticks_ms of the last packet sent / received, for keepalive
+        self.last_rx = 0
+        self.ping_at = None              # ticks_ms of the PINGREQ still waiting for its PINGRESP
+        self.pings = 0
+        self.rbuf = bytearray(rbufsize)  # Receive buffer, see _read/_packet
+        self.rmv = memoryview(self.rbuf)
+        self.rpos = 0
+        self.rlen = 0
+        self.suback = None
+        self.connect_timeout = connect_timeout  # Seconds for the TCP connect and the CONNACK, an unreachable host would block forever
 
     def _send_str(self, s):
         self.sock.write(struct.pack("!H", len(s)))
         self.sock.write(s)
 
-    def _recv_len(self):
-        n = 0
-        sh = 0
-        while 1:
-            b = self.sock.read(1)[0]
-            n |= (b & 0x7f) << sh
-            if not b & 0x80:
-                return n
-            sh += 7
-
     def set_callback(self, f):
         self.cb = f
 
@@ -58,6 +67,7 @@ class MQTTClient:
     def connect(self, clean_session=True):
         self.sock = socket.socket()
         addr = socket.getaddrinfo(self.server, self.port)[0][-1]
+        self.sock.settimeout(self.connect_timeout)
         self.sock.connect(addr)
         if self.ssl:
             import ussl
@@ -100,6 +110,10 @@ class MQTTClient:
         assert resp[0] == 0x20 and resp[1] == 0x02
         if resp[3] != 0:
             raise MQTTException(resp[3])
+        self.sock.settimeout(None)
+        self.last_tx = self.last_rx = utime.ticks_ms()
+        self.ping_at = None
+        self.rpos = self.rlen = 0         # Nothing left over from the previous connection
         return resp[2] & 1
 
     def disconnect(self):
@@ -108,10 +122,85 @@ class MQTTClient:
 
     def ping(self):
         self.sock.write(b"\xc0\0")
+        self.last_tx = utime.ticks_ms()
+        if self.ping_at is None:
+            self.ping_at = self.last_tx
+            self.pings += 1
+
+    # Called by check_msg, no timer needed. With keepalive set a PINGREQ goes out once the link has been
+    # quiet for keepalive/2 seconds, quiet meaning nothing sent or nothing received (a device that only
+    # publishes qos 0 never hears from the broker otherwise). No PINGRESP within ping_grace_ms = dead link,
+    # OSError is raised so the caller reconnects instead of finding out when a publish finally fails
+    def _keepalive(self):
+        now = utime.ticks_ms()
+        if self.ping_at is not None:
+            if utime.ticks_diff(now, self.ping_at) >= self.ping_grace_ms:
+                self.ping_at = None
+                raise OSError(110)      # ETIMEDOUT
+            return
+        idle = self.keepalive * 500
+        if utime.ticks_diff(now, self.last_tx) >= idle or utime.ticks_diff(now, self.last_rx) >= idle:
+            self.ping()
 
+    # Pre-encode the length prefixed topic. Publish topics never change so this is done once per topic
+    # (publish calls it too). Capped so per-message topics can't grow the cache without bound
+    def prepare(self, topic):
+        t = self.topics.get(topic)
+        if t is None:
+            t = struct.pack("!H", len(topic)) + topic
+            if len(self.topics) < 32:
+                self.topics[topic] = t
+        return t
+
+    # qos 1 publish returns the packet id straight away. The message stays in self.inflight until its
+    # PUBACK arrives (handled by wait_msg/check_msg). check_msg resends anything older than retry_ms with
+    # the DUP flag. Only when inflight_max messages are waiting does publish stop and wait for a PUBACK.
     def publish(self, topic, msg, retain=False, qos=0):
+        if isinstance(msg, str):
+            msg = msg.encode()
+        pid = 0
+        if qos == 1:
+            while len(self.inflight) >= self.inflight_max:
+                if self.check_msg() is None:
+                    utime.sleep_ms(1)
+            pid = self._next_pid()
+            if not isinstance(msg, bytes):  # Caller may reuse its buffer before the PUBACK, keep a copy
+                msg = bytes(msg)
+            self.inflight[pid] = [utime.ticks_ms(), topic, msg, retain]
+        elif qos == 2:
+            assert 0
+        self._send_publish(topic, msg, retain, qos, pid, 0)
+        return pid
+
+    def _send_publish(self, topic, msg, retain, qos, pid, dup):
+        self.last_tx = utime.ticks_ms()
+        t = self.prepare(topic)
+        sz = len(t) + len(msg)
+        if qos > 0:
+            sz += 2
+        if sz + 5 > len(self.pbuf):     # Too big for the buffer, send it in pieces
+            return self._publish_parts(topic, msg, retain, qos, pid, dup)
+        pkt = self.pbuf
+        pkt[0] = 0x30 | dup << 3 | qos << 1 | retain
+        i = 1
+        while sz > 0x7f:
+            pkt[i] = (sz & 0x7f) | 0x80
+            sz >>= 7
+            i += 1
+        pkt[i] = sz
+        i += 1
+        pkt[i:i + len(t)] = t
+        i += len(t)
+        if qos > 0:
+            struct.pack_into("!H", pkt, i, pid)
+            i += 2
+        pkt[i:i + len(msg)] = msg
+        i += len(msg)
+        self.sock.write(pkt, i)
+
+    def _publish_parts(self, topic, msg, retain, qos, pid, dup):
         pkt = bytearray(b"\x30\0\0\0")
-        pkt[0] |= qos << 1 | retain
+        pkt[0] |= dup << 3 | qos << 1 | retain
         sz = 2 + len(topic) + len(msg)
         if qos > 0:
             sz += 2
@@ -126,82 +215,187 @@ class MQTTClient:
         self.sock.write(pkt, i + 1)
         self._send_str(topic)
         if qos > 0:
-            self.pid += 1
-            pid = self.pid
             struct.pack_into("!H", pkt, 0, pid)
             self.sock.write(pkt, 2)
         self.sock.write(msg)
-        if qos == 1:
-            while 1:
-                op = self.wait_msg()
-                if op == 0x40:
-                    sz = self.sock.read(1)
-                    assert sz == b"\x02"
-                    rcv_pid = self.sock.read(2)
-                    rcv_pid = rcv_pid[0] << 8 | rcv_pid[1]
-                    if pid == rcv_pid:
-                        return
-        elif qos == 2:
-            assert 0
+
+    def _next_pid(self):
+        # 1..65535, skipping ids still waiting for a PUBACK
+        self.pid = self.pid % 0xFFFF + 1
+        while self.pid in self.inflight:
+            self.pid = self.pid % 0xFFFF + 1
+        return self.pid
+
+    def _retransmit(self):
+        now = utime.ticks_ms()
+        for pid, m in self.inflight.items():
+            if utime.ticks_diff(now, m[0]) >= self.retry_ms:
+                m[0] = now
+                self.retransmits += 1
+                self._send_publish(m[1], m[2], m[3], 1, pid, 1)
 
     def subscribe(self, topic, qos=0):
         assert self.cb is not None, "Subscribe callback is not set"
         pkt = bytearray(b"\x82\0\0\0")
-        self.pid += 1
-        struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, self.pid)
+        pid = self._next_pid()
+        struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, pid)
         #print(hex(len(pkt)), hexlify(pkt, ":"))
         self.sock.write(pkt)
         self._send_str(topic)
         self.sock.write(qos.to_bytes(1, "little"))
+        self.last_tx = utime.ticks_ms()
+        self.suback = None
         while 1:
             op = self.wait_msg()
-            if op == 0x90:
-                resp = self.sock.read(4)
-                #print(resp)
-                assert resp[1] == pkt[2] and resp[2] == pkt[3]
-                if resp[3] == 0x80:
-                    raise MQTTException(resp[3])
+            if op == 0x90 and self.suback is not None:
+                assert self.suback[0] == pid
+                if self.suback[1] == 0x80:
+                    raise MQTTException(self.suback[1])
                 return
 
+    # Receive path. Bytes are read with readinto into self.rbuf (reused, grown only for a packet bigger
+    # than it) and packets are parsed out of it incrementally: a packet that has only partly arrived stays
+    # in the buffer until the rest does, so a slow or fragmented packet never blocks check_msg.
+    # rbuf[rpos:rlen] holds the bytes not parsed yet.
+    def _read(self, block):
+        # Append whatever the socket has. Returns the byte count, 0 when nothing is waiting (non-blocking)
+        if self.rlen == len(self.rbuf) and self.rpos:
+            n = self.rlen - self.rpos
+            if n <= self.rpos:
+                self.rbuf[:n] = self.rmv[self.rpos:self.rlen]   # No overlap, copy in place
+            else:
+                self.rbuf[:n] = bytes(self.rmv[self.rpos:self.rlen])
+            self.rpos, self.rlen = 0, n
+        self.sock.setblocking(block)
+        try:
+            n = self.sock.readinto(self.rmv[self.rlen:])
+        finally:
+            self.sock.setblocking(True)   # Writes (publish, PUBACK) always block
+        if n is None:
+            return 0
+        if n == 0:
+            raise OSError(-1)             # Closed by the broker
+        self.rlen += n
+        self.last_rx = utime.ticks_ms()
+        return n
+
+    def _packet(self):
+        # Process the next complete packet in rbuf and return its type byte. None if it hasn't all arrived
+        buf = self.rbuf
+        i = self.rpos
+        if self.rlen - i < 2:
+            return None
+        op = buf[i]
+        sz = sh = 0
+        j = i + 1
+        while 1:
+            if j >= self.rlen:
+                return None
+            b = buf[j]
+            j += 1
+            sz |= (b & 0x7f) << sh
+            if not b & 0x80:
+                break
+            sh += 7
+        end = j + sz
+        if end > self.rlen:
+            if end - i > len(buf):        # Bigger than the buffer, grow it to fit this packet
+                self.rbuf = bytearray(end - i)
+                self.rbuf[:self.rlen - i] = self.rmv[i:self.rlen]
+                self.rmv = memoryview(self.rbuf)
+                self.rlen -= i
+                self.rpos = 0
+            return None
+        self.rpos = end                   # Consumed. Reset to the start once everything is parsed
+        if end == self.rlen:
+            self.rpos = self.rlen = 0
+        if op == 0xd0:                    # PINGRESP
+            self.ping_at = None
+        elif op == 0x40:                  # PUBACK for a qos 1 publish
+            self.inflight.pop(buf[j] << 8 | buf[j + 1], None)
+        elif op == 0x90:                  # SUBACK, checked by subscribe()
+            self.suback = (buf[j] << 8 | buf[j + 1], buf[j + 2])
+        elif op & 0xf0 == 0x30:           # PUBLISH
+            tlen = buf[j] << 8 | buf[j + 1]
+            topic = bytes(self.rmv[j + 2:j + 2 + tlen])
+            j += 2 + tlen
+            if op & 6:
+                pid = buf[j] << 8 | buf[j + 1]
+                j += 2
+            msg = bytes(self.rmv[j:end])  # Copies, the callback may keep topic and msg
+            self.cb(topic, msg)
+            if op & 6 == 2:
+                pkt = bytearray(b"\x40\x02\0\0")
+                struct.pack_into("!H", pkt, 2, pid)
+                self.sock.write(pkt)
+                self.last_tx = self.last_rx
+            elif op & 6 == 4:
+                assert 0
+        return op
+
     # Wait for a single incoming MQTT message and process it.
     # Subscribed messages are delivered to a callback previously
     # set by .set_callback() method. Other (internal) MQTT
     # messages processed internally.
     def wait_msg(self):
-        res = self.sock.read(1)
-        self.sock.setblocking(True)
-        if res is None:
-            return None
-        if res == b"":
-            raise OSError(-1)
-        if res == b"\xd0":  # PINGRESP
-            sz = self.sock.read(1)[0]
-            assert sz == 0
-            return None
-        op = res[0]
-        if op & 0xf0 != 0x30:
-            return op
-        sz = self._recv_len()
-        topic_len = self.sock.read(2)
-        topic_len = (topic_len[0] << 8) | topic_len[1]
-        topic = self.sock.read(topic_len)
-        sz -= topic_len + 2
-        if op & 6:
-            pid = self.sock.read(2)
-            pid = pid[0] << 8 | pid[1]
-            sz -= 2
-        msg = self.sock.read(sz)
-        self.cb(topic, msg)
-        if op & 6 == 2:
-            pkt = bytearray(b"\x40\x02\0\0")
-            struct.pack_into("!H", pkt, 2, pid)
-            self.sock.write(pkt)
-        elif op & 6 == 4:
-            assert 0
+        while 1:
+            op = self._packet()
+            if op is not None:
+                return op
+            self._read(True)
 
     # Checks whether a pending message from server is available.
-    # If not, returns immediately with None. Otherwise, does
-    # the same processing as wait_msg.
+    # If not, returns immediately with None. Otherwise processes
+    # every complete packet that has arrived (several per call) and
+    # returns the type of the last one. Also resends qos 1 messages
+    # whose PUBACK is overdue and keeps the link alive.
     def check_msg(self):
-        self.sock.setblocking(False)
-        return self.wait_msg()
\ No newline at end of file
+        n, op = self._drain(None, None)
+        return op
+
+    # check_msg with a bound: stops after max_pkts packets or budget_us microseconds (None = no limit),
+    # whichever comes first, so a burst of commands can't hold up the loop. Returns (processed, remaining)
+    # where remaining estimates the packets already received and still waiting (0 = caught up)
+    def drain(self, max_pkts=16, budget_us=5000):
+        n, op = self._drain(max_pkts, budget_us)
+        if max_pkts is not None and n >= max_pkts and self.rlen < len(self.rbuf):
+            self._read(False)             # Stopped on the limit, look at what else has arrived
+        return n, self._pending()
+
+    def _drain(self, max_pkts, budget_us):
+        t0 = utime.ticks_us()
+        n = 0
+        op = None
+        while max_pkts is None or n < max_pkts:
+            p = self._packet()
+            if p is not None:
+                op = p
+                n += 1
+                if budget_us is not None and utime.ticks_diff(utime.ticks_us(), t0) >= budget_us:
+                    break
+            elif not self._read(False):
+                break
+        if self.inflight:
+            self._retransmit()
+        if self.keepalive:
+            self._keepalive()
+        return n, op
+
+    def _pending(self):
+        # Packets in rbuf not processed yet, a partly received one included
+        buf = self.rbuf
+        n = 0
+        i = self.rpos
+        while i < self.rlen:
+            n += 1
+            j = i + 1
+            sz = sh = 0
+            while j < self.rlen:
+                b = buf[j]
+                j += 1
+                sz |= (b & 0x7f) << sh
+                if not b & 0x80:
+                    break
+                sh += 7
+            i = j + sz
+        return n
@@ -1,9 +1,18 @@
-from boot import MAIN_FILE_LOGGING, MAIN_FILE_MODE, MAIN_FILE_NAME, MAIN_FILE_OW, CPUFREQ, logfiles, rtc # Can remove for final code. Helps with python intellisense (syntax highlighting)
-import utime, uos, ubinascii, micropython, network, re, ujson, ulogging
-from timer import Timer, TimerFunc
+from boot import MAIN_FILE_LOGGING, MAIN_FILE_MODE, MAIN_FILE_NAME, MAIN_FILE_OW, CPUFREQ, LOG_BINARY, logfiles, rtc # Can remove for final code. Helps with python intellisense (syntax highlighting)
+import utime, uos, ubinascii, micropython, network, ujson, ulogging
+from timer import Timer, TimerFunc, Profiler
+from scheduler import Scheduler
+from pubqueue import PublishQueue
+from outbox import Outbox
+from mqttconn import MQTTConnection
+from router import TopicRouter
+from payload import SchemaJSON, SchemaStruct
+import timer
 from mytools import pcolor, rtcdate, localdate
 from machine import Pin, ADC, PWM, RTC
 from lib.umqttsimple import MQTTClient
+from umqttasync import MQTTClientAsync, MQTTException as MQTTAsyncException
+import uasyncio as asyncio, asyncdevices
 import machine, sys
 import gc
 gc.collect()
@@ -13,19 +22,16 @@ tmain = Timer()
 tmain.start()
 
 def connect_wifi(WIFI_SSID, WIFI_PASSWORD):
+    # Start joining and return straight away. MQTTConnection waits for station.isconnected() before using the network
     station = network.WLAN(network.STA_IF)
 
     station.active(True)
-    station.connect(WIFI_SSID, WIFI_PASSWORD)
-
-    while station.isconnected() == False:
-        pass
-
-    main_logger.info('Connection successful')
-    main_logger.info(station.ifconfig())
+    if not station.isconnected():
+        station.connect(WIFI_SSID, WIFI_PASSWORD)
+    return station
 
 def mqtt_setup(IPaddress):
-    global MQTT_CLIENT_ID, MQTT_SERVER, MQTT_USER, MQTT_PASSWORD, MQTT_SUB_TOPIC, MQTT_REGEX, MQTT_PUB_LVL1, MQTT_SUB_LVL1, ESPID
+    global MQTT_CLIENT_ID, MQTT_SERVER, MQTT_USER, MQTT_PASSWORD, MQTT_SUB_TOPIC, MQTT_PUB_LVL1, MQTT_SUB_LVL1, ESPID, station
     with open("stem", "r") as f:    # Remove and over-ride MQTT/WIFI login info below
       stem = f.read().splitlines()
     MQTT_SERVER = IPaddress   # Over ride with MQTT/WIFI info
@@ -33,47 +39,46 @@ def mqtt_setup(IPaddress):
     MQTT_PASSWORD = stem[1]
     WIFI_SSID = stem[2]
     WIFI_PASSWORD = stem[3]
-    connect_wifi(WIFI_SSID, WIFI_PASSWORD)
+    station = connect_wifi(WIFI_SSID, WIFI_PASSWORD)
     MQTT_CLIENT_ID = ubinascii.hexlify(machine.unique_id())
     # Specific MQTT SUBSCRIBE/PUBLISH TOPICS created inside 'setup_device' function
     MQTT_SUB_TOPIC = []
     MQTT_SUB_LVL1 = b'nred2' + ESPID  # Items that are sent as part of mqtt topic will be binary (b'item)
-    MQTT_REGEX = rb'nred2esp/([^/]+)/([^/]+)' # b'txt' is binary format. Required for umqttsimple to save memory
-                                              # r'txt' is raw format for easier reg ex matching
-                                              # 'nred2esp/+' would also work but would not return groups
-                                              # () group capture. Useful for getting topic lvls in on_message
-                                              # [^/] match a char except /. Needed to get topic lvl2, lvl3 groups
-                                              # + will match one or more. Requiring at least 1 match forces a lvl1/lvl2/lvl3 topic structure
-                                              # * could also be used for last group and then a lvl1/lvl2 topic would also be matched
+    # Incoming topics are matched with the router (handlers registered in setup_device), not a regex.
+    # Subscribe topics are nred2esp/<lvl2>ZCMD/+ and the + level (ex: servo ID) is passed to the handler
     MQTT_PUB_LVL1 = b'esp2nred/'
 
-def mqtt_connect_subscribe():
+def mqtt_connection():
+    # Client wrapped in a connection manager. A lost broker reconnects in the background (backoff + jitter)
+    # while the main loop keeps running. clean_session=False so the broker keeps our subscriptions
     global MQTT_CLIENT_ID, MQTT_SERVER, MQTT_SUB_TOPIC, MQTT_USER, MQTT_PASSWORD
-    client = MQTTClient(MQTT_CLIENT_ID, MQTT_SERVER, user=MQTT_USER, password=MQTT_PASSWORD)
+    client = MQTTClient(MQTT_CLIENT_ID, MQTT_SERVER, user=MQTT_USER, password=MQTT_PASSWORD,
+                        keepalive=30, ping_grace_ms=5000)  # check_msg pings after 15 s of quiet, no PINGRESP in 5 s = dead link
     client.set_callback(mqtt_on_message)
-    client.connect()
-    main_logger.info('(CONNACK) Connected to {0} MQTT broker'.format(MQTT_SERVER))
-    for topics in MQTT_SUB_TOPIC:
-        client.subscribe(topics)
-        main_logger.info('Subscribed to {0}'.format(topics)) 
-    return client
+    for device in deviceD:
+        if isinstance(deviceD[device], dict):   # Pre-encode publish topics so publish only copies the payload
+            client.prepare(deviceD[device]['pubtopic'])
+    return MQTTConnection(client, MQTT_SUB_TOPIC, station, clean_session=False, backoff_ms=500, backoff_max_ms=4000,
+                          onconnect=mqtt_on_connect, logger=main_logger)
+
+def mqtt_on_connect(conn):
+    main_logger.info('(CONNACK) Connected to {0} MQTT broker. Subscribed to {1}'.format(MQTT_SERVER, MQTT_SUB_TOPIC))
+    conn.publish(b'esp32status', ESPID + b' connected, entering main loop')
+    for device in deviceD:   # Layout of every struct payload, retained so the decoder gets it whenever it starts
+        if isinstance(deviceD[device], dict) and isinstance(deviceD[device]['encode'], SchemaStruct):
+            schema = deviceD[device]['encode'].describe()  # Schema ids are per board, ESPID keeps boards apart
+            schema['board'] = ESPID.decode()
+            conn.publish(MQTT_PUB_LVL1 + b'schema/' + ESPID + b'/' + str(schema['id']).encode(), ujson.dumps(schema), True)
 
 def mqtt_on_message(topic, msg):
-    global MQTT_REGEX                    # Standard variables for mqtt projects
-    global mqtt_servo_duty, mqtt_servoID # Specific for servo
-    main_logger.debug("Received topic(tag): {0} payload:{1}".format(topic, msg.decode("utf-8", "ignore")))
-    msgmatch = re.match(MQTT_REGEX, topic)
-    if msgmatch:
-        mqtt_payload = ujson.loads(msg.decode("utf-8", "ignore")) # decode json data
-        mqtt_topic = [msgmatch.group(0), msgmatch.group(1), msgmatch.group(2), type(mqtt_payload)]
-        if mqtt_topic[1] == b'servoZCMD':
-            mqtt_servoID = int(mqtt_topic[2])
-            mqtt_servo_duty = int(mqtt_payload)  # Set the servo duty from mqtt payload
-
-def mqtt_reset():
-    main_logger.info('Failed to connect to MQTT broker. Reconnecting...')
-    utime.sleep_ms(5000)
-    machine.reset()
+    main_logger.debug("Received topic(tag): %s payload:%s", topic, msg)  # Lazy args, only formatted if debug enabled
+    if not router.route(topic, msg):  # Calls the handler of each device whose subscribe topic matches
+        main_logger.debug("No handler for %s", topic)
+
+def servo_cmd(topic, msg, params):   # nred2esp/servoZCMD/<servoID>, params = (servoID,)
+    global mqtt_servo_duty, mqtt_servoID
+    mqtt_servoID = int(params[0])
+    mqtt_servo_duty = int(ujson.loads(msg.decode("utf-8", "ignore")))  # Set the servo duty from mqtt payload
 
 def setup_logging(logfile, logger_type="custom", logger_name=__name__, FileMode=1, autoclose=True, logger_log_level=20, filetime=5000):
     if logger_type == 'basic': # Use basicConfig logger
@@ -90,23 +95,34 @@ def setup_logging(logfile, logger_type="custom", logger_name=__name__, FileMode=
         templogger = ulogging.getLogger(logger_name, MAIN_FILE_NAME, MAIN_FILE_MODE, 0)  # over ride with MAIN_FILE settings in boot.py
         templogger.setLevel(logger_log_level)
     
-    if MAIN_FILE_LOGGING:
+    if MAIN_FILE_LOGGING and LOG_BINARY:    # Binary file only holds records host/logdecode.py can read, no text header
+        open(MAIN_FILE_NAME, MAIN_FILE_OW[0] + 'b').close()
+        print("cpu freq: {0} GHz".format(CPUFREQ/10**9))
+    elif MAIN_FILE_LOGGING:
         with open(MAIN_FILE_NAME, MAIN_FILE_OW) as f:
             f.write("cpu freq: {0} GHz\n".format(CPUFREQ/10**9)) 
             f.write("All module debugging will write to file: {0} with mode: {1}\n".format(MAIN_FILE_NAME, MAIN_FILE_MODE))
             if machine.reset_cause() == machine.DEEPSLEEP_RESET:
                 f.write('{0}, woke from a deep sleep'.format(utime.localtime()))
+    if MAIN_FILE_LOGGING:
         print("All module debugging will write to file: {0} with mode: {1}\n".format(MAIN_FILE_NAME, MAIN_FILE_MODE))
         logfiles.append(MAIN_FILE_NAME)   
     return templogger
 
-def setup_device(device, lvl2, publvl3, data_keys):
+def setup_device(device, lvl2, publvl3, data_keys, handler=None, codec='json'):
+    # handler(topic, msg, params) is called for messages on the device's subscribe topic (see router.py)
+    # codec 'json'    ujson.dumps (default)
+    #       'schema'  payload.SchemaJSON, JSON skeleton built once from the keys. Floats are rounded to 4 decimals.
+    #                 Only faster than ujson.dumps for int payloads on the PC (host/payloadbench.py), measure on the board first
+    #       'struct'  payload.SchemaStruct, ~3-4x smaller, floats sent as float32. Decode with host/payloaddecode.py
     global printcolor, deviceD
     if deviceD.get(device) == None:
         deviceD[device] = {}
         deviceD[device]['data'] = {}
         deviceD[device]['lvl2'] = lvl2 # Sub/Pub lvl2 in topics. Does not have to be unique, can piggy-back on another device lvl2
         topic = MQTT_SUB_LVL1 + b"/" + deviceD[device]['lvl2'] + b"ZCMD/+"
+        if handler is not None:
+            router.add(topic, handler)
         if topic not in MQTT_SUB_TOPIC:
             MQTT_SUB_TOPIC.append(topic)
             for key in data_keys:
@@ -118,7 +134,12 @@ def setup_device(device, lvl2, publvl3, data_keys):
                         main_logger.warning("**DUPLICATE WARNING" + device + " and " + item + " are both publishing " + key + " on " + topic)
                 deviceD[device]['data'][key] = 0
         deviceD[device]['pubtopic'] = MQTT_PUB_LVL1 + lvl2 + b"/" + publvl3
-        deviceD[device]['send'] = False
+        if codec == 'struct':
+            deviceD[device]['encode'] = SchemaStruct(data_keys, len(deviceD))  # Schema id = device number on this board, published on connect
+        elif codec == 'schema':
+            deviceD[device]['encode'] = SchemaJSON(data_keys, precision=4)  # Only values written per publish
+        else:
+            deviceD[device]['encode'] = ujson.dumps
         printcolor = not printcolor # change color of every other print statement
         if printcolor: 
             main_logger.info("{0}{1} Subscribing to: {2}{3}".format(pcolor.LBLUE, device, topic, pcolor.ENDC))
@@ -135,6 +156,7 @@ def setup_device(device, lvl2, publvl3, data_keys):
 # If wanting all modules to write to the same MAIN FILE then enable MAIN_FILE_LOGGING in boot.py
 # If wanting modules to each write to individual files then make sure autoclose=True (safe with file open/close)
 # If wanting a single module to quickly write to a log file then only enable one module and set autoclose=False
+# LOG_BUFSIZE in boot.py > 0 buffers records in RAM and writes them in bulk (over-rides autoclose). Call ulogging.flush() before reading logs
 # If logger_type == 'custom'  then access to modes below
             #  FileMode == 1 # console output (no log file)
             #  FileMode == 2 # write to log file (no console output)
@@ -151,6 +173,7 @@ ESPID = b'esp'  # Specific MQTT_PUB_TOPICS created at time of publishing using s
 mqtt_setup('10.0.0.115')  # Setup mqtt variables (topics and data containers) used in on_message, main loop, and publishing
 
 deviceD = {}       # Primary container for storing all topics and data
+router = TopicRouter()  # Subscribe topic -> device handler, filled in by setup_device
 printcolor = True
 pinsummary = []
 t = Timer()
@@ -162,10 +185,10 @@ device = 'servoDuty'
 lvl2 = b'servo'
 publvl3 = ESPID + b""
 data_keys = ['NA']             # Servo currently does not publish any data back to mqtt
-setup_device(device, lvl2, publvl3, data_keys)
+setup_device(device, lvl2, publvl3, data_keys, servo_cmd)  # servoZCMD/<servoID> messages go to servo_cmd
 servo = []
 servopins = [22, 23]
-servoID, mqtt_servoID = 0, 0   # Initialize. Updated in mqtt on_message
+servoID, mqtt_servoID = 0, 0   # Initialize. Updated in servo_cmd
 mqtt_servo_duty = 0  # container for mqtt servo duty
 deviceD[device] = []
 for i, pin in enumerate(servopins):
@@ -185,7 +208,7 @@ device = 'rotEnc1'
 lvl2 = b'rotencoder'
 publvl3 = ESPID + b""
 data_keys = ['RotEnc1Ci', 'RotEnc1Bi']
-setup_device(device, lvl2, publvl3, data_keys)
+setup_device(device, lvl2, publvl3, data_keys)  # codec='struct' for a 10 byte binary payload instead of JSON
 clkPin, dtPin, button_rotenc = 15, 4, 25
 pinsummary.append(clkPin)
 pinsummary.append(dtPin)
@@ -195,79 +218,134 @@ if button_rotenc is not None: pinsummary.append(button_rotenc)
 
 main_logger.info('Pins in use:{0}'.format(sorted(pinsummary)))
 #==========#
-# Connect and create the client
-try:
-    mqtt_client = mqtt_connect_subscribe()
-except OSError as e:
-    mqtt_reset()
-# MQTT setup is successful, publish status msg and flash on-board led
-mqtt_client.publish(b'esp32status', ESPID + b' connected, entering main loop')
+outbox = Outbox('outbox', segbytes=4096, maxsegs=8)  # Publishes made while the broker is down. Max ~32kb of flash
+# Create the client. If Wi-Fi or the broker are not up yet the main loop starts anyway and check_msg keeps retrying
+mqtt_conn = mqtt_connection()
+mqtt_conn.connect()
 # Period or frequency to check msgs, get data, publish msgs
 on_msg_timer_ms = 400           # How frequently to check for messages. Takes ~ 2ms to check for msg
+msg_max_pkts, msg_budget_us = 16, 3000  # Per check: stop after this many packets or us. A backlog is finished off by the poll task
 getdata_sndmsg_timer_ms =100   # How frequently to get device data and send messages. Can take > 7ms to publish msgs  
-t0onmsg_ms = utime.ticks_ms()
-utime.sleep_ms(250) # Number of ms delay between on_msg and data publish. Used to stagger timers for checking msgs, getting data, and publishing msgs
-t0_datapub_ms = utime.ticks_ms()
-
-t0loop_us = utime.ticks_us()
-checkmsgs = False
-getdata = False
-sendmsgs = False
-t = Timer()
-
-if utime.ticks_diff(utime.ticks_ms(), t0onmsg_ms) > on_msg_timer_ms:
-    checkmsgs = True
-    t0onmsg_ms = utime.ticks_ms()
-
-if utime.ticks_diff(utime.ticks_ms(), t0_datapub_ms) > getdata_sndmsg_timer_ms:
-    getdata = True
-    sendmsgs = True
-    t0_datapub_ms = utime.ticks_ms()
-
-if checkmsgs:
-    mqtt_client.check_msg()
-    checkmsgs = False
-
-servoID = mqtt_servoID                             # Servo commands coming from mqtt but could change it to a difference source
-deviceD['servoDuty'][servoID] = mqtt_servo_duty
-servo[servoID].duty(deviceD['servoDuty'][servoID]) # Send new servo duty value to servo
-
-for device, rotenc in rotaryEncoderSet.items():
-    deviceD[device]['data'] = rotenc.getdata()
-    if deviceD[device]['data'] is not None:
-        deviceD[device]['send'] = True
-        main_logger.debug("Got data {} {}".format(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data'])))
-        sendmsgs = True
-
-if getdata:
-    t.start()
-    #for device, adc in adcSet.items():
-    #    deviceD[device]['data'] = adc.getdata()
-    #    if buttonADC_pressed or deviceD[device]['data'] is not None:         # Update if button pressed or voltage changed or time limit hit
-    #        deviceD[device]['send'] = True
-    #        if deviceD[device]['data'] is not None:
-    #            main_logger.debug("Got data {} {}".format(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data'])))       
-    #        if switchON: deviceD[device]['data']['buttoni'] = str(buttonADC.value())
-    #        buttonADC_pressed = False
-    getdata = False
-    getdata_time = t.stop()
-    main_logger.debug("Get data took: {0} ms".format(getdata_time/1000))
-
-if sendmsgs:
-    t.start()
-    for device, rotenc in rotaryEncoderSet.items():
-        if deviceD[device]['send']:
-            mqtt_client.publish(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data']))
-            main_logger.debug('Published msg {0} with payload {1}'.format(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data'])))
-            deviceD[device]['send'] = False
-    #for device, adc in adcSet.items():
-    #    if deviceD[device]['send']:
-    #        mqtt_client.publish(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data']))
-    #        main_logger.debug("Published msg {} {}".format(deviceD[device]['pubtopic'], ujson.dumps(deviceD[device]['data'])))
-    #        deviceD[device]['send'] = False
-    sendmsgs = False
-    sendmsg_time = t.stop()
-    main_logger.debug("Sending msg took: {0} ms".format(sendmsg_time/1000))
+stagger_ms = 250                # Offset between on_msg and data publish. Used to stagger timers for checking msgs, getting data, and publishing msgs
+poll_timer_ms = 10              # How frequently to update the servo and poll the rotary encoder
+loop_runtime_ms = 10000         # How long to run the main loop before the timing demos below. None = run forever
+RUNTIME = 'sched'               # 'sched' cooperative scheduler loop or 'async' uasyncio tasks (umqttasync client)
+prof = Profiler()  # Breakdown of where each loop phase's time goes. prof.tree() to log it
+pubqueue = PublishQueue(mqtt_conn, ujson.dumps, coalesce=True, combined_topic=None, logger=main_logger, outbox=outbox) # combined_topic=MQTT_PUB_LVL1 + b'all/' + ESPID to pack all devices in one msg
+for device in deviceD:
+    if isinstance(deviceD[device], dict):
+        pubqueue.set_encoder(deviceD[device]['pubtopic'], deviceD[device]['encode'])
+
+msg_backlog = 0     # Packets received but not processed yet (estimate from the last drain)
+
+def checkmsgs():
+    global msg_backlog
+    with prof.section('check_msg'):
+        processed, msg_backlog = mqtt_conn.drain(msg_max_pkts, msg_budget_us)  # Also reconnects (with backoff) while the broker is unreachable
+
+def updateServo():
+    global servoID
+    servoID = mqtt_servoID                             # Servo commands coming from mqtt but could change it to a difference source
+    deviceD['servoDuty'][servoID] = mqtt_servo_duty
+    servo[servoID].duty(deviceD['servoDuty'][servoID]) # Send new servo duty value to servo
+
+def pollDevices():
+    if msg_backlog:     # A burst of commands is still queued, keep draining every poll instead of every on_msg period
+        checkmsgs()
+    with prof.section('servo'):
+        updateServo()
+    with prof.section('rotenc'):
+        for device, rotenc in rotaryEncoderSet.items():
+            deviceD[device]['data'] = rotenc.getdata()
+            if deviceD[device]['data'] is not None:
+                main_logger.debug("Got data %s %s", deviceD[device]['pubtopic'], deviceD[device]['data'])
+                pubqueue.put(deviceD[device]['pubtopic'], deviceD[device]['data'], device)  # Newest value wins until the next send window
+
+def getData():
+    with prof.section('adc'):
+        pass
+        #for device, adc in adcSet.items():
+        #    deviceD[device]['data'] = adc.getdata()
+        #    if buttonADC_pressed or deviceD[device]['data'] is not None:         # Update if button pressed or voltage changed or time limit hit
+        #        if deviceD[device]['data'] is not None:
+        #            main_logger.debug("Got data %s %s", deviceD[device]['pubtopic'], deviceD[device]['data'])
+        #        if switchON: deviceD[device]['data']['buttoni'] = str(buttonADC.value())
+        #        buttonADC_pressed = False
+        #        pubqueue.put(deviceD[device]['pubtopic'], deviceD[device]['data'], device)
+    if outbox.pending() and mqtt_conn.connected:
+        with prof.section('outbox'):
+            try:
+                outbox.drain(mqtt_conn, 10)   # Backlog from a broker outage, 10 msgs per window at most
+            except OSError:
+                pass                          # Link dropped again. mqtt_conn reconnects, the drain resumes after
+    sendMsgs()
+
+def sendMsgs():
+    with prof.section('publish'):
+        pubqueue.flush()   # One publish per updated device (or one combined publish) per send window
+
+async def async_connect(aclient, backoff_ms=500, backoff_max_ms=4000):
+    # No MQTTConnection on this path and connect_wifi doesn't wait for the join: wait for the station,
+    # then connect and subscribe, retrying on a doubling backoff until it works
+    delay = backoff_ms
+    while True:
+        if station.isconnected():
+            try:
+                await asyncio.wait_for(aclient.connect(), 5)
+                for topics in MQTT_SUB_TOPIC:
+                    await aclient.subscribe(topics)
+                return
+            except (OSError, EOFError, MQTTAsyncException, AssertionError, asyncio.TimeoutError) as e:  # EOFError covers IncompleteReadError
+                aclient.close()        # Connected but the subscribe failed: don't leave the socket half open
+                main_logger.debug('Async connect failed (%s), retry in %d ms', e, delay)
+        await asyncio.sleep_ms(delay)
+        delay = min(delay * 2, backoff_max_ms)
+
+async def asyncMain():
+    # Same devices as the scheduler loop but each one is its own coroutine and the MQTT client never blocks.
+    # A dropped broker connection cancels the device tasks and goes back to async_connect (with its backoff)
+    aclient = MQTTClientAsync(MQTT_CLIENT_ID, MQTT_SERVER, user=MQTT_USER, password=MQTT_PASSWORD)
+    aclient.set_callback(mqtt_on_message)
+    t0 = utime.ticks_ms()
+    while True:
+        await async_connect(aclient)
+        tasks = [asyncio.create_task(aclient.run()), asyncio.create_task(asyncdevices.poll(updateServo, poll_timer_ms))]
+        for device, rotenc in rotaryEncoderSet.items():
+            tasks.append(asyncio.create_task(asyncdevices.poll(rotenc.getdata, poll_timer_ms, asyncdevices.publisher(aclient, deviceD[device]['pubtopic'], deviceD[device]['encode']))))
+        #for device, adc in adcSet.items():
+        #    tasks.append(asyncio.create_task(asyncdevices.poll(adc.getdata, getdata_sndmsg_timer_ms, asyncdevices.publisher(aclient, deviceD[device]['pubtopic'], deviceD[device]['encode']))))
+        try:
+            if loop_runtime_ms is None:
+                await tasks[0]         # Receive loop only ends by raising, when the broker connection drops
+            else:
+                left_ms = max(0, loop_runtime_ms - utime.ticks_diff(utime.ticks_ms(), t0))
+                await asyncio.wait_for(tasks[0], left_ms / 1000)
+        except asyncio.TimeoutError:   # loop_runtime_ms is up
+            for task in tasks:
+                task.cancel()
+            await aclient.disconnect()
+            return
+        except (OSError, EOFError) as e:
+            main_logger.warning('Async MQTT connection lost (%s). Reconnecting', e)
+        for task in tasks[1:]:
+            task.cancel()
+        aclient.close()
+
+if RUNTIME == 'async':
+    mqtt_conn.disconnect()         # Async client connects with the same client id
+    asyncio.run(asyncMain())
+else:
+    # Scheduler sleeps until the next deadline and runs due tasks, highest priority first
+    sched = Scheduler(main_logger, prof)  # Each task is a prof root section, the phases below nest under it
+    sched.add('poll', pollDevices, poll_timer_ms, 0, priority=2)
+    sched.add('check_msg', checkmsgs, on_msg_timer_ms, 0, priority=1)
+    sched.add('getdata', getData, getdata_sndmsg_timer_ms, stagger_ms, priority=0)
+    sched.run(loop_runtime_ms)     # Broker outages are handled inside mqtt_conn, the loop never stops for them
+    sched.report()  # Runs, jitter and overruns per task
+    mqtt_conn.report()
+    pubqueue.report()
+    outbox.sync()   # Anything still queued in RAM goes to flash and is sent after the next connect
+    prof.tree()     # Flame-style breakdown: us/iteration and share of each task's time for each phase
 
 @TimerFunc
 def integer(n):
@@ -383,13 +461,17 @@ main_logger.debug(data)
 adcvalue = getADC(adc)
 
 setPWM(pwm)
+timer.report()   # count/mean/min/max/p50/p95/p99 for every @TimerFunc function
 
 main_logger.info('Log file clean up')
+ulogging.flush()   # Write out any records still buffered in RAM before reading the files back
 ftotal = 0
 for file in logfiles:
     filesize = uos.stat(file)[6]/1000
     main_logger.info('file:{0} size: {1:.1f}kb '.format(file, filesize))
     ftotal += filesize
+    if LOG_BINARY:   # Binary records are not readable here. Copy the file over and run host/logdecode.py
+        continue
     with open(file, 'r') as f:
         main_logger.info('{0} line 1: {1}'.format(file, f.readline().rstrip("\n")))
         main_logger.info('           line 2: {0}'.format(f.readline().rstrip("\n")))